@@ -0,0 +1,332 @@
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.pool import Pool
+from typing import Dict, Iterable, List, Tuple
+
+import hyperscan
+
+import file_scanner_pool
+from engines.ac_engine import AhoCorasickEngine
+from engines.base_engine import RegexEngine
+from engines.hs_engine import HyperscanEngine
+from engines.python_engine import PythonEngine
+from file_scanner import FileScanner
+from file_scanner_pool import FileScannerPool
+from match_sink import NullSink
+
+MIB = 1024 * 1024
+
+
+def _scan_timed(task: Tuple[str, int]) -> Tuple[float, int]:
+    """Pool task: scans one file with the worker's FileScanner, returns (seconds, number of matches)"""
+    path, chunk_size = task
+    scanner = file_scanner_pool._worker_scanner
+    start = time.perf_counter()
+    matches = len(scanner.scan_file(path, chunk_size=chunk_size or None, full_file=not chunk_size))
+    return time.perf_counter() - start, matches
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of `values` (0 for no values)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class BenchmarkSuite:
+    """
+    Reproducible scan benchmarks over a sweep of parameters.
+
+    Every combination of pattern count, corpus size, match density, chunk
+    size, engine and execution mode is one case. The corpus is generated
+    from `seed` (files of different sizes with words, a `match_density`
+    fraction of them pattern words), the patterns are words, half of them
+    plain literals and half `\\bword\\b`. Patterns are compiled once per
+    engine and pattern count, outside the measurement.
+
+    A case scans the whole corpus `repeats` times with FileScanner and a
+    NullSink: "serial" in this thread, "threads" with one cloned engine per
+    thread (as FileScannerThreads, engines with `clone_for_thread` only),
+    "pool" in worker processes set up by FileScannerPool._init_worker.
+    Throughput (MB/s) is taken from the fastest pass, the p50/p99 latency
+    per file from the scan times of every file in all passes. Chunk size 0
+    reads every file whole and scans it in block mode.
+
+    Results are plain dictionaries, saved as JSON together with the
+    environment they were measured in; `compare` checks them against a
+    baseline saved the same way.
+    """
+    ENGINES = ("hyperscan", "python", "aho-corasick")
+    MODES = ("serial", "threads", "pool")
+    METRICS = ("throughput_mb_s", "p50_ms", "p99_ms")
+    # latency of a file can grow by this much on scheduler noise alone, so
+    # smaller increases are never regressions, whatever their percentage
+    MIN_LATENCY_MS = 5.0
+    CASE_KEYS = ("pattern_count", "corpus_mb", "match_density", "chunk_size", "engine", "mode")
+
+    def __init__(self, pattern_counts: Iterable[int] = (10, 100), corpus_sizes: Iterable[float] = (4,),
+                 match_densities: Iterable[float] = (0.001, 0.05),
+                 chunk_sizes: Iterable[int] = (64 * 1024, MIB), engines: Iterable[str] = ("hyperscan", "python"),
+                 modes: Iterable[str] = MODES, files: int = 16, workers: int = None, repeats: int = 3,
+                 seed: int = 1):
+        """
+        Args:
+            pattern_counts: numbers of patterns to compile
+            corpus_sizes: total sizes of the generated corpus in MiB
+            match_densities: fractions of the corpus words that match a pattern
+            chunk_sizes: chunk sizes of streamed scans in bytes, 0 scans
+                every file whole in block mode
+            engines: names from ENGINES
+            modes: names from MODES
+            files: number of files of every corpus
+            workers: threads or processes of the "threads" and "pool"
+                modes (default: os.cpu_count())
+            repeats: passes over the corpus per case
+            seed: seed of the generated patterns and corpora
+        """
+        for name in engines:
+            if name not in BenchmarkSuite.ENGINES:
+                raise ValueError(f"Unknown engine '{name}', expected one of {BenchmarkSuite.ENGINES}")
+        for name in modes:
+            if name not in BenchmarkSuite.MODES:
+                raise ValueError(f"Unknown mode '{name}', expected one of {BenchmarkSuite.MODES}")
+        self.pattern_counts = list(pattern_counts)
+        self.corpus_sizes = list(corpus_sizes)
+        self.match_densities = list(match_densities)
+        self.chunk_sizes = list(chunk_sizes)
+        self.engines = list(engines)
+        self.modes = list(modes)
+        self.files = files
+        self.workers = workers or os.cpu_count() or 1
+        self.repeats = max(repeats, 1)
+        self.seed = seed
+
+    @staticmethod
+    def make_engine(name: str) -> RegexEngine:
+        if name == "python":
+            return PythonEngine()
+        if name == "aho-corasick":
+            return AhoCorasickEngine(PythonEngine())
+        return HyperscanEngine(modes=("stream", "block"))
+
+    def pattern_words(self, count: int) -> List[str]:
+        """`count` distinct words of 6 to 10 letters, the same for the same seed"""
+        rng = random.Random(f"{self.seed}-patterns")
+        words = []
+        seen = set()
+        while len(words) < count:
+            word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 10)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    @staticmethod
+    def patterns(words: List[str]) -> List[bytes]:
+        return [(word if number % 2 == 0 else rf"\b{word}\b").encode() for number, word in enumerate(words)]
+
+    def generate_corpus(self, directory: str, words: List[str], size: int, density: float) -> List[str]:
+        """
+        Writes `self.files` text files of `size` bytes in total to `directory`.
+
+        File sizes vary from a quarter to 1.75 times the mean, so the
+        latency percentiles are not those of identical files.
+        """
+        rng = random.Random(f"{self.seed}-{len(words)}-{size}-{density}")
+        pattern_set = set(words)
+        filler = []
+        while len(filler) < 2000:
+            word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+            if word not in pattern_set:
+                filler.append(word)
+
+        weights = [rng.uniform(0.25, 1.75) for _ in range(self.files)]
+        paths = []
+        os.makedirs(directory, exist_ok=True)
+        for number, weight in enumerate(weights):
+            target = int(size * weight / sum(weights))
+            lines = []
+            written = 0
+            while written < target:
+                line = " ".join(rng.choice(words) if rng.random() < density else rng.choice(filler)
+                                for _ in range(12))
+                lines.append(line)
+                written += len(line) + 1
+            path = os.path.join(directory, f"file-{number:03d}.txt")
+            with open(path, "w", encoding="ascii") as f:
+                f.write("\n".join(lines) + "\n")
+            paths.append(path)
+        return paths
+
+    def run(self, progress=print) -> List[Dict]:
+        """Runs every case, `progress` is called with a line per finished case"""
+        results = []
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as root:
+            corpora = {}
+            for count, engine_name in itertools.product(self.pattern_counts, self.engines):
+                words = self.pattern_words(count)
+                engine = self.make_engine(engine_name)
+                engine.compile_patterns(self.patterns(words))
+                modes = self.modes
+                if "threads" in modes and not hasattr(engine, "clone_for_thread"):
+                    progress(f"{engine_name} engine has no clone_for_thread, skipping the threads mode")
+                    modes = [mode for mode in modes if mode != "threads"]
+                pool = None
+                try:
+                    for size_mb, density in itertools.product(self.corpus_sizes, self.match_densities):
+                        key = (count, size_mb, density)
+                        if key not in corpora:
+                            corpora[key] = self.generate_corpus(
+                                os.path.join(root, f"{count}-{size_mb}-{density}"), words,
+                                int(size_mb * MIB), density)
+                        paths = corpora[key]
+                        for chunk_size, mode in itertools.product(self.chunk_sizes, modes):
+                            if mode == "pool" and pool is None:
+                                pool = self._pool(engine)
+                            result = self.measure(engine, paths, chunk_size, mode, pool)
+                            result.update(pattern_count=count, corpus_mb=size_mb, match_density=density,
+                                          chunk_size=chunk_size, engine=engine_name, mode=mode)
+                            results.append(result)
+                            progress(self.format(result))
+                finally:
+                    if pool is not None:
+                        pool.terminate()
+                        pool.join()
+        return results
+
+    def _pool(self, engine: RegexEngine) -> Pool:
+        serialized_db = engine.dumpb() if hasattr(engine, "dumpb") else None
+        initargs = (type(engine), serialized_db, engine.patterns, None, engine.ids, engine.flags,
+                    engine.constructor_options())
+        return Pool(self.workers, initializer=FileScannerPool._init_worker, initargs=initargs)
+
+    def measure(self, engine: RegexEngine, paths: List[str], chunk_size: int, mode: str,
+                pool: Pool = None) -> Dict:
+        """Scans `paths` `repeats` times in one mode, returns the measured metrics"""
+        # largest first, as FileScannerPool and FileScannerThreads schedule them
+        paths = sorted(paths, key=os.path.getsize, reverse=True)
+        total = sum(os.path.getsize(path) for path in paths)
+        latencies = []
+        passes = []
+        matches = 0
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            if mode == "serial":
+                scanner = FileScanner(engine, sink=NullSink())
+                timed = [self._scan(scanner, path, chunk_size) for path in paths]
+            elif mode == "threads":
+                local = threading.local()
+
+                def scan(path):
+                    if not hasattr(local, "scanner"):
+                        local.scanner = FileScanner(engine.clone_for_thread(), sink=NullSink())
+                    return self._scan(local.scanner, path, chunk_size)
+
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="benchmark") as threads:
+                    timed = list(threads.map(scan, paths))
+            else:
+                timed = pool.map(_scan_timed, [(path, chunk_size) for path in paths], chunksize=1)
+            passes.append(time.perf_counter() - start)
+            latencies.extend(seconds for seconds, _ in timed)
+            matches = sum(count for _, count in timed)
+
+        fastest = min(passes)
+        return {
+            "files": len(paths),
+            "bytes": total,
+            "matches": matches,
+            "seconds": fastest,
+            "throughput_mb_s": total / MIB / fastest if fastest > 0 else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+
+    @staticmethod
+    def _scan(scanner: FileScanner, path: str, chunk_size: int) -> Tuple[float, int]:
+        start = time.perf_counter()
+        matches = len(scanner.scan_file(path, chunk_size=chunk_size or None, full_file=not chunk_size))
+        return time.perf_counter() - start, matches
+
+    @staticmethod
+    def case(result: Dict) -> Tuple:
+        return tuple(result[key] for key in BenchmarkSuite.CASE_KEYS)
+
+    @staticmethod
+    def format(result: Dict) -> str:
+        chunk = f"{result['chunk_size']} B" if result["chunk_size"] else "block"
+        return (f"{result['engine']:>12} {result['mode']:>7}  patterns: {result['pattern_count']:>5}  "
+                f"corpus: {result['corpus_mb']} MiB  density: {result['match_density']}  chunk: {chunk:>9}  "
+                f"{result['throughput_mb_s']:9.1f} MB/s  p50: {result['p50_ms']:8.2f} ms  "
+                f"p99: {result['p99_ms']:8.2f} ms  matches: {result['matches']}")
+
+    @staticmethod
+    def environment() -> Dict:
+        """What the results depend on besides the code: machine, Python and hyperscan"""
+        return {
+            "python": platform.python_version(),
+            "hyperscan": getattr(hyperscan, "__version__", "unknown"),
+            "platform": sys.platform,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        }
+
+    @staticmethod
+    def save(results: List[Dict], path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"environment": BenchmarkSuite.environment(), "results": results}, f, indent=2)
+
+    @staticmethod
+    def load(path: str) -> Dict:
+        """Reads results saved by `save`, {"environment": ..., "results": [...]}"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or "results" not in data:
+            raise ValueError(f"'{path}' is not a benchmark results file")
+        return data
+
+    @staticmethod
+    def compare(results: List[Dict], baseline: List[Dict], max_regression: float = 10.0,
+                metrics: Iterable[str] = METRICS, min_latency_ms: float = MIN_LATENCY_MS,
+                modes: Iterable[str] = MODES) -> List[str]:
+        """
+        Cases that got worse than the baseline by more than `max_regression`
+        percent: lower throughput or higher latency. Latency must also grow
+        by more than `min_latency_ms`, sub-millisecond latencies only vary
+        with the scheduler. A different number of matches (the corpus is the
+        same for the same seed) is always reported, the timings only for
+        cases of `modes`. Cases missing from the baseline are not compared.
+
+        Returns:
+            One line per regressed metric, empty if nothing regressed.
+        """
+        previous = {BenchmarkSuite.case(result): result for result in baseline}
+        regressions = []
+        for result in results:
+            base = previous.get(BenchmarkSuite.case(result))
+            if base is None:
+                continue
+            case = ", ".join(f"{key}={result[key]}" for key in BenchmarkSuite.CASE_KEYS)
+            if base["matches"] != result["matches"]:
+                regressions.append(f"{case}: matches {base['matches']} -> {result['matches']}")
+            for metric in metrics if result["mode"] in modes else ():
+                old, new = base[metric], result[metric]
+                if not old:
+                    continue
+                change = (new - old) / old * 100
+                worse = -change if metric == "throughput_mb_s" else change
+                if metric != "throughput_mb_s" and new - old <= min_latency_ms:
+                    continue
+                if worse > max_regression:
+                    regressions.append(f"{case}: {metric} {old:.2f} -> {new:.2f} ({change:+.1f}%)")
+        return regressions
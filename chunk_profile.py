@@ -0,0 +1,113 @@
+import json
+import os
+import time
+from typing import Dict, List
+
+from engines.base_engine import RegexEngine
+from file_reader import FileReader
+
+
+class ChunkProfile:
+    """
+    Chunk sizes measured by `main.py calibrate`, stored per engine.
+
+    The profile is a small JSON file. For every engine class it holds the
+    chunk size with the best measured throughput and the throughput of all
+    sizes that were tried.
+    """
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nokia_project", "chunk_profile.json")
+    CANDIDATE_SIZES = [4096 * 4 ** i for i in range(7)]  # 4 KiB ... 16 MiB
+
+    def __init__(self, path: str = None):
+        """
+        Args:
+            path (str, optional):
+                Location of the profile file (default `ChunkProfile.DEFAULT_PATH`).
+        """
+        self.path = path or ChunkProfile.DEFAULT_PATH
+        self.engines: Dict[str, Dict] = {}
+
+    @staticmethod
+    def load(path: str = None) -> "ChunkProfile":
+        """Reads a profile, a missing or unreadable file gives an empty profile."""
+        profile = ChunkProfile(path)
+        try:
+            with open(profile.path, "r", encoding="utf-8") as f:
+                profile.engines = json.load(f)
+        except (OSError, ValueError):
+            profile.engines = {}
+        return profile
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.engines, f, indent=2)
+
+    def best_chunk_size(self, engine: RegexEngine) -> int:
+        """Calibrated chunk size for the engine, or FileReader.CHUNK_SIZE if it was never calibrated."""
+        entry = self.engines.get(type(engine).__name__)
+        return entry["chunk_size"] if entry else FileReader.CHUNK_SIZE
+
+    def chunk_size_for(self, engine: RegexEngine, file_size: int) -> int:
+        """
+        Chunk size for scanning a file of `file_size` bytes.
+
+        Files smaller than the calibrated chunk size are read in a single
+        chunk, so small files do not pay for a large buffer.
+        """
+        return max(min(self.best_chunk_size(engine), file_size), 1)
+
+    def calibrate(self, engine: RegexEngine, sample_path: str, sizes: List[int] = None,
+                  repeats: int = 3) -> int:
+        """
+        Measures scan throughput of `engine` on `sample_path` for each chunk size.
+
+        The sample should live on the storage that is going to be scanned.
+        Every size is scanned `repeats` times and the fastest run counts.
+        Before every run the sample is dropped from the page cache where the
+        platform allows it, so each run reads from the storage and not from
+        memory filled by the previous run.
+        The best size is stored in the profile (call `save()` to persist it).
+
+        Returns:
+            the chunk size with the highest throughput
+        """
+        FileReader.validate(sample_path)
+        file_size = os.path.getsize(sample_path)
+        if not file_size:
+            raise ValueError(f"{sample_path} is empty")
+
+        def null_callback(pattern_id, start, end, flags, context):
+            pass
+
+        throughput = {}
+        for chunk_size in sizes or ChunkProfile.CANDIDATE_SIZES:
+            best = None
+            for _ in range(repeats):
+                ChunkProfile._drop_page_cache(sample_path)
+                t0 = time.perf_counter()
+                engine.scan_stream(FileReader.chunks(sample_path, chunk_size=chunk_size), null_callback)
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            throughput[str(chunk_size)] = file_size / max(best, 1e-9) / (1024 * 1024)
+
+        best_size = int(max(throughput, key=throughput.get))
+        self.engines[type(engine).__name__] = {
+            "chunk_size": best_size,
+            "sample_size": file_size,
+            "throughput_mb_s": throughput,
+        }
+        return best_size
+
+    @staticmethod
+    def _drop_page_cache(path: str) -> None:
+        """Asks the kernel to evict the cached pages of `path` (POSIX only, best effort)."""
+        if not hasattr(os, "posix_fadvise"):
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,118 @@
+from collections import deque
+from typing import BinaryIO, Iterable
+
+
+class ChunkWindow:
+    """
+    Bounded ring buffer of the most recently read chunks of a single file.
+
+    Chunks pass through `track()` on their way to the regex engine, so by the
+    time a match callback fires, the bytes of the match are usually still in
+    memory and can be sliced out without touching the disk. Matches that
+    start before the retained window are read through one file handle that is
+    opened lazily and reused until the window is closed.
+    """
+    DEFAULT_WINDOW_SIZE = 1024 * 1024
+
+    def __init__(self, filename: str, window_size: int = None, offset: int = 0):
+        """
+        Args:
+            filename (str):
+                Path of the file whose chunks are retained, or None for
+                data that cannot be read again (e.g. decompressed); matches
+                starting before the window are then cut to the window.
+            window_size (int, optional):
+                Minimum number of most recent bytes kept in memory. If not
+                provided, `ChunkWindow.DEFAULT_WINDOW_SIZE` is used.
+            offset (int, optional):
+                File offset of the first chunk passed to `append()` (default: 0).
+        """
+        self.filename = filename
+        self.window_size = window_size or ChunkWindow.DEFAULT_WINDOW_SIZE
+        self._chunks = deque()  # (global offset, chunk) pairs, oldest first
+        self._start = offset
+        self._end = offset
+        self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def track(self, chunks: Iterable[bytes]) -> Iterable[bytes]:
+        """Retain every chunk from `chunks` and pass it on.
+
+        A chunk in a buffer the reader reuses is passed on as the copy that
+        is retained, so the engine does not copy it a second time.
+        """
+        for chunk in chunks:
+            yield self.append(chunk)
+
+    def append(self, chunk):
+        """Add the next chunk of the file and evict chunks that fell out of the window.
+
+        Returns the retained chunk: a copy of a writable memoryview, the
+        chunk itself otherwise.
+        """
+        if not chunk:
+            return chunk
+        if isinstance(chunk, memoryview) and not chunk.readonly:
+            # writable views belong to buffers the reader is going to reuse
+            chunk = bytes(chunk)
+
+        self._chunks.append((self._end, chunk))
+        self._end += len(chunk)
+
+        while len(self._chunks) > 1 and self._end - self._chunks[1][0] >= self.window_size:
+            self._chunks.popleft()
+        self._start = self._chunks[0][0]
+        return chunk
+
+    def read(self, start: int, end: int) -> bytes:
+        """
+        Return bytes `[start, end)` of the file.
+
+        The bytes are sliced from the retained chunks when possible; otherwise
+        they are read through the pooled file handle.
+        """
+        if end <= start:
+            return b""
+        if self._start <= start and end <= self._end:
+            return self._slice(start, end)
+        if self.filename is None:
+            start, end = max(start, self._start), min(end, self._end)
+            return self._slice(start, end) if start < end else b""
+        return self._read_from_file(start, end)
+
+    def close(self) -> None:
+        """Drop retained chunks and close the pooled file handle, if it was opened."""
+        self._chunks.clear()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _slice(self, start: int, end: int) -> bytes:
+        # matches are reported close to the read position, so search from the newest chunk
+        parts = []
+        for offset, chunk in reversed(self._chunks):
+            chunk_end = offset + len(chunk)
+            if chunk_end <= start:
+                break
+            if offset >= end:
+                continue
+            parts.append(chunk[max(start - offset, 0):min(end - offset, len(chunk))])
+
+        if len(parts) == 1:
+            return bytes(parts[0])
+        return b"".join(reversed(parts))
+
+    def _read_from_file(self, start: int, end: int) -> bytes:
+        handle = self._get_handle()
+        handle.seek(start)
+        return handle.read(end - start)
+
+    def _get_handle(self) -> BinaryIO:
+        if self._handle is None:
+            self._handle = open(self.filename, "rb")
+        return self._handle
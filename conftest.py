@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from chunk_profile import ChunkProfile
+from engines.db_cache import DatabaseCache
+from scan_index import ScanIndex
+
+
+@pytest.fixture(autouse=True)
+def isolated_home(tmp_path_factory, monkeypatch):
+    """Keeps the database cache, chunk profile and scan index of every test (and CLI subprocess) out of $HOME."""
+    home = tmp_path_factory.mktemp("home")
+    monkeypatch.setenv("HOME", str(home))
+    cache = os.path.join(str(home), ".cache", "nokia_project")
+    monkeypatch.setattr(DatabaseCache, "DEFAULT_DIR", os.path.join(cache, "hsdb"))
+    monkeypatch.setattr(ChunkProfile, "DEFAULT_PATH", os.path.join(cache, "chunk_profile.json"))
+    monkeypatch.setattr(ScanIndex, "DEFAULT_PATH", os.path.join(cache, "scan_index.json"))
+    return home
@@ -0,0 +1,216 @@
+import re
+from array import array
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import pattern_flags
+from .base_engine import RegexEngine
+from .literal_set import expand_literals
+from .python_engine import PythonEngine
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton for a set of byte strings, stored in flat arrays.
+
+    `table[state * 256 + byte]` is the next state, with the failure links
+    already folded in, so matching is one array lookup per byte. The
+    strings ending in a state are
+    `outputs[output_offsets[state]:output_offsets[state + 1]]`.
+    """
+
+    def __init__(self, strings: List[bytes]):
+        children = [{}]
+        own = [[]]
+        for index, s in enumerate(strings):
+            state = 0
+            for byte in s:
+                if byte not in children[state]:
+                    children[state][byte] = len(children)
+                    children.append({})
+                    own.append([])
+                state = children[state][byte]
+            own[state].append(index)
+
+        count = len(children)
+        table = array('l', [0]) * (count * 256)
+        fail = [0] * count
+        found = [None] * count
+        found[0] = own[0]
+        order = deque()
+        for byte, child in children[0].items():
+            table[byte] = child
+            order.append(child)
+        while order:
+            state = order.popleft()
+            found[state] = own[state] + found[fail[state]]
+            row = state * 256
+            fail_row = fail[state] * 256
+            table[row:row + 256] = table[fail_row:fail_row + 256]
+            for byte, child in children[state].items():
+                fail[child] = table[fail_row + byte]
+                table[row + byte] = child
+                order.append(child)
+
+        self.table = table
+        self.output_offsets = array('l', [0])
+        self.outputs = array('l')
+        for state_outputs in found:
+            self.outputs.extend(state_outputs)
+            self.output_offsets.append(len(self.outputs))
+        self.lengths = array('l', [len(s) for s in strings])
+        # positions where the automaton can leave the root state
+        self._leave_root = re.compile(b'[' + b''.join(re.escape(bytes((byte,))) for byte in children[0]) + b']')
+
+    def feed(self, data, state: int, offset: int, emit: Callable[[int, int, int], bool]) -> Optional[int]:
+        """
+        Runs the automaton over `data` starting in `state` and calls
+        `emit(string_index, start, end)` for every occurrence, with
+        offsets shifted by `offset`. Returns the state after `data`,
+        to be passed in with the next chunk of the same stream, or None
+        if `emit` returned True to stop.
+        """
+        table = self.table
+        output_offsets = self.output_offsets
+        outputs = self.outputs
+        lengths = self.lengths
+        leave_root = self._leave_root.search
+        size = len(data)
+        pos = 0
+        while pos < size:
+            if state == 0:
+                # skip bytes that cannot start any string
+                m = leave_root(data, pos)
+                if m is None:
+                    break
+                pos = m.start()
+            state = table[(state << 8) | data[pos]]
+            pos += 1
+            first, last = output_offsets[state], output_offsets[state + 1]
+            if first != last:
+                end = offset + pos
+                for k in range(first, last):
+                    index = outputs[k]
+                    if emit(index, end - lengths[index], end):
+                        return None
+        return state
+
+
+class AhoCorasickEngine(RegexEngine):
+    """
+    Matches plain literal patterns (`hello`, `ERROR`, `a\\.b`) with an
+    Aho-Corasick automaton and passes every other pattern to an inner engine.
+    """
+
+    def __init__(self, inner: RegexEngine = None):
+        """
+        Args:
+            inner (RegexEngine, optional):
+                Engine for the patterns that are not plain literals
+                (default: PythonEngine).
+        """
+        self.inner = inner if inner is not None else PythonEngine()
+        self.patterns = []
+        self.ids = []
+        self.flags = []
+        self.automaton = None
+        self.literal_ids = []
+        self.single_match_ids = set()
+        self.inner_patterns = []
+
+    def constructor_options(self) -> Dict[str, Any]:
+        # a new inner engine, the compiled one stays with this engine
+        return {"inner": type(self.inner)(**self.inner.constructor_options())}
+
+    def compile_patterns(self, patterns: List[bytes], ids: List[int] = None, flags: List[int] = None) -> None:
+        self.patterns = patterns
+        if ids is None:
+            ids = list(range(len(patterns)))
+        if flags is None:
+            flags = [0] * len(patterns)
+        self.ids, self.flags = ids, flags
+
+        literals = []
+        self.literal_ids = []
+        self.single_match_ids = set()
+        self.inner_patterns = []
+        inner_ids = []
+        inner_flags = []
+        for pattern_id, pattern, flag in zip(ids, patterns, flags):
+            # caseless, dotall and multiline patterns are left to the inner engine
+            strings = expand_literals(pattern_flags.python_pattern(pattern, flag))
+            if strings is not None and len(strings) == 1:
+                literals.append(strings[0])
+                self.literal_ids.append(pattern_id)
+                if flag & pattern_flags.SINGLEMATCH:
+                    self.single_match_ids.add(pattern_id)
+            else:
+                self.inner_patterns.append(pattern)
+                inner_ids.append(pattern_id)
+                inner_flags.append(flag)
+
+        self.automaton = AhoCorasick(literals) if literals else None
+        if self.inner_patterns:
+            self.inner.compile_patterns(self.inner_patterns, inner_ids, inner_flags)
+
+    @staticmethod
+    def _stoppable(callback: Callable) -> Callable:
+        """Wraps a callback so that nothing is reported after it returned True,
+        by the automaton or by the inner engine"""
+        stopped = False
+
+        def stoppable(*args):
+            nonlocal stopped
+            if not stopped:
+                stopped = bool(callback(*args))
+            return stopped
+        return stoppable
+
+    def _emitter(self, callback: Callable, context: Any) -> Callable[[int, int, int], bool]:
+        literal_ids = self.literal_ids
+        if self.single_match_ids:
+            callback = pattern_flags.single_match(callback, self.single_match_ids)
+
+        def emit(index, start, end):
+            return callback(literal_ids[index], start, end, 0, context)  # flags = 0
+        return emit
+
+    def scan(self, data: bytes, callback: Callable, context: Any = None) -> None:
+        if self.automaton is None and not self.inner_patterns:
+            raise RuntimeError('Patterns Database is not compiled')
+
+        callback = AhoCorasickEngine._stoppable(callback)
+        if self.automaton is not None:
+            if self.automaton.feed(data, 0, 0, self._emitter(callback, context)) is None:
+                return
+        if self.inner_patterns:
+            self.inner.scan(data, callback, context)
+
+    def scan_stream(self, data_chunks: Iterable[bytes], callback: Callable, context: Any = None) -> None:
+        """
+        Streams the chunks through the automaton, keeping only its state
+        between chunks, and through the inner engine in the same pass.
+        """
+        if self.automaton is None and not self.inner_patterns:
+            raise RuntimeError('Patterns Database is not compiled')
+
+        callback = AhoCorasickEngine._stoppable(callback)
+        if self.automaton is not None:
+            data_chunks = self._feed_chunks(data_chunks, self._emitter(callback, context))
+        if self.inner_patterns:
+            self.inner.scan_stream(data_chunks, callback, context)
+        else:
+            for _ in data_chunks:
+                pass
+
+    def _feed_chunks(self, data_chunks: Iterable[bytes], emit: Callable) -> Iterable[bytes]:
+        """Runs the automaton over every chunk before handing it on."""
+        state = 0
+        offset = 0
+        for chunk in data_chunks:
+            state = self.automaton.feed(chunk, state, offset, emit)
+            if state is None:
+                # stopped by the callback, the inner engine sees the end of the data
+                return
+            offset += len(chunk)
+            yield chunk
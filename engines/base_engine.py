@@ -1,17 +1,66 @@
+import queue
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Callable, Any, Iterable
+from typing import List, Callable, Any, Dict, Generator, Iterable, Optional, Tuple
+
+from .pattern_width import split_context
+
+
+class EngineStream:
+    """
+    A stream that stays open between calls, for data that arrives over
+    time (see `RegexEngine.open_stream`). Matches are reported with
+    offsets from the start of the stream.
+    """
+
+    def __init__(self, scanner: Generator):
+        """
+        Args:
+            scanner: Generator that receives the chunks through send(),
+                None ends the data. It yields True once a callback stopped
+                the scan.
+        """
+        self._scanner = scanner
+        next(scanner)
+
+    def scan(self, chunk) -> bool:
+        """Scans the next chunk of the stream
+
+        Returns True once a callback stopped the scan, later chunks are ignored.
+        """
+        return self._scanner.send(chunk)
+
+    def close(self) -> None:
+        """Ends the data, matches that need the end of the data are reported now"""
+        try:
+            self._scanner.send(None)
+        except StopIteration:
+            pass
 
 
 class RegexEngine(ABC):
-    """Abstract base class for regex engines"""
-    
+    """Abstract base class for regex engines
+
+    Callbacks are called as `callback(pattern_id, start, end, flags, context)`.
+    A callback returning True stops the scan (in scan_batch, the scan of
+    that buffer), like Hyperscan's terminate signal; the scan then returns
+    normally and no more matches are reported.
+    """
+    # whether the engine copies memoryview data to bytes before scanning it,
+    # so reading a whole file into a memory mapping saves no memory
+    COPIES_BUFFERS = False
+
     @abstractmethod
-    def compile_patterns(self, patterns: List[bytes], ids: List[int] = None) -> None:
-        """Compiles regex patterns"""
+    def compile_patterns(self, patterns: List[bytes], ids: List[int] = None, flags: List[int] = None) -> None:
+        """Compiles regex patterns
+
+        `flags` holds one combination of the `engines.pattern_flags` values
+        per pattern (caseless, single-match, ...), default 0 for all.
+        """
         pass
     
     @abstractmethod
-    def scan(self, data: bytes, callback: Callable) -> None:
+    def scan(self, data: bytes, callback: Callable, context: Any = None) -> None:
         """Scans data and triggers a callback when a match is found"""
         pass
     
@@ -19,3 +68,60 @@ class RegexEngine(ABC):
     def scan_stream(self, data_chunks: Iterable[bytes], callback: Callable, context: Any = None) -> None:
         """Scans data in streaming mode - accepts iterable chunks of data"""
         pass
+
+    def split_context(self) -> Optional[Tuple[int, int]]:
+        """(overlap, lookahead) for scanning files in byte ranges, None if they
+        are unknown (see engines.pattern_width.split_context)"""
+        return split_context(getattr(self, "patterns", []))
+
+    def constructor_options(self) -> Dict[str, Any]:
+        """Keyword arguments that create a new, uncompiled engine configured like
+        this one, e.g. in the worker processes of FileScannerPool"""
+        return {}
+
+    def scan_batch(self, buffers: List[bytes], callback: Callable, contexts: List[Any]) -> None:
+        """Scans many small, independent buffers (e.g. whole small files).
+
+        Matches are reported with offsets local to their buffer and with the
+        buffer's entry from `contexts` as the callback context.
+        """
+        for data, context in zip(buffers, contexts):
+            self.scan_stream([data], callback, context=context)
+
+    def open_stream(self, callback: Callable, context: Any = None) -> EngineStream:
+        """Opens a stream that data is pushed into as it arrives, e.g. a growing log file.
+
+        This default runs scan_stream in a helper thread fed through a
+        queue, so matches are reported from that thread. Engines that can
+        keep their stream state between calls override it.
+        """
+        return EngineStream(self._threaded_stream(callback, context))
+
+    def _threaded_stream(self, callback: Callable, context: Any) -> Generator:
+        chunks = queue.Queue()
+        errors = []
+        stopped = threading.Event()
+
+        def run():
+            try:
+                self.scan_stream(iter(chunks.get, None), callback, context=context)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # before the end of the data, only a callback stops scan_stream
+                stopped.set()
+
+        thread = threading.Thread(target=run, name="engine-stream", daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk = yield stopped.is_set() and not errors
+                if chunk is None:
+                    break
+                if not stopped.is_set():
+                    chunks.put(bytes(chunk))
+        finally:
+            chunks.put(None)
+            thread.join()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,75 @@
+"""
+Container for several serialized Hyperscan databases in one file.
+
+Layout (all integers little-endian):
+    magic       8 bytes   b"NKHSBNDL"
+    version     uint16
+    count       uint16
+    count x     uint8 name length, name (ASCII), uint64 data length
+    data of every entry, in header order
+"""
+import struct
+from typing import Dict, List
+
+MAGIC = b"NKHSBNDL"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sHH")
+_NAME_LEN = struct.Struct("<B")
+_DATA_LEN = struct.Struct("<Q")
+
+
+def is_bundle(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def pack_bundle(entries: Dict[str, bytes]) -> bytes:
+    """Packs named serialized databases (e.g. {"block": ..., "stream": ...}) into a bundle."""
+    parts = [_HEADER.pack(MAGIC, VERSION, len(entries))]
+    for name, data in entries.items():
+        encoded = name.encode("ascii")
+        parts.append(_NAME_LEN.pack(len(encoded)) + encoded + _DATA_LEN.pack(len(data)))
+    parts.extend(entries.values())
+    return b"".join(parts)
+
+
+def _read_header(data: bytes):
+    """(name, data length) of every entry and the offset of the first entry's data"""
+    magic, version, count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a database bundle")
+    if version != VERSION:
+        raise ValueError(f"Unsupported database bundle version {version}")
+
+    offset = _HEADER.size
+    header = []
+    for _ in range(count):
+        (name_len,) = _NAME_LEN.unpack_from(data, offset)
+        offset += _NAME_LEN.size
+        name = data[offset:offset + name_len].decode("ascii")
+        offset += name_len
+        (data_len,) = _DATA_LEN.unpack_from(data, offset)
+        offset += _DATA_LEN.size
+        header.append((name, data_len))
+    return header, offset
+
+
+def entry_names(data: bytes) -> List[str]:
+    """Names of the entries of a bundle; `data` only needs to hold the beginning of the bundle."""
+    try:
+        header, _ = _read_header(data)
+    except struct.error:
+        raise ValueError("Truncated database bundle header")
+    return [name for name, _ in header]
+
+
+def unpack_bundle(data: bytes) -> Dict[str, bytes]:
+    """Returns the named serialized databases stored in a bundle."""
+    header, offset = _read_header(data)
+    entries = {}
+    for name, data_len in header:
+        if offset + data_len > len(data):
+            raise ValueError(f"Truncated database bundle, entry '{name}'")
+        entries[name] = data[offset:offset + data_len]
+        offset += data_len
+    return entries
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import platform
+import tempfile
+from typing import List, Optional
+
+import hyperscan
+
+# CPU features Hyperscan specialises its databases for
+_CPU_FEATURES = ("sse4_2", "popcnt", "avx2", "bmi2", "avx512f", "avx512bw", "avx512vbmi")
+
+
+def cpu_features() -> str:
+    """Machine type and the Hyperscan-relevant CPU flags of this host."""
+    flags = set()
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass
+    return ",".join([platform.machine()] + [flag for flag in _CPU_FEATURES if flag in flags])
+
+
+class DatabaseCache:
+    """
+    Content-addressed on-disk cache of serialized Hyperscan databases.
+
+    A database is stored under the hash of everything its compiled form
+    depends on: the pattern text, ids, compile flags, database mode, the
+    hyperscan version and the CPU features of the host. Reading an entry
+    refreshes its modification time, and when the cache grows above
+    `max_bytes` the least recently used entries are removed.
+    """
+    DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nokia_project", "hsdb")
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        """
+        Args:
+            cache_dir (str, optional):
+                Directory of the cache (default `DatabaseCache.DEFAULT_DIR`).
+            max_bytes (int, optional):
+                Size limit of all entries together
+                (default `DatabaseCache.DEFAULT_MAX_BYTES`).
+        """
+        self.cache_dir = cache_dir or DatabaseCache.DEFAULT_DIR
+        self.max_bytes = max_bytes or DatabaseCache.DEFAULT_MAX_BYTES
+
+    @staticmethod
+    def key(patterns: List[bytes], ids: List[int], flags: List[int], mode: int) -> str:
+        """Hash identifying the database compiled from these inputs on this host."""
+        h = hashlib.sha256()
+        h.update(f"hyperscan {hyperscan.__version__}|{cpu_features()}|mode {mode}\n".encode())
+        for pattern, pattern_id, flag in zip(patterns, ids, flags):
+            h.update(f"{pattern_id}:{flag}:{len(pattern)}:".encode())
+            h.update(pattern)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".db")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the serialized database stored under `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Stores a serialized database and evicts old entries if the cache is too big."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".db"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
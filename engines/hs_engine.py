@@ -1,42 +1,328 @@
-﻿import hyperscan
-from .base_engine import RegexEngine
+﻿import json
+import threading
+
+import hyperscan
+from . import pattern_flags
+from .base_engine import EngineStream, RegexEngine
+from .db_bundle import is_bundle, pack_bundle, unpack_bundle
+from .db_cache import DatabaseCache
+from .pattern_width import pattern_width, split_context
 from typing import List, Callable, Any
 
 
+_BASE_MODES = hyperscan.HS_MODE_BLOCK | hyperscan.HS_MODE_STREAM | hyperscan.HS_MODE_VECTORED
+# pattern flags passed on to hyperscan, SOM is decided per pattern
+_REGEX_FLAGS = pattern_flags.CASELESS | pattern_flags.DOTALL | pattern_flags.MULTILINE | pattern_flags.SINGLEMATCH
+
+
+def _as_bytes(data):
+    # the hyperscan binding only accepts `bytes`, so memoryview chunks from
+    # FileReader's mmap/readinto modes are copied right before the scan
+    return data if isinstance(data, bytes) else bytes(data)
+
+
 class HyperscanEngine(RegexEngine):
     COMPILER_MODE_FLAGS = hyperscan.HS_MODE_STREAM | hyperscan.HS_MODE_SOM_HORIZON_LARGE
+    BLOCK_MODE_FLAGS = hyperscan.HS_MODE_BLOCK
+    VECTORED_MODE_FLAGS = hyperscan.HS_MODE_VECTORED
     COMPILE_FLAGS = hyperscan.HS_FLAG_SOM_LEFTMOST
+    MODES = ("block", "stream", "vectored")
+    COPIES_BUFFERS = True
 
-    def __init__(self):
+    def __init__(self, modes=("stream",), cache: DatabaseCache = None):
+        """
+        Args:
+            modes: databases built by compile_patterns, any of MODES.
+                "stream" is used by scan_stream, "block" by scan and
+                "vectored" by scan_batch.
+            cache: on-disk cache of compiled databases, a repeated compile
+                of the same patterns is loaded from it (default: no cache)
+        """
         self.db = None
+        self.block_db = None
+        self.vectored_db = None
+        self.modes = modes
+        self.cache = cache
         self.patterns = []
+        self.ids = []
+        self.flags = []
+        # pattern id -> match width of the patterns compiled without start
+        # of match (SOM), None when the width is not fixed
+        self.starts = {}
+        # (overlap, lookahead) of split_context, kept in serialized bundles
+        # because a loaded database has no pattern text
+        self.context = None
+        # scratch space per mode of a clone_for_thread() copy, None for the
+        # scratch allocated with each database
+        self.scratches = {}
+        self._close_lock = threading.Lock()
     
-    def compile_patterns(self, patterns, ids=None):
+    def compile_patterns(self, patterns, ids=None, flags=None):
+        """
+        Compiles the databases of all modes.
+
+        Start of match (SOM) tracking makes stream state larger and scans
+        slower, so only patterns that need it are compiled with
+        `HS_FLAG_SOM_LEFTMOST`: patterns with the `som` flag, and patterns
+        without `no-som` or `single-match` whose matches can have
+        different lengths. The start of the other matches is computed as
+        end minus the fixed match width, or reported equal to the end
+        (an empty match) when the width is not fixed.
+        """
         self.patterns = patterns
         if ids is None:
             ids = list(range(len(patterns)))
-        flags = [HyperscanEngine.COMPILE_FLAGS] * len(patterns)
-        self.db = hyperscan.Database(mode=HyperscanEngine.COMPILER_MODE_FLAGS)
-        self.db.compile(expressions=patterns, ids=ids, flags=flags, elements=len(patterns))
+        if flags is None:
+            flags = [0] * len(patterns)
+        self.ids, self.flags = ids, flags
+        self.context = split_context(patterns)
+
+        self.starts = {}
+        compile_flags = []
+        for pattern_id, pattern, flag in zip(ids, patterns, flags):
+            # Python's parser reads POSIX classes ([[:alpha:]]) as two characters
+            lo, hi = pattern_width(pattern) if b"[:" not in pattern else (0, None)
+            som = flag & pattern_flags.SOM_LEFTMOST or not (
+                flag & (pattern_flags.NO_SOM | pattern_flags.SINGLEMATCH) or lo == hi)
+            if som:
+                compile_flags.append((flag & _REGEX_FLAGS) | HyperscanEngine.COMPILE_FLAGS)
+            else:
+                compile_flags.append(flag & _REGEX_FLAGS)
+                self.starts[pattern_id] = hi if lo == hi else None
+        flags = compile_flags
+
+        if "stream" in self.modes:
+            # without any SOM pattern the stream state needs no SOM horizon
+            mode = HyperscanEngine.COMPILER_MODE_FLAGS if len(self.starts) < len(patterns) \
+                else hyperscan.HS_MODE_STREAM
+            self.db = self._compile(mode, patterns, ids, flags)
+        if "block" in self.modes:
+            self.block_db = self._compile(HyperscanEngine.BLOCK_MODE_FLAGS, patterns, ids, flags)
+        if "vectored" in self.modes:
+            self.vectored_db = self._compile(HyperscanEngine.VECTORED_MODE_FLAGS, patterns, ids, flags)
+
+    def _compile(self, mode_flags, patterns, ids, flags):
+        """Compiles one database, or takes it from the database cache"""
+        key = None
+        if self.cache is not None:
+            key = DatabaseCache.key(patterns, ids, flags, mode_flags)
+            data = self.cache.get(key)
+            if data is not None:
+                db = hyperscan.loadb(data, mode_flags & _BASE_MODES)
+                db.scratch = hyperscan.Scratch(db)
+                return db
+
+        db = hyperscan.Database(mode=mode_flags)
+        db.compile(expressions=patterns, ids=ids, flags=flags, elements=len(patterns))
+        if key is not None:
+            try:
+                self.cache.put(key, hyperscan.dumpb(db))
+            except OSError as e:
+                print(f"Warning: could not write database cache '{self.cache.cache_dir}': {e}")
+        return db
+
+    def constructor_options(self):
+        return {"modes": self.modes, "cache": self.cache}
     
-    def scan(self, data, callback):
-        if self.db is None:
-            raise RuntimeError('Patterns Database is not compiled')
-        self.db.scan(data, match_event_handler=callback)
+    def clone_for_thread(self):
+        """
+        Returns an engine sharing this engine's compiled databases, with
+        its own clone of every database's scratch space.
+
+        A scratch can only be used by one scan at a time, the databases
+        themselves are read-only. Every thread scanning in parallel needs
+        its own clone; hyperscan releases the GIL while it scans.
+        """
+        clone = HyperscanEngine(self.modes, self.cache)
+        clone.db, clone.block_db, clone.vectored_db = self.db, self.block_db, self.vectored_db
+        clone.patterns, clone.ids, clone.flags, clone.starts = self.patterns, self.ids, self.flags, self.starts
+        clone.context = self.context
+        clone._close_lock = self._close_lock
+        clone.scratches = {name: db.scratch.clone() for name, db in self._databases().items() if db is not None}
+        return clone
+
+    def _scratch(self, mode, db):
+        """Scratch for scanning `db`: this thread's clone, or the database's own"""
+        return self.scratches.get(mode) or db.scratch
+
+    def _with_starts(self, callback):
+        """Callback that sets the start of matches of patterns compiled without SOM"""
+        starts = self.starts
+        if not starts:
+            return callback
+
+        def report(pattern_id, start, end, flags, context):
+            if pattern_id in starts:
+                width = starts[pattern_id]
+                start = end if width is None else end - width
+            return callback(pattern_id, start, end, flags, context)
+        return report
+
+    def scan(self, data, callback, context=None):
+        """Scans one block of data, with the block database when there is one"""
+        try:
+            if self.block_db is not None:
+                self.block_db.scan(_as_bytes(data), match_event_handler=self._with_starts(callback),
+                                   context=context, scratch=self._scratch("block", self.block_db))
+            elif self.vectored_db is not None:
+                self.vectored_db.scan([_as_bytes(data)], match_event_handler=self._with_starts(callback),
+                                      context=context, scratch=self._scratch("vectored", self.vectored_db))
+            else:
+                self.scan_stream([data], callback, context=context)
+        except hyperscan.ScanTerminated:
+            # the callback returned True
+            pass
     
     def scan_stream(self, data_chunks, callback, context=None):
+        if self.db is None and self.vectored_db is not None:
+            # only a vectored database was loaded, scan the data as one buffer
+            return self.scan_batch([b"".join(data_chunks)], callback, [context])
         if self.db is None:
             raise RuntimeError('Patterns Database is not compiled')
 
-        with self.db.stream(match_event_handler=callback, context=context) as stream:
+        stream = self.open_stream(callback, context=context)
+        try:
             for chunk in data_chunks:
-                stream.scan(chunk)
+                if stream.scan(chunk):
+                    # stopped by the callback, the rest is not read
+                    break
+        finally:
+            stream.close()
 
-    def save_db(self, filename="hs.db"):
+    def open_stream(self, callback, context=None):
+        """
+        Opens a Hyperscan stream that stays open between scan() calls,
+        so bytes appended to a file later still match with the earlier ones.
+        """
         if self.db is None:
+            raise RuntimeError('Patterns Database is not compiled')
+        return EngineStream(self._stream_scanner(callback, context))
+
+    def _stream_scanner(self, callback, context):
+        # the binding's Stream.__enter__ returns the stream without a new
+        # reference, it is only safe to use inside a with statement, which
+        # this generator keeps open between chunks
+        scratch = self._scratch("stream", self.db)
+        # the stream holds no reference to its callback, this frame keeps it alive
+        callback = self._with_starts(callback)
+        terminated = False
+        try:
+            with self.db.stream(match_event_handler=callback, context=context) as stream:
+                try:
+                    while True:
+                        chunk = yield terminated
+                        if chunk is None:
+                            break
+                        if terminated:
+                            continue
+                        try:
+                            stream.scan(_as_bytes(chunk), flags=0, scratch=scratch)
+                        except hyperscan.ScanTerminated:
+                            # closing a terminated stream reports nothing more
+                            terminated = True
+                finally:
+                    # the binding closes the stream with the database's own
+                    # scratch, which all clones of this engine share
+                    self._close_lock.acquire()
+        finally:
+            self._close_lock.release()
+
+    def scan_batch(self, buffers, callback, contexts):
+        """
+        Scans whole small files with the vectored database.
+
+        Each buffer is submitted as its own vector. Buffers of one vector
+        are matched as a single contiguous stream, which would let matches
+        run from one file into the next, and the hyperscan 0.7 binding
+        passes wrong lengths for vectors with more than one buffer. Match
+        offsets are therefore local to each buffer. Without a vectored
+        database the files are scanned in streaming mode.
+        """
+        if self.vectored_db is None:
+            return super().scan_batch(buffers, callback, contexts)
+
+        scratch = self._scratch("vectored", self.vectored_db)
+        callback = self._with_starts(callback)
+        for data, context in zip(buffers, contexts):
+            try:
+                self.vectored_db.scan([_as_bytes(data)], match_event_handler=callback, context=context,
+                                      scratch=scratch)
+            except hyperscan.ScanTerminated:
+                # only the scan of this buffer is stopped
+                pass
+
+    def split_context(self):
+        return self.context
+
+    def _databases(self):
+        return {"block": self.block_db, "stream": self.db, "vectored": self.vectored_db}
+
+    def dumpb(self, mode=None):
+        """
+        Serializes the database of one mode, or with mode=None a bundle
+        (see engines.db_bundle) of all compiled databases.
+
+        When patterns were compiled without SOM, their match widths are
+        needed to report match starts, so they are added to the bundle as
+        the entry "starts". The overlap and lookahead for splitting files
+        into ranges (`split_context`) are added as the entry "context", and
+        the pattern ids (e.g. for `FileScanner`'s max_matches) as "ids".
+        With any of them a single mode is serialized as a bundle too.
+        """
+        extras = {"starts": json.dumps(self.starts).encode()} if self.starts else {}
+        if self.context is not None:
+            extras["context"] = json.dumps(list(self.context)).encode()
+        if self.ids:
+            extras["ids"] = json.dumps(list(self.ids)).encode()
+        if mode is None:
+            databases = {name: db for name, db in self._databases().items() if db is not None}
+            if not databases:
+                raise RuntimeError("Patterns Database is not compiled")
+            return pack_bundle({**{name: hyperscan.dumpb(db) for name, db in databases.items()}, **extras})
+
+        if mode not in HyperscanEngine.MODES:
+            raise ValueError(f"Unknown database mode '{mode}', expected one of {HyperscanEngine.MODES}")
+        db = self._databases()[mode]
+        if db is None:
             raise RuntimeError("Patterns Database is not compiled")
+        if extras:
+            return pack_bundle({mode: hyperscan.dumpb(db), **extras})
+        return hyperscan.dumpb(db)
+
+    def loadb(self, data):
+        """Loads a serialized database or a bundle, modes are read from the databases themselves"""
+        self.starts = {}
+        self.context = None
+        self.ids = []
+        if is_bundle(data):
+            for name, serialized in unpack_bundle(data).items():
+                if name == "starts":
+                    self.starts = {int(pattern_id): width for pattern_id, width in json.loads(serialized).items()}
+                elif name == "context":
+                    self.context = tuple(json.loads(serialized))
+                elif name == "ids":
+                    self.ids = json.loads(serialized)
+                elif name == "shards":
+                    raise ValueError("Sharded database, load it with ShardedEngine")
+                else:
+                    self._load_database(serialized)
+        else:
+            self._load_database(data)
+
+    def _load_database(self, data):
+        info = hyperscan.loadb(data, hyperscan.HS_MODE_STREAM).info()
+        if b"Mode: VECTORED" in info:
+            self.vectored_db = db = hyperscan.loadb(data, hyperscan.HS_MODE_VECTORED)
+        elif b"Mode: STREAM" in info:
+            self.db = db = hyperscan.loadb(data, hyperscan.HS_MODE_STREAM)
+        elif b"Mode: BLOCK" in info:
+            self.block_db = db = hyperscan.loadb(data, hyperscan.HS_MODE_BLOCK)
+        else:
+            raise ValueError(f"Unsupported database: {info.decode(errors='replace')}")
+        db.scratch = hyperscan.Scratch(db)
 
-        serialized = hyperscan.dumpb(self.db)
+    def save_db(self, filename="hs.db", mode=None):
+        serialized = self.dumpb(mode)
 
         with open(filename, "wb") as f:
             f.write(serialized)
@@ -45,5 +331,4 @@ class HyperscanEngine(RegexEngine):
         with open(filename, "rb") as f:
             data = f.read()
 
-        self.db = hyperscan.loadb(data, hyperscan.HS_MODE_STREAM)
-        self.db.scratch = hyperscan.Scratch(self.db)
+        self.loadb(data)
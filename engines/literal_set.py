@@ -0,0 +1,186 @@
+"""
+Single-pass matching of patterns that only match a small, finite set of strings.
+
+Patterns such as `ERROR`, `(test|nokia)` or `colou?r` are expanded into
+their strings (in the order the regex engine would try them). All strings
+of all such patterns are merged into one prefix-trie alternation, which
+Python's `re` searches in a single pass, using the set of possible first
+characters as a prefilter. At every position where the trie matches, the
+strings starting there are looked up by length.
+"""
+import re
+from itertools import product
+from typing import AnyStr, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# patterns expanding to more strings are matched on their own
+MAX_EXPANSION = 64
+
+
+def expand_literals(pattern: AnyStr, limit: int = MAX_EXPANSION) -> Optional[List[AnyStr]]:
+    """
+    Returns the strings matched by `pattern`, in the order `re` tries them,
+    or None if the pattern is not a small finite set of non-empty strings
+    (repeats without an upper bound, anchors, classes like `\\d`, flags, ...).
+    Works for `str` and `bytes` patterns, the strings have the pattern's type.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if parsed.state.flags & ~(sre_constants.SRE_FLAG_UNICODE | sre_constants.SRE_FLAG_ASCII):
+        return None
+
+    char = (lambda c: bytes((c,))) if isinstance(pattern, bytes) else chr
+    strings = _expand_sequence(parsed, limit, char)
+    if strings is None or pattern[:0] in strings:
+        return None
+    return strings
+
+
+def _expand_sequence(items, limit: int, char: Callable) -> Optional[List]:
+    strings = [char(0)[:0]]
+    for op, av in items:
+        options = _expand_item(op, av, limit, char)
+        if options is None or len(strings) * len(options) > limit:
+            return None
+        strings = [prefix + option for prefix, option in product(strings, options)]
+    return strings
+
+
+def _expand_item(op, av, limit: int, char: Callable) -> Optional[List]:
+    if op is sre_constants.LITERAL:
+        return [char(av)]
+
+    if op is sre_constants.IN:
+        chars = []
+        for item_op, item_av in av:
+            if item_op is sre_constants.LITERAL:
+                chars.append(char(item_av))
+            elif item_op is sre_constants.RANGE:
+                chars.extend(char(c) for c in range(item_av[0], item_av[1] + 1))
+            else:
+                return None
+            if len(chars) > limit:
+                return None
+        return chars
+
+    if op is sre_constants.SUBPATTERN:
+        _, add_flags, del_flags, sub = av
+        if add_flags or del_flags:
+            return None
+        return _expand_sequence(sub, limit, char)
+
+    if op is sre_constants.BRANCH:
+        strings = []
+        for sub in av[1]:
+            options = _expand_sequence(sub, limit, char)
+            if options is None or len(strings) + len(options) > limit:
+                return None
+            strings.extend(options)
+        return strings
+
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        lo, hi, sub = av
+        if hi == sre_constants.MAXREPEAT or hi > limit:
+            return None
+        options = _expand_sequence(sub, limit, char)
+        if options is None:
+            return None
+        counts = range(hi, lo - 1, -1) if op is sre_constants.MAX_REPEAT else range(lo, hi + 1)
+        strings = []
+        for count in counts:
+            repeated = _repeat(options, count, limit)
+            if repeated is None or len(strings) + len(repeated) > limit:
+                return None
+            strings.extend(repeated)
+        return strings
+
+    return None
+
+
+def _repeat(options: List, count: int, limit: int) -> Optional[List]:
+    empty = options[0][:0]
+    if count == 0:
+        return [empty]
+    if len(options) ** count > limit:
+        return None
+    return [empty.join(parts) for parts in product(options, repeat=count)]
+
+
+def _trie_regex(strings: Iterable[AnyStr], empty: AnyStr) -> AnyStr:
+    trie: Dict = {}
+    for s in strings:
+        node = trie
+        for i in range(len(s)):
+            node = node.setdefault(s[i:i + 1], {})
+        node[empty] = {}
+
+    group, alternation, close, optional = (b"(?:", b"|", b")", b"?") if isinstance(empty, bytes) \
+        else ("(?:", "|", ")", "?")
+
+    def build(node):
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return empty
+        if len(alternatives) == 1 and empty not in node:
+            return alternatives[0]
+        body = group + alternation.join(alternatives) + close
+        return body + optional if empty in node else body
+
+    return build(trie)
+
+
+class LiteralSetMatcher:
+    """Finds matches of many finite-string patterns in one pass over the text."""
+
+    def __init__(self, patterns: List[Tuple[int, List[AnyStr]]]):
+        """
+        Args:
+            patterns: (pattern_id, strings) pairs, strings as returned by
+                `expand_literals`, i.e. in the order `re` tries them.
+        """
+        # string -> [(pattern index, rank of the string within the pattern)]
+        self._lookup: Dict[AnyStr, List[Tuple[int, int]]] = {}
+        for index, (_, strings) in enumerate(patterns):
+            for rank, s in enumerate(strings):
+                self._lookup.setdefault(s, []).append((index, rank))
+        self._ids = [pattern_id for pattern_id, _ in patterns]
+        self.strings = list(self._lookup)
+        self._lengths = sorted({len(s) for s in self._lookup})
+        self.max_length = self._lengths[-1]
+        empty = next(iter(self._lookup))[:0]
+        self._gate = re.compile(_trie_regex(self._lookup, empty))
+
+    def finditer(self, text, pos: int = 0) -> Iterable[Tuple[int, int, int]]:
+        """
+        Yields (pattern_id, start, end) for every start position of every
+        pattern, with the end `re` would report for that position.
+        `text` is a str, or any bytes-like object for bytes patterns.
+        """
+        search = self._gate.search
+        lookup = self._lookup
+        lengths = self._lengths
+        size = len(text)
+        # slices of memoryviews and bytearrays cannot be dictionary keys
+        key = bytes if isinstance(text, (memoryview, bytearray)) else None
+        while pos < size:
+            m = search(text, pos)
+            if m is None:
+                return
+            start = m.start()
+            best = {}
+            for length in lengths:
+                piece = text[start:start + length]
+                for index, rank in lookup.get(key(piece) if key else piece, ()):
+                    if index not in best or rank < best[index][0]:
+                        best[index] = (rank, length)
+            for index in sorted(best):
+                yield self._ids[index], start, start + best[index][1]
+            pos = start + 1
@@ -0,0 +1,50 @@
+"""
+Per-pattern flags, written after the comma in a pattern file (see
+`FileRegex.entries`) and passed to `RegexEngine.compile_patterns`.
+
+The values of the regex flags are those of Hyperscan's `HS_FLAG_*`, so
+HyperscanEngine passes them on unchanged; other engines translate them.
+"""
+from typing import Callable, Iterable
+
+CASELESS = 0x001
+DOTALL = 0x002
+MULTILINE = 0x004
+SINGLEMATCH = 0x008
+SOM_LEFTMOST = 0x100
+# the start of a match is not needed; not a Hyperscan flag
+NO_SOM = 0x10000
+
+# option names in pattern files
+NAMES = {
+    "caseless": CASELESS,
+    "dotall": DOTALL,
+    "multiline": MULTILINE,
+    "single-match": SINGLEMATCH,
+    "som": SOM_LEFTMOST,
+    "no-som": NO_SOM,
+}
+
+_INLINE = ((CASELESS, b"i"), (DOTALL, b"s"), (MULTILINE, b"m"))
+
+
+def python_pattern(pattern: bytes, flags: int) -> bytes:
+    """`pattern` with the regex flags as a scoped inline group for Python's re, e.g. `(?i:abc)`"""
+    inline = b"".join(letter for flag, letter in _INLINE if flags & flag)
+    if not inline:
+        return pattern
+    return b"(?" + inline + b":" + pattern + b")"
+
+
+def single_match(callback: Callable, ids: Iterable[int]) -> Callable:
+    """Wraps the callback of one scan so that patterns with these ids report only their first match"""
+    single = frozenset(ids)
+    reported = set()
+
+    def report(pattern_id, start, end, flags, context):
+        if pattern_id in single:
+            if pattern_id in reported:
+                return False
+            reported.add(pattern_id)
+        return callback(pattern_id, start, end, flags, context)
+    return report
@@ -0,0 +1,190 @@
+"""Static analysis of regex patterns used to size overlaps between scan windows"""
+from typing import Iterable, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+
+def pattern_width(pattern: bytes) -> Tuple[int, Optional[int]]:
+    """
+    Returns the (minimum, maximum) length of a match of `pattern`.
+
+    The maximum is None when the pattern is unbounded (e.g. `x+`, `.*`)
+    or cannot be parsed by Python's regex parser.
+    """
+    try:
+        lo, hi = sre_parse.parse(pattern).getwidth()
+    except Exception:
+        return 0, None
+    if hi >= sre_constants.MAXREPEAT:
+        return lo, None
+    return lo, hi
+
+
+def max_match_width(patterns: Iterable[bytes]) -> Optional[int]:
+    """
+    Returns the longest possible match of any pattern in the set,
+    or None if at least one pattern is unbounded or the set is empty.
+    """
+    widest = None
+    for pattern in patterns:
+        _, hi = pattern_width(pattern)
+        if hi is None:
+            return None
+        widest = hi if widest is None else max(widest, hi)
+    return widest
+
+
+def split_context(patterns: Iterable[bytes]) -> Optional[Tuple[int, int]]:
+    """
+    Returns (overlap, lookahead) for scanning a file as separate byte
+    ranges: every range is scanned from `overlap` bytes before it (the
+    longest match plus what a pattern looks at behind it), and matches
+    ending within `lookahead` bytes of the end of a range are left to the
+    next range, whose scan sees the bytes after them (`$`, `\\b`,
+    lookahead assertions). None if a pattern is unbounded or the set is
+    empty.
+    """
+    overlap, lookahead = None, 0
+    for pattern in patterns:
+        _, hi = pattern_width(pattern)
+        behind, ahead = context_width(pattern)
+        if hi is None or ahead is None:
+            return None
+        overlap = max(overlap or 0, hi + behind)
+        lookahead = max(lookahead, ahead)
+    return None if overlap is None else (overlap, lookahead)
+
+
+# node types that differ between Python versions
+_REPEATS = tuple(getattr(sre_constants, name) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+                 if hasattr(sre_constants, name))
+_GROUPREFS = tuple(getattr(sre_constants, name) for name in ("GROUPREF", "GROUPREF_IGNORE", "GROUPREF_LOC_IGNORE",
+                                                             "GROUPREF_UNI_IGNORE")
+                   if hasattr(sre_constants, name))
+
+# anchors and how many characters before / after the current position they look at
+_AT_BEHIND = ("AT_BEGINNING", "AT_BEGINNING_LINE", "AT_BEGINNING_STRING", "AT_BOUNDARY", "AT_NON_BOUNDARY")
+_AT_AHEAD = {"AT_END": 2, "AT_END_LINE": 1, "AT_END_STRING": 1, "AT_BOUNDARY": 1, "AT_NON_BOUNDARY": 1}
+
+
+def context_width(pattern) -> Tuple[int, Optional[int]]:
+    """
+    Returns how many characters (behind, ahead) of a match a pattern may
+    look at without consuming them: anchors like `^`, `$`, `\\b` and
+    lookaround assertions. `ahead` is None for an unbounded lookahead
+    or a pattern that cannot be parsed.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return 0, None
+    return _context(parsed)
+
+
+def _context(items) -> Tuple[int, Optional[int]]:
+    behind, ahead = 0, 0
+    for op, av in items:
+        if op is sre_constants.AT:
+            if str(av) in _AT_BEHIND:
+                behind = max(behind, 1)
+            ahead = max(ahead, _AT_AHEAD.get(str(av), 0))
+            continue
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            direction, sub = av
+            _, hi = sub.getwidth()
+            inner_behind, inner_ahead = _context(sub)
+            if direction < 0:
+                behind = max(behind, hi + inner_behind)
+            elif hi >= sre_constants.MAXREPEAT or inner_ahead is None:
+                return behind, None
+            else:
+                ahead = max(ahead, hi + inner_ahead)
+            continue
+        for sub in _subpatterns(op, av):
+            sub_behind, sub_ahead = _context(sub)
+            behind = max(behind, sub_behind)
+            if sub_ahead is None:
+                return behind, None
+            ahead = max(ahead, sub_ahead)
+    return behind, ahead
+
+
+def _subpatterns(op, av) -> list:
+    if op is sre_constants.SUBPATTERN:
+        return [av[3]]
+    if op is sre_constants.BRANCH:
+        return av[1]
+    if op in _REPEATS:
+        return [av[2]]
+    if op is getattr(sre_constants, "ATOMIC_GROUP", None):
+        return [av]
+    if op is sre_constants.GROUPREF_EXISTS:
+        return [sub for sub in av[1:] if sub is not None]
+    return []
+
+
+def can_match_newline(pattern) -> bool:
+    """
+    Returns False if no match of `pattern` can contain a newline, so its
+    matches never cross line boundaries. Unparsable patterns give True.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return True
+    return _matches_newline(parsed, bool(parsed.state.flags & sre_constants.SRE_FLAG_DOTALL))
+
+
+_NEWLINE_CATEGORIES = ("CATEGORY_SPACE", "CATEGORY_NOT_DIGIT", "CATEGORY_NOT_WORD",
+                       "CATEGORY_LINEBREAK", "CATEGORY_UNI_SPACE", "CATEGORY_UNI_NOT_DIGIT",
+                       "CATEGORY_UNI_NOT_WORD", "CATEGORY_UNI_LINEBREAK", "CATEGORY_LOC_NOT_WORD")
+
+
+def _in_matches_newline(items) -> bool:
+    negate = False
+    found = False
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negate = True
+        elif op is sre_constants.LITERAL:
+            found = found or av == 10
+        elif op is sre_constants.RANGE:
+            found = found or av[0] <= 10 <= av[1]
+        elif op is sre_constants.CATEGORY:
+            found = found or str(av) in _NEWLINE_CATEGORIES
+        else:
+            return True
+    return found != negate
+
+
+def _matches_newline(items, dotall: bool) -> bool:
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            if av == 10:
+                return True
+        elif op is sre_constants.NOT_LITERAL:
+            if av != 10:
+                return True
+        elif op is sre_constants.ANY:
+            if dotall:
+                return True
+        elif op is sre_constants.IN:
+            if _in_matches_newline(av):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            add_flags, del_flags = av[1], av[2]
+            sub_dotall = (dotall or bool(add_flags & sre_constants.SRE_FLAG_DOTALL)) \
+                and not del_flags & sre_constants.SRE_FLAG_DOTALL
+            if _matches_newline(av[3], sub_dotall):
+                return True
+        elif op in _GROUPREFS:
+            return True
+        elif op not in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if any(_matches_newline(sub, dotall) for sub in _subpatterns(op, av)):
+                return True
+    return False
@@ -0,0 +1,166 @@
+"""
+Cheap checks that rule out patterns before any regex search runs.
+
+Every pattern is analysed for its required factors: a set of strings of
+which at least one occurs in every match (`\\d{3}-\\d{4}` needs `-`,
+`(test|nokia)` needs `test` or `nokia`). A chunk that contains none of
+a pattern's factors cannot contain a match of it.
+
+With NumPy installed, the bytes present in a chunk are counted in one
+vectorized pass and factors with a missing byte are rejected without
+searching for them; otherwise the factors are looked up with one
+literal-alternation `re` search, which works on any bytes-like buffer.
+"""
+import re
+from typing import FrozenSet, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # optional, the prefilter falls back to re searches
+    np = None
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# requirements with more alternatives are not worth checking
+MAX_FACTORS = 16
+
+_REPEATS = tuple(getattr(sre_constants, name) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+                 if hasattr(sre_constants, name))
+
+
+def required_factors(pattern: bytes, max_factors: int = MAX_FACTORS) -> Optional[FrozenSet[bytes]]:
+    """
+    Returns strings of which at least one occurs in every match of
+    `pattern`, or None if no such small set was found (e.g. `\\w+`,
+    case-insensitive patterns, patterns matching the empty string).
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return None
+    return _sequence(parsed, max_factors)
+
+
+def _sequence(items, max_factors: int) -> Optional[FrozenSet[bytes]]:
+    candidates = []
+    run = b""
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run += bytes((av,))
+            continue
+        if run:
+            candidates.append(frozenset([run]))
+            run = b""
+        factors = _item(op, av, max_factors)
+        if factors:
+            candidates.append(factors)
+    if run:
+        candidates.append(frozenset([run]))
+    if not candidates:
+        return None
+    # the most selective requirement: long factors, few alternatives
+    return max(candidates, key=lambda factors: (min(map(len, factors)), -len(factors)))
+
+
+def _item(op, av, max_factors: int) -> Optional[FrozenSet[bytes]]:
+    if op is sre_constants.IN:
+        chars = set()
+        for item_op, item_av in av:
+            if item_op is sre_constants.LITERAL:
+                chars.add(bytes((item_av,)))
+            elif item_op is sre_constants.RANGE and item_av[1] - item_av[0] < max_factors:
+                chars.update(bytes((c,)) for c in range(item_av[0], item_av[1] + 1))
+            else:
+                return None
+        return frozenset(chars) if len(chars) <= max_factors else None
+
+    if op is sre_constants.SUBPATTERN:
+        _, add_flags, _, sub = av
+        if add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+            return None
+        return _sequence(sub, max_factors)
+
+    if op is sre_constants.BRANCH:
+        factors = set()
+        for sub in av[1]:
+            branch = _sequence(sub, max_factors)
+            if branch is None:
+                return None
+            factors |= branch
+        return frozenset(factors) if len(factors) <= max_factors else None
+
+    if op in _REPEATS and av[0] >= 1:
+        return _sequence(av[2], max_factors)
+
+    if op is getattr(sre_constants, "ATOMIC_GROUP", None):
+        return _sequence(av, max_factors)
+
+    return None
+
+
+def literal_set_factors(strings: Iterable[bytes], max_factors: int = MAX_FACTORS) -> FrozenSet[bytes]:
+    """Factors of a set of literals: the literals, or their first bytes if there are many."""
+    strings = frozenset(strings)
+    if len(strings) <= max_factors:
+        return strings
+    return frozenset(s[:1] for s in strings)
+
+
+class Prefilter:
+    """Decides which of a list of requirements can be met by a buffer."""
+
+    def __init__(self, requirements: Sequence[Optional[FrozenSet[bytes]]], use_numpy: bool = True):
+        """
+        Args:
+            requirements: Factors for every search, None where every
+                buffer has to be searched.
+            use_numpy: Use the vectorized byte histogram when NumPy is installed.
+        """
+        self.requirements = list(requirements)
+        self.use_numpy = use_numpy and np is not None
+        self._searches = [
+            None if factors is None else re.compile(b"|".join(re.escape(f) for f in sorted(factors))).search
+            for factors in self.requirements
+        ]
+        if self.use_numpy:
+            self._factor_bytes = [
+                None if factors is None else [np.frombuffer(f, dtype=np.uint8) for f in factors]
+                for factors in self.requirements
+            ]
+
+    def possible(self, data, starts: Sequence[int]) -> List[bool]:
+        """
+        For every requirement, whether `data[starts[i]:]` contains one of
+        its factors. True means the buffer still has to be searched.
+        """
+        if self.use_numpy:
+            return self._possible_numpy(data, starts)
+        return [search is None or search(data, start) is not None for search, start in zip(self._searches, starts)]
+
+    def _possible_numpy(self, data, starts: Sequence[int]) -> List[bool]:
+        first = min(starts, default=0)
+        if first >= len(data):
+            return [factors is None for factors in self.requirements]
+        # bytes present from the earliest start on: a superset for every start
+        present = np.bincount(np.frombuffer(data, dtype=np.uint8, offset=first), minlength=256) > 0
+        result = []
+        for factors, factor_bytes, search, start in zip(self.requirements, self._factor_bytes, self._searches, starts):
+            if factors is None:
+                result.append(True)
+                continue
+            candidates = [f for f, values in zip(factors, factor_bytes) if present[values].all()]
+            if not candidates:
+                result.append(False)
+            elif start == first and any(len(f) == 1 for f in candidates):
+                # a present single byte is a match of the factor itself
+                result.append(True)
+            else:
+                result.append(search(data, start) is not None)
+        return result
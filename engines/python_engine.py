@@ -1,25 +1,68 @@
 import re
+from . import pattern_flags
 from .base_engine import RegexEngine
-from typing import List, Callable, Any, Iterable
+from .literal_set import LiteralSetMatcher, expand_literals
+from .pattern_width import can_match_newline, context_width, pattern_width
+from .prefilter import Prefilter, literal_set_factors, required_factors
+from typing import List, Callable, Any, Dict, Iterable, Iterator, Tuple
 
 
 class PythonEngine(RegexEngine):
+    # longest text kept between chunks for a pattern whose matches can
+    # be arbitrarily long and span lines (e.g. `a[\s\S]*b`)
+    MAX_CARRY = 1024 * 1024
     
-    def __init__(self):
+    def __init__(self, combine: bool = True, prefilter: bool = True):
+        """
+        Args:
+            combine (bool, optional):
+                Match all patterns that expand to a small set of strings
+                (literals, alternations of literals, ...) in a single pass
+                over the text instead of one pass per pattern. Reported
+                matches are the same either way (default: True).
+            prefilter (bool, optional):
+                Before searching a buffer, check that it contains one of
+                the strings every match of a pattern needs (see
+                `engines/prefilter.py`) and skip the patterns, or the
+                whole buffer, that cannot match (default: True).
+        """
         self.compiled_patterns = []
         self.patterns = []
+        self.ids = []
+        self.flags = []
+        # ids of the patterns that report only their first match
+        self.single_match_ids = set()
+        self.combine = combine
+        self.literal_matcher = None
+        self.searchers = []
+        self.prefilter = None
+        self.use_prefilter = prefilter
+        self.prefilter_stats = {}
+
+    def constructor_options(self) -> Dict[str, Any]:
+        return {"combine": self.combine, "prefilter": self.use_prefilter}
     
-    def compile_patterns(self, patterns: List[bytes], ids: List[int] = None) -> None:
+    def compile_patterns(self, patterns: List[bytes], ids: List[int] = None, flags: List[int] = None) -> None:
+        """
+        Regex flags become scoped inline flags (`(?i:...)`), so the literal
+        set, the prefilter and the streaming analysis see them too.
+        Single-match patterns are filtered per scan.
+        """
         self.patterns = patterns
         self.compiled_patterns = []
+        self.literal_matcher = None
         
         if ids is None:
             ids = list(range(len(patterns)))
+        if flags is None:
+            flags = [0] * len(patterns)
+        self.ids, self.flags = ids, flags
+        self.single_match_ids = {pattern_id for pattern_id, flag in zip(ids, flags)
+                                 if flag & pattern_flags.SINGLEMATCH}
         
-        for pattern_id, pattern_bytes in zip(ids, patterns):
+        for pattern_id, pattern_bytes, flag in zip(ids, patterns, flags):
             try:
-                pattern_str = pattern_bytes.decode('utf-8')
-                compiled = re.compile(pattern_str)
+                compiled = re.compile(pattern_flags.python_pattern(pattern_bytes, flag))
                 self.compiled_patterns.append({
                     'id': pattern_id,
                     'pattern': compiled,
@@ -27,97 +70,184 @@ class PythonEngine(RegexEngine):
                 })
             except re.error as e:
                 print(f"Warning: Invalid regex pattern '{pattern_bytes}': {e}")
-    
-    def scan(self, data: bytes, callback: Callable) -> None:
-        
-        if not self.compiled_patterns:
-            raise RuntimeError('Patterns Database is not compiled')
-        
-        try:
-            text = data.decode('utf-8', errors='ignore')
-        except Exception:
-            text = str(data)
-    
+
+        literals = []
+        if self.combine:
+            for pattern_info in self.compiled_patterns:
+                strings = expand_literals(pattern_info['pattern'].pattern)
+                pattern_info['literal'] = strings is not None
+                if strings is not None:
+                    literals.append((pattern_info['id'], strings))
+            if literals:
+                self.literal_matcher = LiteralSetMatcher(literals)
+        self.searchers = self._build_searchers()
+
+        self.prefilter = None
+        if self.use_prefilter:
+            self.prefilter = Prefilter([searcher['factors'] for searcher in self.searchers])
+        self.prefilter_stats = {'chunks': 0, 'skipped_chunks': 0, 'pattern_scans': 0, 'skipped_pattern_scans': 0}
+
+    def _build_searchers(self) -> List[dict]:
+        """
+        One entry per independent search over the text: the literal set
+        and every remaining pattern. Besides the search function it holds
+        what streaming needs to know when a start position is final:
+        the longest match ('width', None if unbounded), how far past the
+        match end the pattern can look ('ahead') and whether a match can
+        cross a newline ('newline'). 'factors' are the strings one of which
+        every match contains, for the prefilter, and 'count' the number of
+        patterns covered.
+        """
+        searchers = []
+        if self.literal_matcher is not None:
+            searchers.append({
+                'finditer': self.literal_matcher.finditer,
+                'width': self.literal_matcher.max_length,
+                'behind': 0,
+                'ahead': 0,
+                'newline': True,
+                'factors': literal_set_factors(self.literal_matcher.strings),
+                'count': sum(1 for info in self.compiled_patterns if info.get('literal')),
+            })
+
         for pattern_info in self.compiled_patterns:
+            if pattern_info.get('literal'):
+                continue
+            pattern = pattern_info['pattern'].pattern
+            behind, ahead = context_width(pattern)
+            searchers.append({
+                'finditer': self._pattern_finditer(pattern_info),
+                'width': pattern_width(pattern)[1],
+                'behind': behind,
+                'ahead': ahead,
+                'newline': can_match_newline(pattern),
+                'factors': required_factors(pattern),
+                'count': 1,
+            })
+        return searchers
+
+    @staticmethod
+    def _pattern_finditer(pattern_info: dict) -> Callable[[bytes, int], Iterator[Tuple[int, int, int]]]:
+        search = pattern_info['pattern'].search
+        pattern_id = pattern_info['id']
+
+        def finditer(text: bytes, pos: int = 0) -> Iterator[Tuple[int, int, int]]:
             # Find all overlapping matches by starting search from each position
-            pos = 0
             while pos < len(text):
-                match = pattern_info['pattern'].search(text, pos)
-                if match:
-                    callback(
-                        pattern_info['id'],  
-                        match.start(),        
-                        match.end(),         
-                        0,            # flags        
-                        None                  
-                    )
-                    # Move forward by 1 to find overlapping matches
-                    pos = match.start() + 1
-                else:
+                match = search(text, pos)
+                if not match:
                     break
+                yield pattern_id, match.start(), match.end()
+                # Move forward by 1 to find overlapping matches
+                pos = match.start() + 1
+        return finditer
+
+    def _matches(self, text: bytes) -> Iterator[Tuple[int, int, int]]:
+        """Yields (pattern_id, start, end) of all overlapping matches in `text`."""
+        for searcher, possible in zip(self.searchers, self._possible(text, [0] * len(self.searchers))):
+            if possible:
+                yield from searcher['finditer'](text)
+
+    def _possible(self, text: bytes, positions: List[int]) -> List[bool]:
+        """Runs the prefilter for every search and counts what it skipped."""
+        if self.prefilter is None:
+            return [True] * len(self.searchers)
+
+        possible = self.prefilter.possible(text, positions)
+        stats = self.prefilter_stats
+        stats['chunks'] += 1
+        if not any(possible):
+            stats['skipped_chunks'] += 1
+        for searcher, search in zip(self.searchers, possible):
+            stats['pattern_scans'] += searcher['count']
+            if not search:
+                stats['skipped_pattern_scans'] += searcher['count']
+        return possible
+
+    def _final_upto(self, searcher: dict, text: bytes) -> int:
+        """
+        Returns the first start position in `text` whose match may still
+        change when more data arrives; matches starting before it are final.
+        """
+        width, ahead = searcher['width'], searcher['ahead']
+        floor = len(text) - self.MAX_CARRY
+        if ahead is None:
+            return floor
+        if width is not None:
+            return max(len(text) - width - ahead + 1, floor)
+        if not searcher['newline']:
+            # the match cannot run past the next newline, so starts up to
+            # the last newline are final once the newline (and what the
+            # pattern looks at after it) has been read
+            return max(text.rfind(b'\n', 0, len(text) - ahead + 1) + 1, floor)
+        return floor
+
+    def scan(self, data: bytes, callback: Callable, context: Any = None) -> None:
+        """
+        Scans one buffer. `data` can be any bytes-like object (bytes,
+        bytearray, memoryview, mmap); it is searched in place and the
+        reported offsets are byte offsets, as with Hyperscan.
+        """
+        if not self.compiled_patterns:
+            raise RuntimeError('Patterns Database is not compiled')
+
+        if self.single_match_ids:
+            callback = pattern_flags.single_match(callback, self.single_match_ids)
+        for pattern_id, start, end in self._matches(data):
+            if callback(pattern_id, start, end, 0, context):  # flags = 0
+                return
+
     def scan_stream(self, data_chunks: Iterable[bytes], callback: Callable, context: Any = None) -> None:
         """
         Scan data in streaming mode, processing each chunk individually.
-        Uses an overlap buffer to catch matches that span chunk boundaries.
+
+        Every search (see `_build_searchers`) remembers the first start
+        position whose result is not known yet and continues from there
+        when the next chunk arrives. Only the text from the earliest such
+        position on is kept between chunks: the maximum match width for
+        bounded patterns, the current line for unbounded patterns that
+        cannot match a newline, and at most `MAX_CARRY` bytes for the rest.
         """
         if not self.compiled_patterns:
             raise RuntimeError('Patterns Database is not compiled')
-        
-        # Buffer to store overlap from previous chunk
-        overlap_buffer = b''
-        total_offset = 0
-        #fix
-        overlap_size = 50240  # Size of overlap to retain between chunks
-        # Track reported matches to avoid duplicates
-        
-        for chunk in data_chunks:
-            # Combine overlap from previous chunk with current chunk
-            combined = overlap_buffer + chunk
-            
-            try:
-                text = combined.decode('utf-8', errors='ignore')
-            except Exception:
-                text = str(combined)
-            
-            # Determine the offset adjustment for this chunk
-            chunk_start_offset = total_offset - len(overlap_buffer)
-            
-            # Scan the combined text
-            for pattern_info in self.compiled_patterns:
-                # Find all overlapping matches by starting search from each position
-                pos = 0
-                while pos < len(text):
-                    match = pattern_info['pattern'].search(text, pos)
-                    if match:
-                        # Adjust match positions to global offsets
-                        match_start = chunk_start_offset + match.start()
-                        match_end = chunk_start_offset + match.end()
-                         # Create unique key for this match
-                       
-                        # Only report matches that are in the "new" part of the chunk
-                        # (not in the overlap region, to avoid duplicates)
-                        
-                            
-                        if match.start() >= len(overlap_buffer) or total_offset == 0:
-                                callback(
-                                    pattern_info['id'],
-                                    match_start,
-                                    match_end,
-                                    0,  # flags
-                                    context
-                            )
-                            
-                        # Move forward by 1 to find overlapping matches
-                        pos = match.start() + 1
-                    else:
-                        break
-            
-            # Update offset and prepare overlap for next iteration
-            total_offset += len(chunk)
-            
-            # Keep the last part of the chunk as overlap for next iteration
-            if len(combined) > overlap_size:
-                overlap_buffer = combined[-overlap_size:]
-            else:
-                overlap_buffer = combined
-            
\ No newline at end of file
+
+        if self.single_match_ids:
+            callback = pattern_flags.single_match(callback, self.single_match_ids)
+        searchers = self.searchers
+        # bytes before a start position kept for \b, ^ and lookbehinds;
+        # at least one, so a kept window never looks like the start of the data
+        behind = max([searcher['behind'] for searcher in searchers] + [1])
+        positions = [0] * len(searchers)
+        text = b''
+        text_offset = 0  # global offset of text[0]
+
+        chunks = iter(data_chunks)
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            final = chunk is None
+            if not final:
+                if not len(chunk):
+                    continue
+                # one copy of the chunk, appended to the kept tail; chunks
+                # may be memoryviews of a buffer the reader reuses
+                text += chunk
+
+            possible = self._possible(text, positions)
+            for i, searcher in enumerate(searchers):
+                limit = len(text) if final else self._final_upto(searcher, text)
+                pos = positions[i]
+                if possible[i]:
+                    for pattern_id, start, end in searcher['finditer'](text, pos):
+                        if start >= limit:
+                            break
+                        if callback(pattern_id, text_offset + start, text_offset + end, 0, context):  # flags = 0
+                            return
+                # positions before the limit are final, matched or not
+                positions[i] = max(pos, limit)
+
+            keep = max(min(positions) - behind, 0)
+            if keep:
+                text = text[keep:]
+                text_offset += keep
+                positions = [pos - keep for pos in positions]
@@ -0,0 +1,292 @@
+import json
+import os
+from multiprocessing.pool import Pool
+from typing import Dict, List, Tuple
+
+from .base_engine import EngineStream, RegexEngine
+from .db_bundle import entry_names, is_bundle, pack_bundle, unpack_bundle
+from .db_cache import DatabaseCache
+from .hs_engine import HyperscanEngine
+
+_MODE_FLAGS = {
+    "block": HyperscanEngine.BLOCK_MODE_FLAGS,
+    "stream": HyperscanEngine.COMPILER_MODE_FLAGS,
+    "vectored": HyperscanEngine.VECTORED_MODE_FLAGS,
+}
+
+
+class _MergedMatches:
+    """
+    Collects the matches of all shards for one piece of data and reports
+    them to the callback in the order of their end offsets, per context,
+    as one database would. Once the callback returned True for a context,
+    its other matches are dropped.
+    """
+
+    def __init__(self, callback, contexts=()):
+        self.callback = callback
+        self.matches = []
+        self.stopped = set()
+        self._order = {context: number for number, context in enumerate(contexts)}
+
+    def collect(self, pattern_id, start, end, flags, context):
+        if context in self.stopped:
+            return True
+        self.matches.append((end, start, pattern_id, flags, context))
+        return False
+
+    def report(self):
+        matches, self.matches = self.matches, []
+        order = self._order
+        matches.sort(key=lambda match: (order.get(match[4], 0), match[0]))
+        for end, start, pattern_id, flags, context in matches:
+            if context not in self.stopped and self.callback(pattern_id, start, end, flags, context):
+                self.stopped.add(context)
+
+
+def _compile_shard(modes, cache, patterns, ids, flags) -> bytes:
+    """Compiles one shard in a worker process, databases go back to the parent serialized"""
+    engine = HyperscanEngine(modes, cache)
+    engine.compile_patterns(patterns, ids, flags)
+    return engine.dumpb()
+
+
+class ShardedEngine(RegexEngine):
+    """
+    Hyperscan patterns split over several databases (shards).
+
+    Patterns are grouped by id into shards of `shard_size` consecutive
+    ids, or with `shard_count` into that many shards of equal size, each
+    compiled by its own HyperscanEngine. Shards are compiled in parallel
+    in a pool of worker processes, so a very large pattern set is not
+    compiled on a single core into one huge database.
+
+    With the stable ids of a PatternStore and the default `shard_size`,
+    adding patterns only changes the last shard and removing a pattern
+    only the shard it was in, so a rebuild compiles just the changed
+    shards and takes the others from the previous build (see
+    `compile_patterns`) or the database cache. Every shard is identified
+    by a key, the `DatabaseCache.key` of its patterns and modes.
+
+    Data is scanned against every shard; the matches of all shards are
+    reported through one callback with the original pattern ids, ordered
+    by end offset within each scanned buffer or stream chunk. A callback
+    returning True stops the scan of all shards.
+    """
+    SHARD_SIZE = 4096
+    COPIES_BUFFERS = True
+
+    def __init__(self, modes=("stream",), cache: DatabaseCache = None, shard_size: int = None,
+                 shard_count: int = None, processes: int = None):
+        """
+        Args:
+            modes: database modes of every shard, see HyperscanEngine
+            cache: on-disk cache of compiled databases (default: no cache)
+            shard_size: ids per shard (default ShardedEngine.SHARD_SIZE)
+            shard_count: split the patterns, ordered by id, into this many
+                shards of equal size instead (default: by shard_size)
+            processes: worker processes compiling the shards
+                (default: os.cpu_count(), 1 compiles in this process)
+        """
+        self.modes = modes
+        self.cache = cache
+        self.shard_size = shard_size or ShardedEngine.SHARD_SIZE
+        self.shard_count = shard_count
+        self.processes = processes
+        self.shards: List[HyperscanEngine] = []
+        self.keys: List[str] = []
+        self.patterns = []
+        self.ids = []
+        self.flags = []
+
+    @staticmethod
+    def partition(patterns, ids, flags, shard_size=None, shard_count=None) -> List[Tuple[List, List, List]]:
+        """(patterns, ids, flags) of every shard, in the order of their ids
+
+        Shards hold `shard_size` consecutive ids, or with `shard_count`
+        the patterns are split into that many shards of equal size.
+        """
+        entries = sorted(zip(ids, patterns, flags), key=lambda entry: entry[0])
+        shards: Dict[int, Tuple[List, List, List]] = {}
+        for position, (pattern_id, pattern, flag) in enumerate(entries):
+            if shard_count:
+                number = position * shard_count // len(entries)
+            else:
+                number = pattern_id // shard_size
+            shard = shards.setdefault(number, ([], [], []))
+            shard[0].append(pattern)
+            shard[1].append(pattern_id)
+            shard[2].append(flag)
+        return [shards[number] for number in sorted(shards)]
+
+    def _shard_key(self, patterns, ids, flags) -> str:
+        mode = 0
+        for name in self.modes:
+            mode |= _MODE_FLAGS[name]
+        return DatabaseCache.key(patterns, ids, flags, mode)
+
+    def compile_patterns(self, patterns, ids=None, flags=None, previous: "ShardedEngine" = None) -> int:
+        """
+        Compiles every shard, except shards with the same key as a shard of
+        `previous` (e.g. loaded from the last build's output), which are
+        taken from it.
+
+        Returns:
+            The number of shards that were compiled.
+        """
+        if ids is None:
+            ids = list(range(len(patterns)))
+        if flags is None:
+            flags = [0] * len(patterns)
+        self.patterns, self.ids, self.flags = patterns, ids, flags
+
+        reusable = dict(zip(previous.keys, previous.shards)) if previous is not None else {}
+        shards = self.partition(patterns, ids, flags, self.shard_size, self.shard_count)
+        self.keys = [self._shard_key(*shard) for shard in shards]
+        missing = [shard for shard, key in zip(shards, self.keys) if key not in reusable]
+        compiled = iter(self._compile_shards(missing))
+
+        self.shards = []
+        for (shard_patterns, shard_ids, shard_flags), key in zip(shards, self.keys):
+            shard = reusable[key] if key in reusable else next(compiled)
+            shard.patterns, shard.ids, shard.flags = shard_patterns, shard_ids, shard_flags
+            self.shards.append(shard)
+        return len(missing)
+
+    def _compile_shards(self, shards) -> List[HyperscanEngine]:
+        """Compiles shards, several of them in parallel in worker processes"""
+        processes = min(self.processes or os.cpu_count() or 1, len(shards))
+        if processes <= 1:
+            engines = []
+            for patterns, ids, flags in shards:
+                engine = HyperscanEngine(self.modes, self.cache)
+                engine.compile_patterns(patterns, ids, flags)
+                engines.append(engine)
+            return engines
+
+        with Pool(processes) as pool:
+            serialized = pool.starmap(_compile_shard, [(self.modes, self.cache, *shard) for shard in shards])
+        engines = []
+        for data in serialized:
+            engine = HyperscanEngine(self.modes, self.cache)
+            engine.loadb(data)
+            engines.append(engine)
+        return engines
+
+    def constructor_options(self):
+        return {"modes": self.modes, "cache": self.cache, "shard_size": self.shard_size,
+                "shard_count": self.shard_count, "processes": self.processes}
+
+    def clone_for_thread(self):
+        """Returns an engine sharing the compiled shards, see HyperscanEngine.clone_for_thread"""
+        clone = ShardedEngine(self.modes, self.cache, self.shard_size, self.shard_count, self.processes)
+        clone.shards = [shard.clone_for_thread() for shard in self.shards]
+        clone.keys, clone.patterns, clone.ids, clone.flags = self.keys, self.patterns, self.ids, self.flags
+        return clone
+
+    def split_context(self):
+        """The widest overlap and lookahead of all shards, None if one of them is unknown"""
+        contexts = [shard.split_context() for shard in self.shards]
+        if not contexts or None in contexts:
+            return None
+        return max(overlap for overlap, _ in contexts), max(lookahead for _, lookahead in contexts)
+
+    def scan(self, data, callback, context=None):
+        merged = _MergedMatches(callback)
+        for shard in self.shards:
+            shard.scan(data, merged.collect, context=context)
+        merged.report()
+
+    def scan_stream(self, data_chunks, callback, context=None):
+        if self.shards and self.shards[0].db is None:
+            # no stream databases were loaded, scan the data as one buffer
+            return self.scan_batch([b"".join(data_chunks)], callback, [context])
+
+        stream = self.open_stream(callback, context=context)
+        try:
+            for chunk in data_chunks:
+                if stream.scan(chunk):
+                    break
+        finally:
+            stream.close()
+
+    def open_stream(self, callback, context=None):
+        """Opens one Hyperscan stream per shard, every chunk is scanned by all of them"""
+        if not self.shards:
+            raise RuntimeError('Patterns Database is not compiled')
+        return EngineStream(self._stream_scanner(callback, context))
+
+    def _stream_scanner(self, callback, context):
+        merged = _MergedMatches(callback)
+        streams = []
+        try:
+            for shard in self.shards:
+                streams.append(shard.open_stream(merged.collect, context=context))
+            while True:
+                chunk = yield bool(merged.stopped)
+                if chunk is None:
+                    break
+                if merged.stopped:
+                    continue
+                for stream in streams:
+                    stream.scan(chunk)
+                merged.report()
+        finally:
+            for stream in streams:
+                stream.close()
+            merged.report()
+
+    def scan_batch(self, buffers, callback, contexts):
+        merged = _MergedMatches(callback, contexts)
+        for shard in self.shards:
+            shard.scan_batch(buffers, merged.collect, contexts)
+        merged.report()
+
+    def dumpb(self, mode=None):
+        """
+        Serializes all shards as a bundle (see engines.db_bundle): the entry
+        "shards" with the shard keys and one entry "shard-N" per shard,
+        holding `HyperscanEngine.dumpb(mode)` of that shard.
+        """
+        if not self.shards:
+            raise RuntimeError("Patterns Database is not compiled")
+        entries = {"shards": json.dumps({"keys": self.keys}).encode()}
+        for number, shard in enumerate(self.shards):
+            entries[f"shard-{number}"] = shard.dumpb(mode)
+        return pack_bundle(entries)
+
+    def loadb(self, data):
+        entries = unpack_bundle(data) if is_bundle(data) else {}
+        if "shards" not in entries:
+            raise ValueError("Not a sharded database")
+        keys = json.loads(entries["shards"])["keys"]
+        shards = []
+        for number in range(len(keys)):
+            shard = HyperscanEngine(self.modes, self.cache)
+            shard.loadb(entries[f"shard-{number}"])
+            shards.append(shard)
+        self.shards, self.keys = shards, keys
+        self.patterns, self.flags = [], []
+        self.ids = [pattern_id for shard in shards for pattern_id in shard.ids]
+
+    @staticmethod
+    def is_sharded_file(filename: str) -> bool:
+        """Whether a file holds a database saved by ShardedEngine"""
+        try:
+            with open(filename, "rb") as f:
+                data = f.read(64 * 1024)
+            return is_bundle(data) and "shards" in entry_names(data)
+        except (OSError, ValueError):
+            return False
+
+    def save_db(self, filename="hs.db", mode=None):
+        serialized = self.dumpb(mode)
+
+        with open(filename, "wb") as f:
+            f.write(serialized)
+
+    def load_db(self, filename):
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        self.loadb(data)
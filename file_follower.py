@@ -0,0 +1,324 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from chunk_window import ChunkWindow
+from file_reader import FileReader
+from file_scanner import FileScanner
+
+# inotify(7) event masks
+_IN_MODIFY = 0x002
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+_LISTING_CHANGES = _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """Waits for changes in directories with inotify, through ctypes (Linux only)."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+
+    @staticmethod
+    def available() -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or None)
+        except OSError:
+            return False
+        return hasattr(libc, "inotify_init1")
+
+    def watch(self, directory: str) -> None:
+        """Reports changes of the files directly in `directory`."""
+        if directory in self._dirs.values():
+            return
+        wd = self._add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for '{directory}'")
+        self._dirs[wd] = directory
+
+    def wait(self, timeout: float) -> List[Tuple[str, int]]:
+        """Returns (path, mask) of the changes of up to `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            directory = self._dirs.get(wd)
+            if directory is not None:
+                events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback for systems without inotify: every wait() just sleeps and reports nothing."""
+
+    def watch(self, directory: str) -> None:
+        pass
+
+    def wait(self, timeout: float) -> List[Tuple[str, int]]:
+        time.sleep(timeout)
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+class _FollowedFile:
+    """A file being followed: its open handle, read offset and open engine stream."""
+
+    def __init__(self, scanner: FileScanner, path: str, offset: int):
+        self.path = path
+        self.handle = open(path, "rb")
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+        self.handle.seek(offset)
+        self._open_stream(scanner, offset)
+
+    def _open_stream(self, scanner: FileScanner, offset: int) -> None:
+        self.offset = offset
+        window = ChunkWindow(self.path, scanner.window_size, offset=offset)
+        # the default open_stream reports matches from its helper thread while read() appends
+        lock = threading.Lock()
+
+        def callback(pattern_id, start, end, flags, context):
+            start += offset
+            end += offset
+            with lock:
+                match = window.read(start, end)
+            scanner._match_callback(pattern_id, start, end, flags, self.path, match)
+
+        self.window, self._window_lock = window, lock
+        self.stream = scanner.engine.open_stream(callback, context=self.path)
+
+    def rename(self, path: str) -> None:
+        self.path = path
+        self.window.filename = path
+
+    def read(self, chunk_size: int) -> None:
+        """Scans the bytes appended since the last read."""
+        while True:
+            chunk = self.handle.read(chunk_size)
+            if not chunk:
+                return
+            with self._window_lock:
+                self.window.append(chunk)
+            self.stream.scan(chunk)
+            self.offset += len(chunk)
+
+    def restart(self, scanner: FileScanner) -> None:
+        """The file was truncated: ends the stream and scans again from the start."""
+        self.close_stream()
+        self.handle.seek(0)
+        self._open_stream(scanner, 0)
+
+    def close_stream(self) -> None:
+        self.stream.close()
+        self.window.close()
+
+    def close(self) -> None:
+        self.close_stream()
+        self.handle.close()
+
+
+class FileFollower:
+    """
+    Follows growing files, like `tail -f`, and scans every appended byte.
+
+    Every followed file keeps its handle and one engine stream open
+    (`RegexEngine.open_stream`), so only new bytes are read and matches
+    spanning several writes are still found. Changes are picked up with
+    inotify, or by polling where it is unavailable. A rotated file (its
+    path now names another file) is read to its end before the new file is
+    followed from its start. A truncated file is scanned again from its start.
+    """
+    POLL_INTERVAL = 0.05
+    # every file is checked at least this often, also with inotify
+    RESCAN_INTERVAL = 1.0
+
+    def __init__(self, scanner: FileScanner, chunk_size: int = None, from_start: bool = False,
+                 poll_interval: float = None, use_inotify: bool = True):
+        """
+        Args:
+            scanner: FileScanner whose engine (with compiled patterns) and
+                output are used
+            chunk_size: Size of the reads of appended data (default FileReader.CHUNK_SIZE)
+            from_start: Scan the files present at the start from their
+                beginning instead of their current end
+            poll_interval: Seconds between checks when polling
+                (default FileFollower.POLL_INTERVAL)
+            use_inotify: Use inotify when it is available
+        """
+        self.scanner = scanner
+        self.chunk_size = chunk_size or FileReader.CHUNK_SIZE
+        self.from_start = from_start
+        self.poll_interval = poll_interval or FileFollower.POLL_INTERVAL
+        self.use_inotify = use_inotify and InotifyWatcher.available()
+        self.files: Dict[str, _FollowedFile] = {}
+        self._stop = threading.Event()
+        self._tree = False
+
+    def stop(self) -> None:
+        """Makes follow() return, e.g. from another thread."""
+        self._stop.set()
+
+    def follow(self, target: str, follow_symlinks: bool = False) -> None:
+        """
+        Follows a file, or all files of a directory tree (including files
+        created later), until stop() is called or the process is interrupted.
+        """
+        target = os.path.abspath(target)
+        if not os.path.exists(target):
+            print(f"cannot access '{target}': No such file or directory")
+            return
+
+        self._tree = os.path.isdir(target)
+        watcher = InotifyWatcher() if self.use_inotify else PollingWatcher()
+        timeout = FileFollower.RESCAN_INTERVAL if self.use_inotify else self.poll_interval
+        try:
+            self._refresh(target, watcher, follow_symlinks, start=True)
+            last_rescan = time.monotonic()
+            while not self._stop.is_set():
+                events = watcher.wait(min(timeout, FileFollower.RESCAN_INTERVAL))
+                self.scanner.results = []
+                if not events or time.monotonic() - last_rescan >= FileFollower.RESCAN_INTERVAL:
+                    self._refresh(target, watcher, follow_symlinks)
+                    for path in list(self.files):
+                        self._check(path)
+                    last_rescan = time.monotonic()
+                else:
+                    if any(mask & _LISTING_CHANGES for _, mask in events):
+                        self._refresh(target, watcher, follow_symlinks)
+                    for path in {path for path, _ in events}:
+                        if path in self.files:
+                            self._check(path)
+                # matches are reported right away, not when the sink's buffer is full
+                if self.scanner.sink is not None:
+                    self.scanner.sink.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for followed in self.files.values():
+                followed.close()
+            self.files = {}
+            watcher.close()
+            if self.scanner.sink is not None:
+                self.scanner.sink.flush()
+
+    def _refresh(self, target: str, watcher, follow_symlinks: bool, start: bool = False) -> None:
+        """Starts following files that appeared (and watching new directories)."""
+        if self._tree:
+            paths = []
+            for dirpath, dirnames, filenames in os.walk(target, followlinks=follow_symlinks):
+                watcher.watch(dirpath)
+                paths.extend(os.path.join(dirpath, name) for name in filenames)
+        else:
+            # the directory is watched, so a rotated file's replacement is noticed
+            watcher.watch(os.path.dirname(target))
+            paths = [target]
+
+        # a followed file found under a new name was renamed (rotated) in the tree
+        inodes = {followed.inode: followed for followed in self.files.values()}
+        for path in paths:
+            if path in self.files:
+                continue
+            try:
+                followed = inodes.get(os.stat(path).st_ino)
+            except OSError:
+                continue
+            if followed is not None and self._replaced(followed.path, followed.inode):
+                del self.files[followed.path]
+                followed.rename(path)
+                self.files[path] = followed
+                followed.read(self.chunk_size)
+
+        for path in paths:
+            if path in self.files or not os.path.isfile(path):
+                continue
+            try:
+                offset = 0 if self.from_start or not start else os.path.getsize(path)
+                self.files[path] = _FollowedFile(self.scanner, path, offset)
+            except OSError as e:
+                print(f"An error occurred while trying to follow file: '{path}': {e}")
+                continue
+            if not start:
+                self._check(path)
+
+    @staticmethod
+    def _replaced(path: str, inode: int) -> bool:
+        """Whether `path` no longer names the file with this inode"""
+        try:
+            return os.stat(path).st_ino != inode
+        except FileNotFoundError:
+            return True
+
+    @staticmethod
+    def _renamed(followed: _FollowedFile):
+        """New path of a followed file renamed within its directory, or None"""
+        try:
+            with os.scandir(os.path.dirname(followed.path)) as entries:
+                for entry in entries:
+                    if entry.inode() == followed.inode and entry.is_file(follow_symlinks=False):
+                        return entry.path
+        except OSError:
+            pass
+        return None
+
+    def _check(self, path: str) -> None:
+        """Scans what was appended to a file and handles truncation and rotation."""
+        followed = self.files[path]
+        try:
+            if os.fstat(followed.handle.fileno()).st_size < followed.offset:
+                followed.restart(self.scanner)
+            if not self._replaced(path, followed.inode):
+                followed.read(self.chunk_size)
+                return
+
+            # rotated or deleted: the old file is read to its end, under its new name
+            # if it is still in the same directory, and followed on if that is in the tree
+            del self.files[path]
+            renamed = self._renamed(followed)
+            if renamed is not None:
+                followed.rename(renamed)
+            followed.read(self.chunk_size)
+            if renamed is not None and self._tree and renamed not in self.files:
+                self.files[renamed] = followed
+            else:
+                followed.close()
+            if os.path.isfile(path):
+                self.files[path] = _FollowedFile(self.scanner, path, 0)
+                self.files[path].read(self.chunk_size)
+        except Exception as e:
+            print(f"An error occurred while trying to follow file: '{path}': {e}")
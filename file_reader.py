@@ -1,10 +1,53 @@
+import bz2
+import gzip
+import io
+import lzma
+import mmap
 import os
-from typing import Iterable
+import tarfile
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+from prefetch_reader import PrefetchReader
+
+# magic bytes at the start of the compressed formats and archives FileReader.members unpacks
+_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"PK\x03\x04", "zip"),
+)
+_TAR_MAGIC = b"ustar"
+_TAR_MAGIC_OFFSET = 257
+
+
+class _Prepended(io.RawIOBase):
+    """A stream whose first bytes were already read to detect its format: they are read again first"""
+
+    def __init__(self, head: bytes, stream: BinaryIO):
+        self.head = head
+        self.stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.head:
+            n = min(len(buffer), len(self.head))
+            buffer[:n] = self.head[:n]
+            self.head = self.head[n:]
+            return n
+        return self.stream.readinto(buffer)
 
 
 class FileReader:
     """Class for validating file paths and reading files in binary chunks"""
     CHUNK_SIZE = 4096
+    MODES = ("read", "mmap", "readinto", "prefetch")
+    # bytes read to detect a compressed format or archive
+    HEAD_SIZE = 512
+    # chunks of decompressed data are larger, a decompressor works best on big blocks
+    DECOMPRESSED_CHUNK_SIZE = 1024 * 1024
 
     @staticmethod
     def validate(file_path: str):
@@ -15,7 +58,9 @@ class FileReader:
             raise ValueError(f"{file_path} is not a file")
 
     @staticmethod
-    def chunks(file_path: str, chunk_size: int = None, full_file: bool = False) -> Iterable[bytes]:
+    def chunks(file_path: str, chunk_size: int = None, full_file: bool = False,
+               offset: int = 0, length: int = None, mode: str = "read",
+               prefetch_depth: int = None, reuse_buffers: bool = True) -> Iterable[bytes]:
         """
         Yield file content in binary chunks.
 
@@ -31,23 +76,220 @@ class FileReader:
                 `FileReader.CHUNK_SIZE` is used.
             full_file (bool, optional):
                 If True, read entire file as single chunk (default: False)
+            offset (int, optional):
+                Byte offset at which reading starts (default: 0)
+            length (int, optional):
+                Maximum number of bytes to read. If not provided, the file
+                is read until its end.
+            mode (str, optional):
+                One of `FileReader.MODES`:
+                "read" - every chunk is a new `bytes` object (default),
+                "mmap" - the file is memory-mapped and chunks are read-only
+                `memoryview` slices of the mapping, with full_file the whole
+                mapping is yielded as one view,
+                "readinto" - chunks are `memoryview`s of one preallocated
+                buffer that is overwritten by the next chunk, so a consumer
+                must copy a chunk it wants to keep; with full_file the file
+                is read as in "read" mode,
+                "prefetch" - like "readinto", but chunks are read ahead by a
+                background thread into a small pool of reused buffers (see
+                `PrefetchReader`); with full_file the file is read as in
+                "read" mode.
+            prefetch_depth (int, optional):
+                In "prefetch" mode, the maximum number of chunks read ahead
+                (default `PrefetchReader.DEFAULT_DEPTH`).
+            reuse_buffers (bool, optional):
+                In "readinto" and "prefetch" modes, whether chunks are
+                views of reused buffers (default). With False every chunk
+                is a new `bytes` object, which saves a copy for consumers
+                that would copy every chunk anyway (see
+                `RegexEngine.COPIES_BUFFERS`); "readinto" then reads as
+                "read" does.
         """
 
         FileReader.validate(file_path)
 
+        if mode not in FileReader.MODES:
+            raise ValueError(f"Unknown read mode '{mode}', expected one of {FileReader.MODES}")
+        if chunk_size is None:
+            chunk_size = FileReader.CHUNK_SIZE
+
         with open(file_path, "rb") as f:
-            if full_file:
+            if mode == "mmap":
+                yield from FileReader._mmap_chunks(f, chunk_size, full_file, offset, length)
+                return
+
+            if offset:
+                f.seek(offset)
+            remaining = -1 if length is None else length
+
+            if mode == "prefetch" and not full_file:
+                yield from PrefetchReader(f, chunk_size, None if remaining < 0 else remaining, prefetch_depth,
+                                          reuse_buffers)
+            elif mode == "readinto" and not full_file and reuse_buffers:
+                # a file-sized buffer would be copied by every consumer that keeps it
+                yield from FileReader._readinto_chunks(f, chunk_size, remaining)
+            elif full_file:
                 # Read entire file as single chunk
-                data = f.read()
+                data = f.read(remaining)
                 if data:
                     yield data
             else:
                 # Read file in chunks
-                if chunk_size is None:
-                    chunk_size = FileReader.CHUNK_SIZE
-
-                while True:
-                    chunk = f.read(chunk_size)
+                while remaining:
+                    chunk = f.read(chunk_size if remaining < 0 else min(chunk_size, remaining))
                     if not chunk:
                         break
+                    if remaining > 0:
+                        remaining -= len(chunk)
                     yield chunk
+
+    @staticmethod
+    def _readinto_chunks(f: BinaryIO, chunk_size: int, remaining: int) -> Iterable[memoryview]:
+        """Fill one preallocated buffer with consecutive chunks of `f`."""
+        view = memoryview(bytearray(chunk_size))
+        while remaining:
+            n = f.readinto(view if remaining < 0 or remaining >= chunk_size else view[:remaining])
+            if not n:
+                break
+            if remaining > 0:
+                remaining -= n
+            yield view[:n]
+
+    @staticmethod
+    def _mmap_chunks(f: BinaryIO, chunk_size: int, full_file: bool,
+                     offset: int, length: int) -> Iterable[memoryview]:
+        """Yield read-only slices of a memory mapping of `f`."""
+        size = os.fstat(f.fileno()).st_size
+        end = size if length is None else min(size, offset + length)
+        if end <= offset:
+            return
+
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        if full_file:
+            yield view[offset:end]
+        else:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapping.madvise(mmap.MADV_SEQUENTIAL)
+            dropped = offset - offset % mmap.PAGESIZE
+            for start in range(offset, end, chunk_size):
+                stop = min(start + chunk_size, end)
+                yield view[start:stop]
+                # the consumer is done with the chunk: unmap its pages from this process, so
+                # RSS does not grow with the file; they stay in the page cache and a retained
+                # slice that is read again faults them back in
+                consumed = stop - stop % mmap.PAGESIZE
+                if consumed > dropped and hasattr(mmap, "MADV_DONTNEED"):
+                    mapping.madvise(mmap.MADV_DONTNEED, dropped, consumed - dropped)
+                    dropped = consumed
+        # slices held by the consumer keep the mapping alive, it is unmapped
+        # when the last of them is released
+        view.release()
+
+    @staticmethod
+    def detect_format(head: bytes) -> Optional[str]:
+        """Compressed format or archive ("gzip", "bz2", "xz", "zstd", "zip", "tar") of data
+        starting with `head` (its first HEAD_SIZE bytes), or None"""
+        for magic, name in _MAGIC:
+            if head.startswith(magic):
+                return name
+        if head.startswith(b"BZh") and head[4:10] == b"1AY&SY":
+            return "bz2"
+        if head[_TAR_MAGIC_OFFSET:_TAR_MAGIC_OFFSET + len(_TAR_MAGIC)] == _TAR_MAGIC:
+            return "tar"
+        return None
+
+    @staticmethod
+    def compression(file_path: str) -> Optional[str]:
+        """Format of a file by its magic bytes, see detect_format"""
+        with open(file_path, "rb") as f:
+            return FileReader.detect_format(f.read(FileReader.HEAD_SIZE))
+
+    @staticmethod
+    def members(file_path: str, chunk_size: int = None,
+                prefetch_depth: int = None) -> Iterator[Tuple[Optional[str], Iterable[memoryview]]]:
+        """
+        Yield the decompressed content of a compressed file or archive.
+
+        gzip, bz2, xz and zstd files are decompressed as a stream, and
+        when the decompressed data is a tar archive (.tar.gz, ...) or the
+        file is a tar or zip archive, every regular member is yielded on
+        its own. Archives inside archives are not unpacked.
+
+        Decompression runs in a background thread (see PrefetchReader),
+        so it overlaps with the scan of the previous chunks. A member's
+        chunks must be consumed before the next member is requested; they
+        are `memoryview`s of reused buffers, like in "prefetch" mode.
+
+        Args:
+            file_path (str):
+                Path to the compressed file or archive.
+            chunk_size (int, optional):
+                Size of the decompressed chunks (default
+                `FileReader.DECOMPRESSED_CHUNK_SIZE`).
+            prefetch_depth (int, optional):
+                Maximum number of chunks decompressed ahead (default
+                `PrefetchReader.DEFAULT_DEPTH`).
+
+        Yields:
+            (member path, chunks) pairs, the member path is None for a
+            compressed file that is not an archive.
+        """
+        FileReader.validate(file_path)
+        chunk_size = chunk_size or FileReader.DECOMPRESSED_CHUNK_SIZE
+
+        with open(file_path, "rb") as f:
+            file_format = FileReader.detect_format(f.read(FileReader.HEAD_SIZE))
+            f.seek(0)
+            if file_format is None:
+                raise ValueError(f"{file_path} is not a compressed file or archive")
+
+            if file_format == "zip":
+                with zipfile.ZipFile(f) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        with archive.open(info) as member:
+                            yield from FileReader._member(info.filename, member, chunk_size, prefetch_depth)
+                return
+
+            stream = f if file_format == "tar" else FileReader._decompressor(f, file_format)
+            try:
+                head = stream.read(FileReader.HEAD_SIZE)
+                data = _Prepended(head, stream)
+                if FileReader.detect_format(head) != "tar":
+                    yield from FileReader._member(None, data, chunk_size, prefetch_depth)
+                    return
+                with tarfile.open(fileobj=data, mode="r|") as archive:
+                    for info in archive:
+                        if info.isfile():
+                            member = archive.extractfile(info)
+                            yield from FileReader._member(info.name, member, chunk_size, prefetch_depth)
+            finally:
+                if stream is not f:
+                    stream.close()
+
+    @staticmethod
+    def _member(name: Optional[str], stream: BinaryIO, chunk_size: int,
+                prefetch_depth: int) -> Iterator[Tuple[Optional[str], Iterable[memoryview]]]:
+        chunks = iter(PrefetchReader(stream, chunk_size, None, prefetch_depth))
+        try:
+            yield name, chunks
+        finally:
+            # the reader thread must be done with this member before the archive moves on
+            chunks.close()
+
+    @staticmethod
+    def _decompressor(f: BinaryIO, file_format: str) -> BinaryIO:
+        if file_format == "gzip":
+            return gzip.GzipFile(fileobj=f)
+        if file_format == "bz2":
+            return bz2.BZ2File(f)
+        if file_format == "xz":
+            return lzma.LZMAFile(f)
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("reading zstd files needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(f)
@@ -1,3 +1,8 @@
+import re
+
+from engines.pattern_flags import NAMES, SINGLEMATCH, SOM_LEFTMOST
+
+
 class FileRegex():
     def __init__(self, filename):
         self.plik = filename
@@ -24,15 +29,80 @@ class FileRegex():
                 if line.strip()==text:
                     return True
         return False
+    @staticmethod
+    def split_options(text):
+        """
+        Splits a line into the pattern and its options.
+
+        Commas may occur in the pattern itself (e.g. `a{2,}`), so the line
+        is split at the first comma followed only by known options. If there
+        is none, it is split at the first comma followed only by words that
+        look like options (so that a misspelt option gets a warning), and
+        otherwise the whole line is the pattern.
+        """
+        commas = [i for i, char in enumerate(text) if char == ","]
+        for known in (True, False):
+            for i in commas:
+                options = [option for option in re.split(r"[,\s]+", text[i + 1:].strip()) if option]
+                if options and all(FileRegex._is_option(option, known) for option in options):
+                    return text[:i], text[i + 1:]
+        return text, ""
+
+    @staticmethod
+    def _is_option(option, known):
+        name, _, value = option.partition("=")
+        if known:
+            return (name == "id" and value.isdigit()) or (not value and name.lower() in NAMES)
+        return re.fullmatch(r"[A-Za-z][\w-]*(=\w*)?", option) is not None
+
+    def entries(self, auto_ids=True):
+        """
+        Patterns with their options, as (pattern, id, flags) per line.
+
+        Options follow a comma (see `split_options`), separated by commas
+        or spaces: the flags of `engines.pattern_flags.NAMES` (caseless,
+        dotall, multiline, single-match, som, no-som) and `id=N`. A line
+        without an id gets its position among the patterns, or None with
+        auto_ids=False (e.g. for PatternStore.add, which assigns the ids).
+        A duplicate id, or `single-match` together with `som`, raises
+        ValueError.
+        """
+        entries = []
+        ids = set()
+        with open(self.plik, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                text = line.strip()
+                if not text:
+                    continue
+                pattern, options = FileRegex.split_options(text)
+                pattern_id = len(entries) if auto_ids else None
+                flags = 0
+                for option in re.split(r"[,\s]+", options.strip()):
+                    if not option:
+                        continue
+                    name, _, value = option.partition("=")
+                    if name == "id" and value.isdigit():
+                        pattern_id = int(value)
+                    elif not value and name.lower() in NAMES:
+                        flags |= NAMES[name.lower()]
+                    else:
+                        print(f"Warning: unknown pattern option '{option}' in line {number} of '{self.plik}'")
+                if flags & SINGLEMATCH and flags & SOM_LEFTMOST:
+                    raise ValueError(f"Options 'single-match' and 'som' cannot be combined (Hyperscan rejects it) "
+                                     f"in line {number} of '{self.plik}'")
+                if pattern_id is not None and pattern_id in ids:
+                    raise ValueError(f"Duplicate pattern id {pattern_id} in line {number} of '{self.plik}'")
+                ids.add(pattern_id)
+                entries.append((pattern.strip(), pattern_id, flags))
+        return entries
+
     def elements(self):
         patterns=[] #then correct it in choose_elements
         with open(self.plik, "r",encoding="utf-8") as f:
             for line in f:
                 text = line.strip()
                 if text:
-                    before_comma = text.split(",", 1)[0].strip()
-                    # print(before_comma)
-                    patterns.append(before_comma)
+                    patterns.append(FileRegex.split_options(text)[0].strip())
         return patterns
 
  
\ No newline at end of file
@@ -1,73 +1,569 @@
+import itertools
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing.pool import Pool
 from re import match
-from typing import List, Dict
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+from engines import pattern_flags
 from engines.base_engine import RegexEngine  
 from engines.hs_engine import HyperscanEngine 
 from engines.python_engine import PythonEngine
+from engines.pattern_width import can_match_newline, context_width
+from chunk_profile import ChunkProfile
+from chunk_window import ChunkWindow
 from file_reader import FileReader
+from match_sink import MatchSink
+from pattern_store import PatternStore
+from prefetch_reader import PrefetchReader
+from scan_index import ScanIndex
+from tree_walker import TreeWalker
+from file_regex.file_regex import FileRegex
 from pathlib import Path
 
 
 class FileScanner:
     """Class for scanning files using various regex engines"""
+    BATCH_BYTES = 4 * 1024 * 1024
     
-    def __init__(self, engine: RegexEngine = None):
+    def __init__(self, engine: RegexEngine = None, window_size: int = None, read_mode: str = "read",
+                 chunk_profile: ChunkProfile = None, batch_file_size: int = None,
+                 block_max_size: int = None, prefetch_depth: int = None, sink: MatchSink = None,
+                 index: ScanIndex = None, count: bool = False, files_with_matches: bool = False,
+                 max_matches: int = None, decompress: bool = True, keep_results: bool = True):
         """
         Args:
             engine: Implementacja RegexEngine (domyślnie HyperscanEngine)
+            window_size: Number of recently read bytes kept in memory for
+                extracting match text (default ChunkWindow.DEFAULT_WINDOW_SIZE)
+            read_mode: How files are read, one of FileReader.MODES (default "read")
+            chunk_profile: Calibrated chunk sizes (see `main.py calibrate`) used
+                when no explicit chunk size is given
+            batch_file_size: scan_tree reads files up to this size whole and
+                scans them in batches with engine.scan_batch (default: disabled)
+            block_max_size: scan_file reads files up to this size whole and
+                scans them in block mode, larger files are streamed
+                (default: disabled, every file is streamed)
+            prefetch_depth: With read_mode "prefetch", how many chunks (when
+                streaming) or whole files (in scan_tree) are read ahead by a
+                background thread (default PrefetchReader.DEFAULT_DEPTH)
+            sink: Output every match is written to, shared by scanners
+                running in several threads (default: printed directly)
+            index: Files scanned before; scan_tree and scan_file_incremental
+                skip unchanged files and scan only the appended part of
+                grown ones (default: every file is scanned whole)
+            count: Report the number of matches of every pattern per file
+                instead of the matches
+            files_with_matches: Report only the names of files with a match;
+                the scan of a file stops at its first match
+            max_matches: Report at most this many matches of every pattern
+                per file; the scan of a file stops once every pattern
+                reached the limit (default: no limit)
+            decompress: Scan the decompressed content of compressed files
+                and the members of archives, detected by their magic bytes
+                (see scan_compressed)
+            keep_results: Collect the reported matches in `results` and
+                return them from the scan methods. Turn it off when a sink
+                writes the matches out, so memory does not grow with their
+                number (the scan methods then return empty lists)
         """
         self.engine = engine or HyperscanEngine()
         #self.engine = engine or PythonEngine()  #for comparison
+        self.window_size = window_size
+        self.read_mode = read_mode
+        self.chunk_profile = chunk_profile
+        self.batch_file_size = batch_file_size
+        self.block_max_size = block_max_size
+        self.prefetch_depth = prefetch_depth
+        self.sink = sink
+        self.index = index
+        self.count = count
+        self.files_with_matches = files_with_matches
+        self.max_matches = max_matches
+        self.decompress = decompress
+        self.keep_results = keep_results
+        # matches per pattern of the files being scanned, with count,
+        # files_with_matches or max_matches
+        self._counts: Dict[str, Dict[int, int]] = {}
+        self.results = []
 
-    def compile_patterns(self, patterns: List[str]) -> None:
-        """Compiles patterns as bytes"""
+    def compile_patterns(self, patterns: List[str], ids: List[int] = None, flags: List[int] = None) -> None:
+        """Compiles patterns as bytes, with optional ids and `engines.pattern_flags` flags per pattern"""
         pattern_bytes = [pattern.encode('utf-8') for pattern in patterns]
-        self.engine.compile_patterns(pattern_bytes)
+        self.engine.compile_patterns(pattern_bytes, ids, flags)
+
+    def compile_pattern_file(self, patterns_path: str) -> None:
+        """Compiles a text file with one regex per line and its options (see FileRegex.entries),
+        or the patterns of a PatternStore"""
+        if PatternStore.is_store(patterns_path):
+            with PatternStore(patterns_path) as store:
+                entries = store.entries()
+        else:
+            entries = FileRegex(patterns_path).entries()
+        patterns, ids, flags = (list(column) for column in zip(*entries)) if entries else ([], [], [])
+        self.compile_patterns(patterns, ids, flags)
+
+    def load_patterns(self, patterns_path: str) -> None:
+        """Loads a compiled Hyperscan database or compiles a text file with regexes
+
+        Args:
+            patterns_path: path to a database created by the build command
+                or to a text file with regexes (one per line) or a PatternStore
+        """
+        try:
+            self.engine.load_db(patterns_path)
+        except Exception:
+            self.compile_pattern_file(patterns_path)
     
-    def _match_callback(self, pattern_id: int, start: int, end: int, flags: int, filename: str):
+    def _match_callback(self, pattern_id: int, start: int, end: int, flags: int, filename: str,
+                        match: bytes) -> bool:
         """Callback triggered when a match is found
+
+        Args:
+            match: bytes of the match, taken from the scan buffer
+
+        Returns:
+            True when no more matches of the file are needed, which stops
+            the engine's scan of it (see files_with_matches and max_matches)
         """
+        counts = None
+        if self.count or self.files_with_matches or self.max_matches is not None:
+            counts = self._counts.setdefault(filename, {})
+            if self.files_with_matches:
+                if not counts:
+                    counts[pattern_id] = 1
+                    self._report({"filename": filename})
+                return True
+            seen = counts.get(pattern_id, 0)
+            if self.max_matches is not None and seen >= self.max_matches:
+                return self._limit_reached(counts)
+            counts[pattern_id] = seen + 1
+            if self.count:
+                return self._limit_reached(counts)
 
-        with open(filename, "r") as f:
-            f.seek(start)
-            match = f.read(end - start)
+        self._report({
+            "pattern_id": pattern_id,
+            "start": start,
+            "end": end,
+            "match": match.decode("utf-8", errors="replace"),
+            "filename": filename,
+        })
+        return counts is not None and self._limit_reached(counts)
 
-        print(f"Regex with ID: {pattern_id}, filename: '{filename}', from: {start} end: {end}, match: '{match}'")
+    def _limit_reached(self, counts: Dict[int, int]) -> bool:
+        """
+        Whether every pattern has max_matches matches in a file.
 
-    def scan_file(self, filename: str, chunk_size: int = 4096,full_file: bool = False) -> None:
-        """Scans file in streaming mode (STREAM mode)
+        Patterns are counted by their ids, which loaded Hyperscan and
+        sharded databases also know (from the bundle) without the pattern list.
+        """
+        patterns = len(set(self.engine.ids))
+        return (self.max_matches is not None and patterns > 0 and len(counts) >= patterns
+                and min(counts.values()) >= self.max_matches)
+
+    def _report(self, result: Dict) -> None:
+        if self.keep_results:
+            self.results.append(result)
+        if self.sink is not None:
+            self.sink.write(result)
+            return
+        print(MatchSink.format(result))
+
+    def _finish(self, filenames: Iterable[str]) -> None:
+        """Ends the scan of files: with count, reports their matches per pattern"""
+        for filename in filenames:
+            counts = self._counts.pop(filename, None)
+            if self.count and not self.files_with_matches and counts:
+                for pattern_id in sorted(counts):
+                    self._report({"pattern_id": pattern_id, "count": counts[pattern_id], "filename": filename})
+
+    def _chunk_size_for(self, size: int) -> int:
+        """Chunk size for reading `size` bytes, taken from the chunk profile if there is one"""
+        if self.chunk_profile is None:
+            return FileReader.CHUNK_SIZE
+        return self.chunk_profile.chunk_size_for(self.engine, size)
+
+    def scan_file(self, filename: str, chunk_size: int = None,full_file: bool = None,
+                  data: bytes = None) -> List[Dict]:
+        """Scans file in block mode (BLOCK mode) or streaming mode (STREAM mode)
         
+        Recently read chunks are kept in a ChunkWindow, so the text of a
+        match is sliced from memory instead of reopening the file.
+
         Args:
             filename: file path
-            chunk_size: Chunk size in bytes for scanning file (default 4096)
-            full_file: If True, read entire file as single chunk (default False)
+            chunk_size: Chunk size in bytes for scanning file (default: picked
+                from the chunk profile and the file size, 4096 without a profile)
+            full_file: If True, read entire file as single block and scan it
+                with engine.scan, if False stream it in chunks. By default
+                files up to block_max_size are scanned as a block.
+            data: Content of the file, already read (e.g. ahead by scan_tree);
+                it is scanned as a block instead of reading the file
         """
+        self.results = []
+        window = ChunkWindow(filename, self.window_size)
+        compressed = False
 
         def callback(pattern_id, start, end, flags, context):
-            self._match_callback(pattern_id, start, end, flags, filename)
+            return self._match_callback(pattern_id, start, end, flags, filename, window.read(start, end))
 
         try:
-            self.engine.scan_stream(FileReader.chunks(filename, chunk_size=chunk_size,full_file=full_file), callback, context=filename)
+            size = os.path.getsize(filename) if data is None else len(data)
+            if data is not None:
+                full_file = True
+            elif full_file is None:
+                full_file = self.block_max_size is not None and size <= self.block_max_size
+
+            with window:
+                if full_file:
+                    if data is not None:
+                        reader = iter([data] if data else [])
+                    else:
+                        # a mapping of the whole file would be resident next to the engine's copy
+                        mode = "read" if getattr(self.engine, "COPIES_BUFFERS", False) else self.read_mode
+                        reader = FileReader.chunks(filename, full_file=True, mode=mode)
+                else:
+                    if chunk_size is None:
+                        chunk_size = self._chunk_size_for(size)
+                    reader = FileReader.chunks(filename, chunk_size=chunk_size, mode=self.read_mode,
+                                               prefetch_depth=self.prefetch_depth,
+                                               reuse_buffers=not getattr(self.engine, "COPIES_BUFFERS", False))
+                # the format is told from the first chunks, the file is not opened for it separately
+                head, chunks = FileScanner._head(window.track(reader))
+                if self.decompress and FileReader.detect_format(head) is not None:
+                    compressed = True
+                    if hasattr(reader, "close"):
+                        reader.close()
+                elif full_file:
+                    for data in chunks:
+                        self.engine.scan(data, callback, context=filename)
+                else:
+                    self.engine.scan_stream(chunks, callback, context=filename)
             
         except Exception as e:
             print(f"An error occurred while trying to scan file: '{filename}': {e}")
 
-    def scan_tree(self, root, follow_symlinks=False, full_file=False) -> None:
+        if compressed:
+            return self.scan_compressed(filename)
+        self._finish([filename])
+        return self.results
+
+    @staticmethod
+    def _head(chunks: Iterator) -> Tuple[bytes, Iterator]:
+        """The first FileReader.HEAD_SIZE bytes of a chunk stream, and the whole stream
+        (the chunks read for the head must not be reused by the reader, see ChunkWindow.track)"""
+        leading = []
+        size = 0
+        for chunk in chunks:
+            leading.append(chunk)
+            size += len(chunk)
+            if size >= FileReader.HEAD_SIZE:
+                break
+        head = b"".join(bytes(chunk[:FileReader.HEAD_SIZE]) for chunk in leading)[:FileReader.HEAD_SIZE]
+        return head, itertools.chain(leading, chunks)
+
+    def scan_compressed(self, filename: str) -> List[Dict]:
+        """Scans the decompressed content of a compressed file, or every member of an archive
+
+        Matches in archive members are reported with the file name
+        "archive!member/path". Offsets are positions in the decompressed
+        data of the file or member. Decompression runs in a background
+        thread (see FileReader.members) and decompressed data cannot be
+        read again, so the text of a match longer than the match window
+        is cut to the window.
+
+        Args:
+            filename: path of a compressed file or archive
+        """
+        self.results = []
+        names = []
+        try:
+            for member, chunks in FileReader.members(filename, prefetch_depth=self.prefetch_depth):
+                name = filename if member is None else f"{filename}!{member}"
+                names.append(name)
+                window = ChunkWindow(None, self.window_size)
+
+                def callback(pattern_id, start, end, flags, context, window=window):
+                    return self._match_callback(pattern_id, start, end, flags, context, window.read(start, end))
+
+                with window:
+                    self.engine.scan_stream(window.track(chunks), callback, context=name)
+        except Exception as e:
+            print(f"An error occurred while trying to scan file: '{filename}': {e}")
+
+        self._finish(names)
+        return self.results
+
+    def scan_range(self, filename: str, start: int, end: int, overlap: int, lookahead: int = 0,
+                   chunk_size: int = None) -> List[Tuple[int, int, int, bytes]]:
+        """Scans the byte range [start, end) of a file without reporting matches
+
+        Nothing past `end` is read: the scan ends there as if the file did,
+        so a match within `lookahead` bytes of `end` (where `$` or `\\b`
+        would see that end) is left to the range after it, unless `end` is
+        the end of the file. Matches ending within `lookahead` bytes before
+        `start` belong to this range instead. Scanning begins `overlap` bytes
+        before them, so with the overlap and lookahead of `split_context`
+        every match is found with the same offsets a scan of the whole file
+        would give, in exactly one range.
+
+        Args:
+            filename: file path
+            start: first byte of the range
+            end: end of the range (exclusive)
+            overlap: number of bytes scanned before the range
+            lookahead: number of bytes a pattern may look at after a match
+            chunk_size: Chunk size in bytes for scanning file (default: picked
+                from the chunk profile and the range size)
+
+        Returns:
+            (pattern_id, start, end, match) tuples with file offsets for the
+            matches that belong to the range
+        """
+        matches = []
+        first = max(start - lookahead, 0)
+        last = end if end >= os.path.getsize(filename) else end - lookahead
+        window_start = max(first - overlap, 0)
+        if chunk_size is None:
+            chunk_size = self._chunk_size_for(end - window_start)
+        window = ChunkWindow(filename, self.window_size, offset=window_start)
+
+        def callback(pattern_id, match_start, match_end, flags, context):
+            match_start += window_start
+            match_end += window_start
+            if first < match_end <= last:
+                matches.append((pattern_id, match_start, match_end, window.read(match_start, match_end)))
+
+        with window:
+            chunks = FileReader.chunks(filename, chunk_size=chunk_size,
+                                       offset=window_start, length=end - window_start,
+                                       mode=self.read_mode, prefetch_depth=self.prefetch_depth,
+                                       reuse_buffers=not getattr(self.engine, "COPIES_BUFFERS", False))
+            self.engine.scan_stream(window.track(chunks), callback, context=filename)
+
+        return matches
+
+    def scan_appended(self, filename: str, offset: int, size: int) -> List[Dict]:
+        """Scans the bytes a file grew by and reports the matches ending in them
+
+        Matches ending up to `offset` were reported by an earlier scan.
+        Scanning begins the maximum match width of the patterns before
+        `offset`, so matches straddling the old end of the file are found
+        with their whole-file offsets. If the width is unknown, see
+        `_resume_overlap`.
+
+        Args:
+            filename: file path
+            offset: size of the file when it was scanned before
+            size: current size of the file
+        """
+        self.results = []
+        context = self.engine.split_context()
+        try:
+            overlap = self._resume_overlap(filename, offset) if context is None else context[0]
+            for pattern_id, start, end, match in self.scan_range(filename, offset, size, overlap):
+                if self._match_callback(pattern_id, start, end, 0, filename, match):
+                    break
+        except Exception as e:
+            print(f"An error occurred while trying to scan file: '{filename}': {e}")
+        self._finish([filename])
+        return self.results
+
+    def _resume_overlap(self, filename: str, offset: int) -> int:
+        """Bytes before `offset` that scan_appended rescans for unbounded patterns
+
+        If no pattern can match a newline, a match ending after `offset`
+        starts after the last newline before it, so scanning begins there
+        (plus what the patterns look at behind a match). Otherwise, or
+        without a newline in reach, at most `PythonEngine.MAX_CARRY` bytes
+        are rescanned, the most the stream scans carry between chunks too;
+        longer matches straddling the old end of the file are missed.
+        """
+        overlap = min(offset, PythonEngine.MAX_CARRY)
+        patterns = [pattern_flags.python_pattern(pattern, flag) for pattern, flag in
+                    zip(getattr(self.engine, "patterns", []), getattr(self.engine, "flags", None) or itertools.repeat(0))]
+        if patterns and not any(can_match_newline(pattern) for pattern in patterns):
+            with open(filename, "rb") as f:
+                f.seek(offset - overlap)
+                newline = f.read(overlap).rfind(b"\n")
+            if newline >= 0:
+                behind = max(context_width(pattern)[0] for pattern in patterns)
+                return min(overlap - newline - 1 + behind, offset)
+        if overlap < offset:
+            print(f"Warning: the patterns have no maximum match width, only the last {overlap} bytes before "
+                  f"the old end of '{filename}' are rescanned")
+        return overlap
+
+    def scan_file_incremental(self, filename: str, db_hash: str = None) -> List[Dict]:
+        """Scans a file as far as it changed since the scan index recorded it
+
+        Unchanged files are skipped, files that only grew are scanned from
+        their old end (see scan_appended), other files are scanned whole.
+        The file is recorded in the index afterwards.
+
+        Args:
+            filename: file path
+            db_hash: ScanIndex.database_hash of the engine, computed if not given
+        """
+        if db_hash is None:
+            db_hash = ScanIndex.database_hash(self.engine)
+        try:
+            st = os.stat(filename)
+        except OSError as e:
+            print(f"An error occurred while trying to scan file: '{filename}': {e}")
+            return []
+
+        state, offset = self.index.check(filename, st, db_hash)
+        if state == ScanIndex.UNCHANGED:
+            return []
+        if state == ScanIndex.APPENDED:
+            results = self.scan_appended(filename, offset, st.st_size)
+        else:
+            results = self.scan_file(filename)
+        self.index.record(filename, st, db_hash)
+        return results
+
+    def scan_batch(self, filenames: List[str]) -> List[Dict]:
+        """Scans many small files with a single engine.scan_batch call
+
+        Every file is read whole, so match text is sliced from its buffer.
+
+        Args:
+            filenames: paths of the files to scan
+        """
+        self.results = []
+        names = []
+        buffers = []
+        compressed = []
+        for filename in filenames:
+            try:
+                with open(filename, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                print(f"An error occurred while trying to scan file: '{filename}': {e}")
+                continue
+            if self.decompress and FileReader.detect_format(data[:FileReader.HEAD_SIZE]) is not None:
+                compressed.append(filename)
+            else:
+                buffers.append(data)
+                names.append(filename)
+
+        def callback(pattern_id, start, end, flags, index):
+            return self._match_callback(pattern_id, start, end, flags, names[index], buffers[index][start:end])
+
+        try:
+            self.engine.scan_batch(buffers, callback, list(range(len(buffers))))
+        except Exception as e:
+            print(f"An error occurred while trying to scan files: {names}: {e}")
+
+        self._finish(names)
+        results = self.results
+        for filename in compressed:
+            results.extend(self.scan_compressed(filename))
+        self.results = results
+        return results
+
+    def _read_ahead(self, paths: Iterable[Path]) -> Iterator[Tuple[Path, Optional[bytes]]]:
+        """Yields (path, content) pairs, reading the files that will be scanned
+        whole in a background thread, up to prefetch_depth files ahead.
+        Content is None for files that are streamed, batched or unreadable;
+        those are read (and their errors reported) when they are scanned.
+        """
+        depth = self.prefetch_depth or PrefetchReader.DEFAULT_DEPTH
+
+        def read_whole(path):
+            try:
+                size = path.stat().st_size
+                if self.block_max_size is None or size > self.block_max_size:
+                    return None
+                if self.batch_file_size is not None and size <= self.batch_file_size:
+                    return None
+                with open(path, "rb") as f:
+                    return f.read()
+            except OSError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="read-ahead") as pool:
+            pending = deque()
+            for path in paths:
+                pending.append((path, pool.submit(read_whole, path)))
+                if len(pending) > depth:
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            while pending:
+                path, future = pending.popleft()
+                yield path, future.result()
+
+    def scan_tree(self, root, follow_symlinks=False, walker: TreeWalker = None) -> List[Dict]:
+        """Scans all files of a directory tree, as listed by `walker`
+        (default: a TreeWalker without filters)"""
         root = Path(root)
+        all_matches = []
         if not root.exists():
             print(f"[scan_tree] Directory {root} does not exist")
-            return
+            return all_matches
+
+        batch = []
+        batch_stats = []
+        batch_bytes = 0
+        db_hash = ScanIndex.database_hash(self.engine) if self.index is not None else None
+        seen = []
+
+        def flush_batch():
+            all_matches.extend(self.scan_batch(batch))
+            if self.index is not None:
+                for filename, st in zip(batch, batch_stats):
+                    self.index.record(filename, st, db_hash)
+
+        walker = walker or TreeWalker(follow_symlinks=follow_symlinks)
+        paths = (Path(path) for path in walker.walk(root))
+        if self.read_mode == "prefetch":
+            files = self._read_ahead(paths)
+        else:
+            files = ((path, None) for path in paths)
+
+        for path, data in files:
+            try:
+                st = None
+                if self.index is not None:
+                    st = path.stat()
+                    seen.append(str(path))
+                    state, offset = self.index.check(str(path), st, db_hash)
+                    if state == ScanIndex.UNCHANGED:
+                        continue
+                    if state == ScanIndex.APPENDED:
+                        all_matches.extend(self.scan_appended(str(path), offset, st.st_size))
+                        self.index.record(str(path), st, db_hash)
+                        continue
+
+                if self.batch_file_size is not None:
+                    size = path.stat().st_size
+                    if size <= self.batch_file_size:
+                        batch.append(str(path))
+                        batch_stats.append(st)
+                        batch_bytes += size
+                        if batch_bytes >= FileScanner.BATCH_BYTES:
+                            flush_batch()
+                            batch = []
+                            batch_stats = []
+                            batch_bytes = 0
+                        continue
+
+                if data is None:
+                    all_matches.extend(self.scan_file(str(path)))
+                else:
+                    all_matches.extend(self.scan_file(str(path), data=data))
+                if st is not None:
+                    self.index.record(str(path), st, db_hash)
+            except PermissionError:
+                print(f"[scan_tree] No permissions for the file: {path}")
+            except Exception as e:
+                print(f"[scan_tree] Error with file {path}: {e}")
 
-        for dirpath, dirnames, filenames in os.walk(root, followlinks=follow_symlinks):
-            dirpath = Path(dirpath)
+        if batch:
+            flush_batch()
+        if self.index is not None:
+            self.index.prune(str(root), seen)
 
-            for name in filenames:
-                path = dirpath / name
+        return all_matches
 
-                try:
-                    self.scan_file(str(path), full_file=full_file)
-                except PermissionError:
-                    print(f"[scan_tree] No permissions for the file: {path}")
-                except Exception as e:
-                    print(f"[scan_tree] Error with file {path}: {e}")
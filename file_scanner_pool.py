@@ -1,19 +1,28 @@
 import os
-import sys
 from multiprocessing import Pool
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from engines.base_engine import RegexEngine
-from file_regex.file_regex import FileRegex
+from file_reader import FileReader
 from file_scanner import FileScanner
+from match_sink import MatchSink, NullSink
+from tree_walker import TreeWalker
+
+# FileScanner of the current worker process, set up once by FileScannerPool._init_worker
+_worker_scanner = None
 
 
 class FileScannerPool:
     """
     Class designed to use FileScanner with multiprocessing
     """
+    SPLIT_THRESHOLD = 64 * 1024 * 1024
+    BATCH_SIZE = 32
+
     @staticmethod
-    def scan_file(patterns_path: str, engine: RegexEngine, filename: str):
+    def scan_file(patterns_path: str, engine: RegexEngine, filename: str, sink: MatchSink = None,
+                  **scanner_options):
         """
         Creates FileScanner and scans single file,
         (worker function for multiprocessing)
@@ -23,44 +32,196 @@ class FileScannerPool:
                 a text file with regexes (one per line)
             engine (RegexEngine): RegexEngine instance to be used in scanning
             filename (str): Path to the file that should be scanned
+            sink (MatchSink, optional): Output of the matches (default: printed)
+            **scanner_options: Keyword arguments for the FileScanner,
+                e.g. count or max_matches.
+        """
+        scanner = FileScanner(engine, sink=sink, **scanner_options)
+        scanner.load_patterns(patterns_path)
+        scanner.scan_file(filename)
+
+    @staticmethod
+    def _init_worker(engine_cls, serialized_db, patterns, scanner_options=None, ids=None, flags=None,
+                     engine_options=None):
+        """
+        Pool initializer, runs once in every worker process.
+
+        Deserializes the Hyperscan database (and allocates its scratch) or
+        compiles the patterns, so tasks only have to carry file paths.
+
+        Args:
+            engine_cls (type): RegexEngine class to instantiate in the worker.
+            serialized_db (bytes | None): Database serialized with
+                `engine.dumpb()`, or None for engines without serialization.
+            patterns (list[bytes]): Patterns compiled when `serialized_db` is None.
+            scanner_options (dict, optional): Keyword arguments for the
+                worker's FileScanner (read_mode, chunk_profile, ...).
+            ids, flags (list[int], optional): Ids and flags of the patterns.
+            engine_options (dict, optional): Keyword arguments for
+                `engine_cls`, see `RegexEngine.constructor_options`.
+        """
+        global _worker_scanner
+
+        engine = engine_cls(**(engine_options or {}))
+        if serialized_db is not None:
+            engine.loadb(serialized_db)
+        else:
+            engine.compile_patterns(patterns, ids, flags)
+        # matches are returned to the parent, which writes all output
+        _worker_scanner = FileScanner(engine, sink=NullSink(), **{**(scanner_options or {}), "keep_results": True})
+
+    @staticmethod
+    def _run_task(task: tuple):
+        """
+        Task function, executed by the worker's FileScanner.
+
+        ("files", [paths]) tasks scan whole files and return the list of
+        their match results, which the parent writes to its sink.
+        ("range", path, start, end, overlap, lookahead) tasks scan a part of a large
+        file and return (path, matches), which the parent merges per file.
         """
-        scanner = FileScanner(engine)
+        if task[0] == "range":
+            _, filename, start, end, overlap, lookahead = task
+            try:
+                return filename, _worker_scanner.scan_range(filename, start, end, overlap, lookahead)
+            except Exception as e:
+                print(f"An error occurred while trying to scan file: '{filename}': {e}")
+                return filename, []
+
+        results = []
+        for filename in task[1]:
+            results.extend(_worker_scanner.scan_file(filename))
+        return results
+
+    @staticmethod
+    def _compressed(path: str) -> bool:
         try:
-            scanner.engine.load_db(patterns_path)
-        except Exception:
-            sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+            return FileReader.compression(path) is not None
+        except OSError:
+            return False
+
+    @staticmethod
+    def _schedule(paths: Iterable[str], overlap: Optional[int], split_threshold: int,
+                  batch_size: int, lookahead: int = 0) -> Tuple[List[tuple], Dict[str, int]]:
+        """
+        Orders the work largest-first.
 
-            fr = FileRegex(patterns_path)
-            patterns = fr.elements()
-            scanner.compile_patterns(patterns)
+        Files are stat-ed up front. Files larger than `split_threshold` are cut
+        into byte ranges of that size when the overlap is known (and they are
+        not compressed), small files
+        are grouped into batches of `batch_size` paths. `overlap` and
+        `lookahead` come from `split_context`, see FileScanner.scan_range.
 
-        scanner.scan_file(filename)
+        Returns:
+            list of tasks for `_run_task` and the number of ranges per split file
+        """
+        files = []
+        for path in paths:
+            try:
+                files.append((os.stat(path).st_size, path))
+            except OSError as e:
+                print(f"[scan_tree] Error with file {path}: {e}")
+        files.sort(key=lambda item: item[0], reverse=True)
+
+        tasks = []
+        ranges = {}
+        batch = []
+        for size, path in files:
+            # compressed files are decompressed as one stream, byte ranges of them mean nothing
+            if overlap is not None and size > split_threshold and not FileScannerPool._compressed(path):
+                starts = range(0, size, split_threshold)
+                ranges[path] = len(starts)
+                tasks.extend(("range", path, start, min(start + split_threshold, size), overlap, lookahead)
+                             for start in starts)
+                continue
+
+            batch.append(path)
+            if len(batch) >= batch_size:
+                tasks.append(("files", batch))
+                batch = []
+        if batch:
+            tasks.append(("files", batch))
+
+        return tasks, ranges
 
     @staticmethod
-    def scan_tree(patterns_path: str, engine: RegexEngine, dirname: str, follow_symlinks=False):
+    def scan_tree(patterns_path: str, engine: RegexEngine, dirname: str, follow_symlinks=False,
+                  processes: int = None, split_threshold: int = SPLIT_THRESHOLD, sink: MatchSink = None,
+                  walker: TreeWalker = None, **scanner_options):
         """
         Recursively scans all files in a directory tree using multiprocessing.
 
         Args:
             patterns_path (str): Path to a compiled Hyperscan database or
                 a text file containing regex patterns (one per line).
-            engine (RegexEngine): RegexEngine instance passed to each worker.
+            engine (RegexEngine): RegexEngine instance, its class is
+                instantiated in each worker.
             dirname (str): Root directory to scan recursively.
             follow_symlinks (bool): Whether to follow symbolic links during traversal.
+            processes (int, optional): Number of worker processes
+                (default: os.cpu_count()).
+            split_threshold (int, optional): Files larger than this many bytes
+                are scanned as several byte ranges in parallel.
+            sink (MatchSink, optional): Output of the matches, written only
+                by the parent process and closed at the end
+                (default: a MatchSink on stdout).
+            walker (TreeWalker, optional): Lists and filters the files to
+                scan (default: a TreeWalker without filters).
+            **scanner_options: Keyword arguments for the FileScanner of
+                every worker, e.g. read_mode, chunk_profile or block_max_size.
+                The parent merges the ranges of split files with the same
+                options, so count and max_matches apply to whole files.
 
         Notes:
-            Each file is scanned in a separate worker process using
-            FileScannerPool.scan_file via multiprocessing.Pool.starmap().
+            Patterns are loaded once in the parent process. A single
+            multiprocessing.Pool is used for the whole tree and every worker
+            receives the serialized database once, in its initializer, so
+            each task sends only file paths (or a byte range of a file).
+
+            Files are scheduled largest-first. Ranges of a split file
+            overlap by the maximum match width of the pattern set (see
+            `engine.split_context()`, also stored in Hyperscan databases
+            saved by `build`), which is only known when none of the
+            patterns is unbounded; otherwise large files are scanned whole.
+            Matches from the ranges are deduplicated and reported in
+            end-offset order once the whole file is done. Workers return
+            their matches instead of printing them, so the parent process
+            is the only writer of the output.
         """
         root = Path(dirname)
         if not root.exists():
             print(f"[scan_tree] Directory {root} does not exist")
             return
 
-        for dirpath, dirnames, filenames in os.walk(root, followlinks=follow_symlinks):
-            dirpath = Path(dirpath)
-            filenames = [dirpath / name for name in filenames]
-            args = [(patterns_path, engine, filename) for filename in filenames]
+        sink = sink or MatchSink()
+        scanner = FileScanner(engine, sink=sink, **scanner_options)
+        scanner.load_patterns(patterns_path)
+
+        serialized_db = engine.dumpb() if hasattr(engine, "dumpb") else None
+        initargs = (type(engine), serialized_db, engine.patterns, scanner_options, engine.ids, engine.flags,
+                    engine.constructor_options())
+
+        overlap, lookahead = engine.split_context() or (None, 0)
+        walker = walker or TreeWalker(follow_symlinks=follow_symlinks)
+        tasks, ranges = FileScannerPool._schedule(walker.walk(root), overlap, split_threshold,
+                                                  FileScannerPool.BATCH_SIZE, lookahead)
+        merged = {path: set() for path in ranges}
+
+        with Pool(processes, initializer=FileScannerPool._init_worker, initargs=initargs) as pool:
+            for result in pool.imap_unordered(FileScannerPool._run_task, tasks):
+                if isinstance(result, list):
+                    for match in result:
+                        sink.write(match)
+                    continue
 
-            with Pool() as pool:
-                pool.starmap(FileScannerPool.scan_file, args)
\ No newline at end of file
+                filename, matches = result
+                merged[filename].update(matches)
+                ranges[filename] -= 1
+                if ranges[filename] == 0:
+                    scanner.results = []
+                    for pattern_id, start, end, match in sorted(merged.pop(filename),
+                                                                key=lambda m: (m[2], m[1], m[0])):
+                        if scanner._match_callback(pattern_id, start, end, 0, filename, match):
+                            break
+                    scanner._finish([filename])
+        sink.close()
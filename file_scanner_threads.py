@@ -0,0 +1,104 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+from engines.hs_engine import HyperscanEngine
+from file_scanner import FileScanner
+from file_scanner_pool import FileScannerPool
+from match_sink import MatchSink, ThreadedSink
+from tree_walker import TreeWalker
+
+
+class FileScannerThreads:
+    """
+    Class designed to use FileScanner with a pool of threads in one process
+    """
+    BATCH_SIZE = 32
+
+    @staticmethod
+    def scan_tree(patterns_path: str, engine: HyperscanEngine, target: str, threads: int = None,
+                  follow_symlinks=False, sink: MatchSink = None, walker: TreeWalker = None,
+                  **scanner_options) -> List[Dict]:
+        """
+        Scans a file or recursively all files in a directory tree with a
+        pool of threads.
+
+        Args:
+            patterns_path (str): Path to a compiled Hyperscan database or
+                a text file containing regex patterns (one per line).
+            engine (HyperscanEngine): Engine the patterns are loaded into,
+                shared by all threads.
+            target (str): File or root directory to scan.
+            threads (int, optional): Number of worker threads
+                (default: os.cpu_count()).
+            follow_symlinks (bool): Whether to follow symbolic links during traversal.
+            sink (MatchSink, optional): Output of the matches, written by
+                one dedicated writer thread and closed at the end
+                (default: a MatchSink on stdout).
+            walker (TreeWalker, optional): Lists and filters the files to
+                scan (default: a TreeWalker without filters).
+            **scanner_options: Keyword arguments for the FileScanner of
+                every thread, e.g. read_mode, chunk_profile or block_max_size.
+
+        Returns:
+            The match results of all scanned files.
+
+        Notes:
+            Unlike FileScannerPool, the database is loaded once and never
+            copied: every thread scans with an engine from
+            `engine.clone_for_thread()`, which shares the compiled databases
+            and only clones their scratch space. Hyperscan releases the GIL
+            while it scans, so threads scan in parallel. Engines that hold
+            the GIL while they match (PythonEngine) should use
+            FileScannerPool instead.
+
+            Files are scheduled largest-first, in batches of BATCH_SIZE
+            paths; small files of a batch are scanned together with
+            scan_batch when `batch_file_size` is set.
+        """
+        root = Path(target)
+        if not root.exists():
+            print(f"[scan_tree] Directory {root} does not exist")
+            return []
+
+        sink = sink or MatchSink()
+        scanner = FileScanner(engine, sink=sink, **scanner_options)
+        scanner.load_patterns(patterns_path)
+
+        if root.is_file():
+            results = scanner.scan_file(str(root))
+            sink.close()
+            return results
+
+        batch_file_size = scanner_options.get("batch_file_size")
+        local = threading.local()
+        writer = ThreadedSink(sink)
+
+        def run(paths):
+            if not hasattr(local, "scanner"):
+                local.scanner = FileScanner(engine.clone_for_thread(), sink=writer, **scanner_options)
+            results = []
+            small = []
+            for path in paths:
+                try:
+                    if batch_file_size is not None and os.path.getsize(path) <= batch_file_size:
+                        small.append(path)
+                        continue
+                    results.extend(local.scanner.scan_file(path))
+                except Exception as e:
+                    print(f"[scan_tree] Error with file {path}: {e}")
+            if small:
+                results.extend(local.scanner.scan_batch(small))
+            return results
+
+        walker = walker or TreeWalker(follow_symlinks=follow_symlinks)
+        tasks, _ = FileScannerPool._schedule(walker.walk(root),
+                                             None, 0, FileScannerThreads.BATCH_SIZE)
+        all_matches = []
+        with ThreadPoolExecutor(max_workers=threads or os.cpu_count(), thread_name_prefix="scanner") as pool:
+            for results in pool.map(run, [paths for _, paths in tasks]):
+                all_matches.extend(results)
+        writer.close()
+        return all_matches
@@ -1,18 +1,22 @@
 import argparse
 import os
-import sys
+from benchmark import BenchmarkSuite
+from chunk_profile import ChunkProfile
+from file_reader import FileReader
+from file_follower import FileFollower
 from file_scanner import FileScanner
-from file_regex.file_regex import FileRegex
 from engines.python_engine import PythonEngine
+from engines.ac_engine import AhoCorasickEngine
 from engines.hs_engine import HyperscanEngine
+from engines.sharded_engine import ShardedEngine
+from engines.db_cache import DatabaseCache
 from file_scanner_pool import FileScannerPool
-
-
-def match_to_string(pattern_id, start, end, filename):
-    with open(filename, "r") as f:
-        f.seek(start)
-        match = f.read(end - start)
-    return f"Regex with ID: {pattern_id}, filename: '{filename}', from: {start} end: {end}, match: '{match}'"
+from file_scanner_threads import FileScannerThreads
+from match_sink import MatchSink
+from pattern_store import PatternStore
+from scan_index import ScanIndex
+from tree_walker import TreeWalker
+from file_regex.file_regex import FileRegex
 
 
 def main():
@@ -24,7 +28,9 @@ def main():
 
     build.add_argument(
         "source",
-        help="text file with regexes (one regex per line)"
+        help="text file with regexes (one regex per line) or a pattern "
+             "store; a store is compiled in shards, and shards unchanged "
+             "since the last build of OUTPUT are taken from it"
     )
 
     build.add_argument(
@@ -33,6 +39,57 @@ def main():
         help="output file (default hs.db)"
     )
 
+    build.add_argument(
+        "--modes",
+        choices=HyperscanEngine.MODES,
+        nargs="+",
+        default=["block", "stream"],
+        help="Hyperscan database modes to build (default: block stream), "
+             "saved as one bundle with the pattern ids and match data"
+    )
+
+    build.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="split the patterns into this many databases, compiled in "
+             "parallel and saved as one sharded bundle (default: one "
+             "database, or shards of 4096 ids for a pattern store)"
+    )
+
+    build.add_argument(
+        "--cache-dir",
+        default=DatabaseCache.DEFAULT_DIR,
+        help="directory of the compiled database cache"
+    )
+
+    build.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always compile patterns, without the database cache"
+    )
+
+    # patterns
+    patterns = subparsers.add_parser("patterns")
+
+    patterns.add_argument(
+        "store",
+        help="pattern store, created if missing"
+    )
+
+    patterns.add_argument(
+        "action",
+        choices=["add", "remove", "export"],
+        help="add: add the patterns of FILE (with their options), "
+             "remove: remove the patterns of FILE, "
+             "export: write all patterns with their ids to FILE"
+    )
+
+    patterns.add_argument(
+        "file",
+        help="text file with regexes (one regex per line)"
+    )
+
     # run
     run = subparsers.add_parser("run")
     
@@ -51,69 +108,627 @@ def main():
     # add cmd 
     run.add_argument(
         "--engine",
-        choices=["hyperscan", "python"],
+        choices=["hyperscan", "python", "aho-corasick"],
         default="hyperscan",
         help="regex engine to use (default: hyperscan)"
     )
 
+    run.add_argument(
+        "--no-combine",
+        action="store_true",
+        help="with --engine python or aho-corasick, search every regex in "
+             "its own pass instead of matching literal patterns together"
+    )
+
+    run.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="with --engine python or aho-corasick, search every chunk "
+             "without first checking for the strings a match needs"
+    )
+
+    run.add_argument(
+        "--prefilter-stats",
+        action="store_true",
+        help="print how many chunks and pattern scans the prefilter skipped"
+    )
+
     # add Pool
     run.add_argument(
         "--pool",
         action="store_true",
-        help="enable verbose output"
+        help="scan a directory with a pool of worker processes"
+    )
+
+    run.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        metavar="N",
+        help="scan with N threads sharing one hyperscan database, each "
+             "with its own scratch space (hyperscan engine only)"
+    )
+
+    run.add_argument(
+        "--split-size",
+        type=int,
+        default=FileScannerPool.SPLIT_THRESHOLD,
+        help="with --pool, files larger than this many bytes are split "
+             "into ranges scanned in parallel (default 64 MiB); files are "
+             "scanned whole when a pattern has no maximum match length "
+             "(e.g. x+ or .*)"
+    )
+
+    run.add_argument(
+        "--no-decompress",
+        action="store_true",
+        help="scan compressed files (gzip, bz2, xz, zstd) and archives "
+             "(tar, zip) as they are, instead of their decompressed content"
+    )
+
+    run.add_argument(
+        "--include",
+        nargs="+",
+        metavar="GLOB",
+        help="in a directory, scan only files matching one of these glob "
+             "patterns (matched against the name, or the relative path if "
+             "the pattern contains a /)"
     )
 
     run.add_argument(
-    "--full-block",
-    action="store_true",
-    help="read each file as single block instead of chunks "
-)
+        "--exclude",
+        nargs="+",
+        metavar="GLOB",
+        help="in a directory, skip files and directories matching one of "
+             "these glob patterns"
+    )
+
+    run.add_argument(
+        "--ext",
+        nargs="+",
+        metavar="EXT",
+        help="in a directory, scan only files with one of these extensions"
+    )
+
+    run.add_argument(
+        "--exclude-ext",
+        nargs="+",
+        metavar="EXT",
+        help="in a directory, skip files with one of these extensions"
+    )
+
+    run.add_argument(
+        "--min-size",
+        type=int,
+        default=None,
+        help="in a directory, skip files smaller than this many bytes"
+    )
+
+    run.add_argument(
+        "--max-size",
+        type=int,
+        default=None,
+        help="in a directory, skip files larger than this many bytes"
+    )
+
+    run.add_argument(
+        "--skip-hidden",
+        action="store_true",
+        help="in a directory, skip hidden files and directories (names "
+             "starting with a dot)"
+    )
+
+    run.add_argument(
+        "--skip-vcs",
+        action="store_true",
+        help="in a directory, skip version control directories (.git, .hg, "
+             ".svn, ...)"
+    )
+
+    run.add_argument(
+        "--skip-binary",
+        action="store_true",
+        help="in a directory, skip files with a NUL byte in their first "
+             "8 KiB"
+    )
+
+    run.add_argument(
+        "--read-mode",
+        choices=FileReader.MODES,
+        default="read",
+        help="how files are read: new bytes per chunk (read), slices of a "
+             "memory mapping (mmap), one reused buffer (readinto) or ahead "
+             "of the scan by a background thread (prefetch; helps only on cold "
+             "or network storage with a spare CPU, see README)"
+    )
+
+    run.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=None,
+        help="with --read-mode prefetch, how many chunks or whole files are "
+             "read ahead (default 4)"
+    )
+
+    run.add_argument(
+        "--block-max-size",
+        type=int,
+        default=8 * 1024 * 1024,
+        help="files up to this many bytes are read whole and scanned in "
+             "block mode, larger files are streamed (default 8 MiB, 0 "
+             "streams every file)"
+    )
+
+    run.add_argument(
+        "--match-window",
+        type=int,
+        default=None,
+        help="bytes of recently read data kept in memory for extracting "
+             "match text (default 1 MiB)"
+    )
+
+    run.add_argument(
+        "--batch-small",
+        type=int,
+        default=64 * 1024,
+        help="scan files up to this many bytes whole, in batches, with "
+             "a vectored database (default 64 KiB, 0 disables batching)"
+    )
+
+    run.add_argument(
+        "--profile",
+        default=ChunkProfile.DEFAULT_PATH,
+        help="chunk size profile written by the calibrate command"
+    )
+
+    run.add_argument(
+        "--follow",
+        action="store_true",
+        help="keep running and scan data appended to the target file or "
+             "to files in the target directory as it is written"
+    )
+
+    run.add_argument(
+        "--from-start",
+        action="store_true",
+        help="with --follow, scan the existing content of the files first "
+             "instead of starting at their current end"
+    )
+
+    run.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip files that did not change since the last incremental "
+             "run and scan only the appended part of files that grew"
+    )
+
+    run.add_argument(
+        "--index",
+        default=ScanIndex.DEFAULT_PATH,
+        help="with --incremental, file recording what was scanned before"
+    )
+
+    run.add_argument(
+        "-o", "--output",
+        default=None,
+        help="file the matches are written to (default standard output)"
+    )
+
+    run.add_argument(
+        "--format",
+        choices=MatchSink.FORMATS,
+        default="text",
+        help="output format of the matches: text lines, one JSON object "
+             "per line (jsonl) or compact binary records (binary)"
+    )
+
+    run.add_argument(
+        "--count",
+        action="store_true",
+        help="print the number of matches of every pattern per file "
+             "instead of the matches"
+    )
+
+    run.add_argument(
+        "--files-with-matches",
+        action="store_true",
+        help="print only the names of files with a match; the scan of a "
+             "file stops at its first match"
+    )
+
+    run.add_argument(
+        "--max-matches",
+        type=int,
+        default=None,
+        metavar="N",
+        help="report at most N matches of every pattern per file; the scan "
+             "of a file stops once every pattern has N matches"
+    )
+
+    run.add_argument(
+        "--cache-dir",
+        default=DatabaseCache.DEFAULT_DIR,
+        help="directory of the compiled database cache"
+    )
+
+    run.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always compile patterns, without the database cache"
+    )
+
+    # calibrate
+    calibrate = subparsers.add_parser("calibrate")
+
+    calibrate.add_argument(
+        "config",
+        help="either a compiled Hyperscan database or a text file with "
+             "regexes (one per line)"
+    )
+
+    calibrate.add_argument(
+        "sample",
+        help="sample file, stored on the same kind of storage as the "
+             "files that are going to be scanned"
+    )
+
+    calibrate.add_argument(
+        "--engine",
+        choices=["hyperscan", "python", "aho-corasick"],
+        default="hyperscan",
+        help="regex engine to calibrate (default: hyperscan)"
+    )
+
+    calibrate.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="chunk sizes in bytes to measure (default 4 KiB ... 16 MiB)"
+    )
+
+    calibrate.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="scans per chunk size, the fastest one counts (default 3)"
+    )
+
+    calibrate.add_argument(
+        "--profile",
+        default=ChunkProfile.DEFAULT_PATH,
+        help="file the measured profile is saved to"
+    )
+
+    # bench
+    bench = subparsers.add_parser("bench")
+
+    bench.add_argument(
+        "--patterns",
+        type=int,
+        nargs="+",
+        default=[10, 100],
+        help="numbers of patterns to benchmark (default 10 100)"
+    )
+
+    bench.add_argument(
+        "--corpus-mb",
+        type=float,
+        nargs="+",
+        default=[4],
+        help="sizes of the generated corpus in MiB (default 4)"
+    )
+
+    bench.add_argument(
+        "--density",
+        type=float,
+        nargs="+",
+        default=[0.001, 0.05],
+        help="fractions of the corpus words matching a pattern (default 0.001 0.05)"
+    )
+
+    bench.add_argument(
+        "--chunk-sizes",
+        type=int,
+        nargs="+",
+        default=[64 * 1024, 1024 * 1024],
+        help="chunk sizes in bytes, 0 scans whole files in block mode (default 65536 1048576)"
+    )
+
+    bench.add_argument(
+        "--engines",
+        choices=BenchmarkSuite.ENGINES,
+        nargs="+",
+        default=["hyperscan", "python"],
+        help="engines to benchmark (default hyperscan python)"
+    )
+
+    bench.add_argument(
+        "--modes",
+        choices=BenchmarkSuite.MODES,
+        nargs="+",
+        default=list(BenchmarkSuite.MODES),
+        help="execution modes to benchmark (default serial threads pool)"
+    )
+
+    bench.add_argument(
+        "--files",
+        type=int,
+        default=16,
+        help="number of files in every generated corpus (default 16)"
+    )
+
+    bench.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="threads or processes of the threads and pool modes (default: number of CPUs)"
+    )
+
+    bench.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="passes over the corpus per case, the fastest one counts (default 3)"
+    )
+
+    bench.add_argument(
+        "--seed",
+        type=int,
+        default=1,
+        help="seed of the generated patterns and corpora (default 1)"
+    )
+
+    bench.add_argument(
+        "-o", "--output",
+        default=None,
+        help="file the results are saved to as JSON"
+    )
+
+    bench.add_argument(
+        "--baseline",
+        default=None,
+        help="results saved before (e.g. benchmark_baseline.json); "
+             "exits with status 1 if a case regressed against them"
+    )
+
+    bench.add_argument(
+        "--max-regression",
+        type=float,
+        default=10.0,
+        help="with --baseline, the percentage by which throughput may drop or "
+             "p50/p99 latency may grow (default 10)"
+    )
+
+    bench.add_argument(
+        "--min-latency-ms",
+        type=float,
+        default=BenchmarkSuite.MIN_LATENCY_MS,
+        help="with --baseline, p50/p99 latency only regressed if it also grew by "
+             f"more than this many milliseconds (default {BenchmarkSuite.MIN_LATENCY_MS:g})"
+    )
 
     args = parser.parse_args()
 
-    if args.command == "run":
+    cache = None
+    if args.command in ("run", "build") and not args.no_cache:
+        cache = DatabaseCache(args.cache_dir)
+
+    if args.command in ("run", "calibrate"):
         #engie
+        python_options = {
+            "combine": not getattr(args, "no_combine", False),
+            "prefilter": not getattr(args, "no_prefilter", False),
+        }
         if args.engine == "python":
-            engine = PythonEngine()
+            engine = PythonEngine(**python_options)
+        elif args.engine == "aho-corasick":
+            engine = AhoCorasickEngine(PythonEngine(**python_options))
+        elif args.command == "run":
+            modes = ["stream"]
+            if args.block_max_size:
+                modes.append("block")
+            if args.batch_small:
+                modes.append("vectored")
+            engine = HyperscanEngine(modes=modes, cache=cache)
         else:
-            engine = HyperscanEngine()
+            engine = HyperscanEngine(cache=cache)
+        if isinstance(engine, HyperscanEngine) and (ShardedEngine.is_sharded_file(args.config)
+                                                    or PatternStore.is_store(args.config)):
+            # a pattern store, or a database built from one, is scanned shard by shard
+            engine = ShardedEngine(modes=engine.modes, cache=cache)
+        profile = ChunkProfile.load(args.profile)
+
+    if args.command == "run":
+        sink = MatchSink.open(args.format, args.output)
+        scanner_options = {
+            "count": args.count,
+            "files_with_matches": args.files_with_matches,
+            "max_matches": args.max_matches,
+            "decompress": not args.no_decompress,
+            # matches are only written to the sink, not collected as well
+            "keep_results": False,
+        }
+        walker = TreeWalker(include=args.include, exclude=args.exclude, extensions=args.ext,
+                            exclude_extensions=args.exclude_ext, min_size=args.min_size,
+                            max_size=args.max_size, skip_hidden=args.skip_hidden, skip_vcs=args.skip_vcs,
+                            skip_binary=args.skip_binary)
+
+    if args.command == "run" and args.follow:
+        if args.count or args.files_with_matches or args.max_matches is not None:
+            print("--count, --files-with-matches and --max-matches are ignored with --follow")
+        scanner = FileScanner(engine=engine, window_size=args.match_window, sink=sink, keep_results=False)
+        scanner.load_patterns(args.config)
+        FileFollower(scanner, from_start=args.from_start).follow(args.target)
+        sink.close()
+
+    elif args.command == "run":
+
+        if args.incremental and (args.threads or args.pool):
+            print("--incremental is not supported with --threads or --pool, scanning in a single thread")
+            args.threads = None
+            args.pool = False
 
-        if args.pool:
+        if args.threads and not isinstance(engine, (HyperscanEngine, ShardedEngine)):
+            print(f"--threads only speeds up the hyperscan engine, use --pool with --engine {args.engine}; "
+                  f"scanning in a single thread")
+            args.threads = None
+
+        if args.threads:
+            FileScannerThreads.scan_tree(args.config, engine, args.target, threads=args.threads, sink=sink,
+                                         walker=walker,
+                                         window_size=args.match_window,
+                                         read_mode=args.read_mode, prefetch_depth=args.prefetch_depth,
+                                         chunk_profile=profile,
+                                         batch_file_size=args.batch_small or None,
+                                         block_max_size=args.block_max_size or None,
+                                         **scanner_options)
+        elif args.pool:
             if os.path.isfile(args.target):
-                FileScannerPool.scan_file(args.config, engine, args.target)
+                FileScannerPool.scan_file(args.config, engine, args.target, sink=sink, **scanner_options)
 
             elif os.path.isdir(args.target):
-                FileScannerPool.scan_tree(args.config, engine, args.target)
+                FileScannerPool.scan_tree(args.config, engine, args.target,
+                                          split_threshold=args.split_size, sink=sink, walker=walker,
+                                          read_mode=args.read_mode,
+                                          prefetch_depth=args.prefetch_depth,
+                                          chunk_profile=profile,
+                                          block_max_size=args.block_max_size or None,
+                                          **scanner_options)
             else:
                 print(f"cannot access '{args.target}': No such file or directory")
+            sink.close()
         else:
-            scanner = FileScanner(engine=engine)
+            index = ScanIndex.load(args.index) if args.incremental else None
+            scanner = FileScanner(engine=engine, window_size=args.match_window,
+                                  read_mode=args.read_mode, prefetch_depth=args.prefetch_depth,
+                                  chunk_profile=profile,
+                                  batch_file_size=args.batch_small or None,
+                                  block_max_size=args.block_max_size or None,
+                                  index=index, sink=sink, **scanner_options)
+            scanner.load_patterns(args.config)
 
-            try:
-                scanner.engine.load_db(args.config)
-            except Exception:
-                sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-                fr = FileRegex(args.config)
-                patterns = fr.elements()
-                scanner.compile_patterns(patterns)
-            
-        if os.path.isfile(args.target):
-            scanner.scan_file(args.target, full_file=args.full_block)
-
-        elif os.path.isdir(args.target):
-            scanner.scan_tree(args.target, full_file=args.full_block)
+            if os.path.isfile(args.target):
+                if index is not None:
+                    scanner.scan_file_incremental(args.target)
+                else:
+                    scanner.scan_file(args.target)
+
+            elif os.path.isdir(args.target):
+                scanner.scan_tree(args.target, walker=walker)
+            else:
+                print(f"cannot access '{args.target}': No such file or directory")
+            sink.close()
+
+            if index is not None:
+                try:
+                    index.save()
+                except OSError as e:
+                    print(f"Warning: could not write scan index '{index.path}': {e}")
+
+            if args.prefilter_stats:
+                python_engine = engine.inner if isinstance(engine, AhoCorasickEngine) else engine
+                stats = getattr(python_engine, "prefilter_stats", None)
+                if stats:
+                    print(f"Prefilter skipped {stats['skipped_chunks']} of {stats['chunks']} chunks and "
+                          f"{stats['skipped_pattern_scans']} of {stats['pattern_scans']} pattern scans")
+                else:
+                    print("Prefilter statistics are only collected by the python engine")
+
+    elif args.command == "build" and (args.shards or PatternStore.is_store(args.source)):
+        if PatternStore.is_store(args.source):
+            with PatternStore(args.source) as store:
+                entries = store.entries()
         else:
-            print(f"cannot access '{args.target}': No such file or directory")
-    
+            entries = FileRegex(args.source).entries()
+        previous = None
+        if ShardedEngine.is_sharded_file(args.output):
+            previous = ShardedEngine(modes=args.modes)
+            try:
+                previous.load_db(args.output)
+            except Exception as e:
+                print(f"Warning: could not load the previous build '{args.output}', compiling all shards: {e}")
+                previous = None
+
+        engine = ShardedEngine(modes=args.modes, cache=cache, shard_count=args.shards)
+        compiled = engine.compile_patterns([pattern.encode("utf-8") for pattern, _, _ in entries],
+                                           [pattern_id for _, pattern_id, _ in entries],
+                                           [flags for _, _, flags in entries], previous=previous)
+        engine.save_db(args.output, mode=args.modes[0] if len(args.modes) == 1 else None)
+        print(f"Compiled {compiled} of {len(engine.shards)} shards of {len(entries)} patterns")
+
     elif args.command == "build":
-        fr = FileRegex(args.source)
-        patterns = fr.elements()
+        scanner = FileScanner(HyperscanEngine(modes=args.modes, cache=cache))
+        scanner.compile_pattern_file(args.source)
+
+        # saved as a bundle (also for a single mode): the databases with the pattern ids,
+        # match widths and split context (see HyperscanEngine.dumpb)
+        scanner.engine.save_db(args.output, mode=args.modes[0] if len(args.modes) == 1 else None)
+
+    elif args.command == "patterns":
+        with PatternStore(args.store) as store:
+            if args.action == "add":
+                try:
+                    added = store.add(FileRegex(args.file).entries(auto_ids=False))
+                except ValueError as e:
+                    print(f"No patterns added: {e}")
+                    return
+                print(f"Added {added} patterns, the store has {len(store)} patterns")
+            elif args.action == "remove":
+                removed = store.remove(FileRegex(args.file).elements())
+                print(f"Removed {removed} patterns, the store has {len(store)} patterns")
+            else:
+                store.export(args.file)
+
+    elif args.command == "calibrate":
+        scanner = FileScanner(engine=engine)
+        scanner.load_patterns(args.config)
+
+        best = profile.calibrate(engine, args.sample, sizes=args.sizes, repeats=args.repeats)
+        profile.save()
+
+        for chunk_size, mb_s in profile.engines[type(engine).__name__]["throughput_mb_s"].items():
+            print(f"chunk size: {chunk_size:>9} B, throughput: {mb_s:10.1f} MB/s")
+        print(f"best chunk size: {best} B, saved to '{profile.path}'")
+
+    elif args.command == "bench":
+        baseline = None
+        if args.baseline:
+            try:
+                baseline = BenchmarkSuite.load(args.baseline)
+            except (OSError, ValueError) as e:
+                print(f"Cannot read the baseline '{args.baseline}': {e}")
+                raise SystemExit(2)
 
-        scanner = FileScanner()
-        scanner.compile_patterns(patterns)
+        suite = BenchmarkSuite(pattern_counts=args.patterns, corpus_sizes=args.corpus_mb,
+                               match_densities=args.density, chunk_sizes=args.chunk_sizes,
+                               engines=args.engines, modes=args.modes, files=args.files,
+                               workers=args.workers, repeats=args.repeats, seed=args.seed)
+        results = suite.run()
+        if args.output:
+            BenchmarkSuite.save(results, args.output)
+            print(f"Results saved to '{args.output}'")
 
-        scanner.engine.save_db(args.output)
+        if baseline is not None:
+            same_environment = baseline.get("environment") == BenchmarkSuite.environment()
+            if not same_environment:
+                print(f"Warning: the baseline was measured in another environment: {baseline.get('environment')}; "
+                      f"only the numbers of matches are compared, record a baseline on this machine with -o")
+            modes = BenchmarkSuite.MODES
+            cpus = min(baseline.get("environment", {}).get("cpu_count") or 1, os.cpu_count() or 1)
+            if cpus < 2:
+                # threads and pool cases on one CPU measure nothing
+                modes = ("serial",)
+                print("Timings are only compared for the serial cases, the baseline or this machine has a single CPU")
+            # timings of another machine say nothing about this one, match counts do
+            metrics = BenchmarkSuite.METRICS if same_environment else ()
+            regressions = BenchmarkSuite.compare(results, baseline["results"], args.max_regression, metrics=metrics,
+                                                 min_latency_ms=args.min_latency_ms, modes=modes)
+            for line in regressions:
+                print(f"Regression: {line}")
+            if regressions:
+                raise SystemExit(1)
+            print(f"No regressions over {args.max_regression}% against '{args.baseline}'")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,223 @@
+import io
+import json
+import queue
+import struct
+import sys
+import threading
+from typing import BinaryIO, Dict, Iterator, Union
+
+
+class MatchSink:
+    """
+    Buffered output for match results, shared by scanners running in several threads.
+
+    Results are encoded into a write buffer and written out in blocks of
+    BUFFER_SIZE bytes instead of one write per match. Encoding happens
+    outside of the lock, appending to the buffer under it, so records of
+    different threads never interleave. This class writes the text lines
+    `Regex with ID: ...`; subclasses encode other formats.
+    """
+    BUFFER_SIZE = 1024 * 1024
+    FORMATS = ("text", "jsonl", "binary")
+
+    def __init__(self, stream: Union[BinaryIO, io.TextIOBase] = None, buffer_size: int = None):
+        """
+        Args:
+            stream (optional): Binary or text stream the records are written
+                to (default: standard output at the time of every flush).
+            buffer_size (int, optional): Bytes collected before they are
+                written (default `MatchSink.BUFFER_SIZE`).
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size or MatchSink.BUFFER_SIZE
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._owned = False
+
+    @staticmethod
+    def open(fmt: str = "text", path: str = None) -> "MatchSink":
+        """Sink of one of FORMATS, writing to a new file at `path` or to standard output"""
+        if fmt not in MatchSink.FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}', expected one of {MatchSink.FORMATS}")
+        cls = {"text": MatchSink, "jsonl": JsonLinesSink, "binary": BinarySink}[fmt]
+        if path is None:
+            return cls()
+        sink = cls(open(path, "wb"))
+        sink._owned = True
+        return sink
+
+    @staticmethod
+    def format(result: Dict) -> str:
+        """Text line of a match, a match count (`count`) or a file with matches (only `filename`)"""
+        if "count" in result:
+            return f"Regex with ID: {result['pattern_id']}, filename: '{result['filename']}', count: {result['count']}"
+        if "pattern_id" not in result:
+            return result["filename"]
+        return (f"Regex with ID: {result['pattern_id']}, filename: '{result['filename']}', "
+                f"from: {result['start']} end: {result['end']}, match: '{result['match']}'")
+
+    def encode(self, result: Dict) -> bytes:
+        """One record of the output format"""
+        return (MatchSink.format(result) + "\n").encode("utf-8", errors="replace")
+
+    def write(self, result: Dict) -> None:
+        """Writes one match result, as returned by FileScanner.scan_file"""
+        record = self.encode(result)
+        with self._lock:
+            self._buffer += record
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def flush(self) -> None:
+        """Writes out the buffered records"""
+        with self._lock:
+            self._flush()
+            stream = self._stream()
+            if stream is not None:
+                stream.flush()
+
+    def close(self) -> None:
+        """Writes out the buffered records and closes a file opened by `open`; later calls do nothing"""
+        if self._owned and self.stream.closed:
+            return
+        self.flush()
+        if self._owned:
+            self.stream.close()
+
+    def _stream(self):
+        return self.stream if self.stream is not None else sys.stdout
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        stream = self._stream()
+        if isinstance(stream, io.TextIOBase):
+            binary = getattr(stream, "buffer", None)
+            if binary is None:
+                stream.write(self._buffer.decode("utf-8", errors="replace"))
+                self._buffer.clear()
+                return
+            # messages printed before must come out first
+            stream.flush()
+            stream = binary
+        stream.write(self._buffer)
+        self._buffer.clear()
+
+
+class JsonLinesSink(MatchSink):
+    """Writes every match as one JSON object per line"""
+
+    def encode(self, result: Dict) -> bytes:
+        return json.dumps(result, ensure_ascii=False).encode("utf-8", errors="replace") + b"\n"
+
+
+class BinarySink(MatchSink):
+    """
+    Writes compact binary records.
+
+    The output starts with MAGIC. A file record (`F`, file id, name length,
+    UTF-8 name) is written the first time a file has a result, and every
+    match record (`M`, file id, pattern id, start, end, match length,
+    UTF-8 match text), count record (`C`, file id, pattern id, count) and
+    listed file record (`L`, file id) refers to it by id. All integers are
+    little-endian. `BinarySink.read` decodes the records.
+    """
+    MAGIC = b"NKMATCH1"
+    _FILE = struct.Struct("<cIH")
+    _MATCH = struct.Struct("<cIIQQI")
+    _COUNT = struct.Struct("<cIIQ")
+    _LISTED = struct.Struct("<cI")
+
+    def __init__(self, stream: BinaryIO = None, buffer_size: int = None):
+        super().__init__(stream, buffer_size)
+        self._file_ids: Dict[str, int] = {}
+        self._buffer += BinarySink.MAGIC
+
+    def write(self, result: Dict) -> None:
+        # file ids are assigned under the lock, so a file record always precedes its matches
+        match = result["match"].encode("utf-8", errors="replace") if "match" in result else None
+        filename = result["filename"]
+        with self._lock:
+            file_id = self._file_ids.get(filename)
+            if file_id is None:
+                file_id = self._file_ids[filename] = len(self._file_ids)
+                name = filename.encode("utf-8", errors="replace")
+                self._buffer += BinarySink._FILE.pack(b"F", file_id, len(name)) + name
+            if match is not None:
+                self._buffer += BinarySink._MATCH.pack(b"M", file_id, result["pattern_id"], result["start"],
+                                                       result["end"], len(match)) + match
+            elif "count" in result:
+                self._buffer += BinarySink._COUNT.pack(b"C", file_id, result["pattern_id"], result["count"])
+            else:
+                self._buffer += BinarySink._LISTED.pack(b"L", file_id)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    @staticmethod
+    def read(f: BinaryIO) -> Iterator[Dict]:
+        """Yields the match results of a binary output"""
+        if f.read(len(BinarySink.MAGIC)) != BinarySink.MAGIC:
+            raise ValueError("Not a binary match output")
+        files = {}
+        while True:
+            kind = f.read(1)
+            if not kind:
+                return
+            if kind == b"F":
+                _, file_id, length = BinarySink._FILE.unpack(kind + f.read(BinarySink._FILE.size - 1))
+                files[file_id] = f.read(length).decode("utf-8", errors="replace")
+            elif kind == b"M":
+                _, file_id, pattern_id, start, end, length = \
+                    BinarySink._MATCH.unpack(kind + f.read(BinarySink._MATCH.size - 1))
+                yield {
+                    "pattern_id": pattern_id,
+                    "start": start,
+                    "end": end,
+                    "match": f.read(length).decode("utf-8", errors="replace"),
+                    "filename": files[file_id],
+                }
+            elif kind == b"C":
+                _, file_id, pattern_id, count = BinarySink._COUNT.unpack(kind + f.read(BinarySink._COUNT.size - 1))
+                yield {"pattern_id": pattern_id, "count": count, "filename": files[file_id]}
+            elif kind == b"L":
+                _, file_id = BinarySink._LISTED.unpack(kind + f.read(BinarySink._LISTED.size - 1))
+                yield {"filename": files[file_id]}
+            else:
+                raise ValueError(f"Unknown record type {kind!r}")
+
+
+class NullSink(MatchSink):
+    """Discards every match, e.g. in workers that return their results instead"""
+
+    def write(self, result: Dict) -> None:
+        pass
+
+
+class ThreadedSink:
+    """
+    Hands results over to a dedicated writer thread, which encodes and
+    writes them to another sink, so scanning threads never wait for the output.
+    """
+
+    def __init__(self, sink: MatchSink):
+        self.sink = sink
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="match-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        for result in iter(self._queue.get, None):
+            self.sink.write(result)
+
+    def write(self, result: Dict) -> None:
+        self._queue.put(result)
+
+    def flush(self) -> None:
+        self.sink.flush()
+
+    def close(self) -> None:
+        """Waits for the writer thread to write everything, then closes the sink"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.sink.close()
@@ -0,0 +1,104 @@
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+
+from engines.pattern_flags import NAMES
+
+_SQLITE_HEADER = b"SQLite format 3\0"
+
+
+class PatternStore:
+    """
+    Pattern catalogue in an SQLite database, for catalogues too big to
+    manage as a text file (see FileRegex).
+
+    Patterns are unique and indexed by their text, so adding and removing
+    them in bulk never reads the whole catalogue. Every pattern gets an id
+    when it is first added and keeps it until it is removed; ids of
+    removed patterns are never given out again. ShardedEngine groups
+    patterns into shards by id, so adding patterns only changes the last
+    shard and `main.py build` recompiles just the changed shards.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): SQLite file of the store, created if missing.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS patterns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "pattern TEXT NOT NULL UNIQUE, "
+                "flags INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def __enter__(self) -> "PatternStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        """Whether `path` is an SQLite file (and not a text file or a compiled database)"""
+        try:
+            with open(path, "rb") as f:
+                return f.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
+        except OSError:
+            return False
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM patterns").fetchone()[0]
+
+    def add(self, entries: Iterable[Tuple[str, Optional[int], int]]) -> int:
+        """
+        Adds (pattern, id, flags) entries in one transaction, e.g. from
+        `FileRegex.entries(auto_ids=False)`.
+
+        A pattern with id None gets the next free id. A pattern already in
+        the store keeps its id and takes the new flags. Nothing is added
+        when an explicit id belongs to another pattern (ValueError).
+
+        Returns:
+            The number of new patterns.
+        """
+        before = len(self)
+        with self.connection:
+            for pattern, pattern_id, flags in entries:
+                row = self.connection.execute("SELECT id FROM patterns WHERE pattern = ?", (pattern,)).fetchone()
+                if row is not None:
+                    if pattern_id is not None and row[0] != pattern_id:
+                        raise ValueError(f"Pattern '{pattern}' already has id {row[0]}, not {pattern_id}")
+                    self.connection.execute("UPDATE patterns SET flags = ? WHERE id = ?", (flags, row[0]))
+                    continue
+                # an insert that fails would still use up an id, so existing patterns are updated instead
+                try:
+                    self.connection.execute("INSERT INTO patterns (id, pattern, flags) VALUES (?, ?, ?)",
+                                            (pattern_id, pattern, flags))
+                except sqlite3.IntegrityError:
+                    raise ValueError(f"Pattern id {pattern_id} is already used by another pattern")
+        return len(self) - before
+
+    def remove(self, patterns: Iterable[str]) -> int:
+        """Removes patterns by their text in one transaction, returns how many were in the store"""
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany("DELETE FROM patterns WHERE pattern = ?",
+                                        ((pattern,) for pattern in patterns))
+            return self.connection.total_changes - before
+
+    def entries(self) -> List[Tuple[str, int, int]]:
+        """All patterns as (pattern, id, flags), ordered by id"""
+        return self.connection.execute("SELECT pattern, id, flags FROM patterns ORDER BY id").fetchall()
+
+    def export(self, path: str) -> None:
+        """Writes the patterns as a pattern file with their ids and flags (see FileRegex.entries)"""
+        with open(path, "w", encoding="utf-8") as f:
+            for pattern, pattern_id, flags in self.entries():
+                options = [name for name, flag in NAMES.items() if flags & flag] + [f"id={pattern_id}"]
+                f.write(f"{pattern}, {' '.join(options)}\n")
@@ -0,0 +1,103 @@
+import queue
+import threading
+from typing import BinaryIO, Iterator, Union
+
+
+class PrefetchReader:
+    """
+    Reads a file in a background thread, ahead of the consumer.
+
+    The reader thread fills a fixed pool of `depth + 2` buffers (up to
+    `depth` filled chunks waiting, one held by the consumer, one being
+    read into) and hands them over through a queue, so the disk keeps
+    reading while the previous chunks are scanned. File reads and
+    Hyperscan scans both release the GIL.
+
+    Chunks are `memoryview`s of the pool buffers: a chunk is overwritten
+    once the consumer asks for the next one, so a consumer must copy a
+    chunk it wants to keep (like `FileReader` "readinto" mode). With
+    reuse_buffers=False every chunk is instead a new `bytes` object read
+    by the thread, for consumers that copy every chunk anyway (e.g.
+    Hyperscan, which only scans `bytes`); the pool then only limits how
+    far the thread reads ahead.
+    """
+    DEFAULT_DEPTH = 4
+
+    def __init__(self, f: BinaryIO, chunk_size: int, length: int = None, depth: int = None,
+                 reuse_buffers: bool = True):
+        """
+        Args:
+            f (BinaryIO): File opened in binary mode, positioned where reading starts.
+            chunk_size (int): Size of every buffer in bytes.
+            length (int, optional): Maximum number of bytes to read
+                (default: until the end of the file).
+            depth (int, optional): Maximum number of chunks read ahead
+                (default `PrefetchReader.DEFAULT_DEPTH`).
+            reuse_buffers (bool, optional): Yield views of the pool
+                buffers (default) or new `bytes` objects.
+        """
+        self.file = f
+        self.chunk_size = chunk_size
+        self.remaining = -1 if length is None else length
+        self.depth = max(depth or PrefetchReader.DEFAULT_DEPTH, 1)
+        self.reuse_buffers = reuse_buffers
+
+        self._free = queue.Queue()
+        for _ in range(self.depth + 2):
+            # without reused buffers the pool holds empty placeholders
+            self._free.put(bytearray(chunk_size if reuse_buffers else 0))
+        self._filled = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, name="prefetch-reader", daemon=True)
+
+    def _read(self) -> None:
+        """Reader thread: fills free buffers until the end of the data or close()."""
+        remaining = self.remaining
+        try:
+            while remaining and not self._stop.is_set():
+                buffer = self._free.get()
+                if buffer is None or self._stop.is_set():
+                    break
+                size = self.chunk_size if remaining < 0 else min(self.chunk_size, remaining)
+                if self.reuse_buffers:
+                    with memoryview(buffer) as view:
+                        n = self.file.readinto(view[:size])
+                    data = None
+                else:
+                    data = self.file.read(size)
+                    n = len(data)
+                if not n:
+                    break
+                if remaining > 0:
+                    remaining -= n
+                self._filled.put((buffer, n, data))
+        except Exception as e:
+            self._filled.put(e)
+            return
+        self._filled.put(None)
+
+    def __iter__(self) -> Iterator[Union[memoryview, bytes]]:
+        self._thread.start()
+        held = None
+        try:
+            while True:
+                item = self._filled.get()
+                # the consumer is done with the previous chunk
+                if held is not None:
+                    self._free.put(held)
+                    held = None
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                held, n, data = item
+                yield memoryview(held)[:n] if data is None else data
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stops the reader thread and waits for it, e.g. when the consumer stops early."""
+        self._stop.set()
+        self._free.put(None)  # wakes the thread if it waits for a free buffer
+        if self._thread.is_alive():
+            self._thread.join()
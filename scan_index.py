@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, Tuple
+
+from engines.base_engine import RegexEngine
+
+
+class ScanIndex:
+    """
+    Files scanned before, so a repeated scan of the same tree only reads what changed.
+
+    Every entry is keyed by path and holds the device, inode, size and
+    modification time of the file when it was scanned, the hash of the
+    pattern database it was scanned with and a digest of its last
+    TAIL_BYTES bytes. A file with the same inode, size, mtime and
+    database is unchanged. A file with the same inode and database that
+    only grew, and still has the same bytes before its old end, was
+    appended to and is scanned from the old end on. A file found under a
+    new path with the inode of an entry was renamed (e.g. a rotated log)
+    and is compared with that entry. Anything else (truncation, rewrite,
+    a new file under a rotated name, other patterns) is scanned whole.
+    """
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nokia_project", "scan_index.json")
+    TAIL_BYTES = 4096
+
+    UNCHANGED = "unchanged"
+    APPENDED = "appended"
+    CHANGED = "changed"
+
+    def __init__(self, path: str = None):
+        """
+        Args:
+            path (str, optional):
+                Location of the index file (default `ScanIndex.DEFAULT_PATH`).
+        """
+        self.path = path or ScanIndex.DEFAULT_PATH
+        self.entries: Dict[str, Dict] = {}
+        # (dev, ino) -> entry, also of entries replaced since loading, for renamed files
+        self._inodes: Dict[Tuple[int, int], Dict] = {}
+
+    @staticmethod
+    def load(path: str = None) -> "ScanIndex":
+        """Reads an index, a missing or unreadable file gives an empty index."""
+        index = ScanIndex(path)
+        try:
+            with open(index.path, "r", encoding="utf-8") as f:
+                index.entries = json.load(f)
+        except (OSError, ValueError):
+            index.entries = {}
+        index._inodes = {(entry["dev"], entry["ino"]): entry for entry in index.entries.values()}
+        return index
+
+    def save(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first, so an interrupted save keeps the old index
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def database_hash(engine: RegexEngine) -> str:
+        """Hash of the patterns the engine matches: its pattern list, or its serialized database."""
+        h = hashlib.sha256(type(engine).__name__.encode())
+        if engine.patterns:
+            for pattern, pattern_id, flags in zip(engine.patterns, engine.ids, engine.flags):
+                h.update(f"{len(pattern)}:{pattern_id}:{flags}:".encode())
+                h.update(pattern)
+        elif hasattr(engine, "dumpb"):
+            h.update(engine.dumpb())
+        return h.hexdigest()
+
+    @staticmethod
+    def _tail_digest(path: str, end: int) -> str:
+        with open(path, "rb") as f:
+            start = max(end - ScanIndex.TAIL_BYTES, 0)
+            f.seek(start)
+            return hashlib.sha256(f.read(end - start)).hexdigest()
+
+    def check(self, path: str, st: os.stat_result, db_hash: str) -> Tuple[str, int]:
+        """
+        Compares a file with its entry, or with the entry of the same
+        inode if the file was renamed.
+
+        Returns:
+            (state, offset): UNCHANGED with the scanned size, APPENDED with
+            the offset scanning resumes from, or CHANGED with 0
+        """
+        path = os.path.abspath(path)
+        entry = self.entries.get(path)
+        if entry is None or (entry["dev"], entry["ino"]) != (st.st_dev, st.st_ino):
+            # renamed: the entry moves to the new path
+            entry = self._inodes.get((st.st_dev, st.st_ino))
+            if entry is not None:
+                self.entries[path] = entry
+        if entry is None or entry["db"] != db_hash:
+            return ScanIndex.CHANGED, 0
+        if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return ScanIndex.UNCHANGED, entry["size"]
+        if entry["size"] < st.st_size:
+            try:
+                if ScanIndex._tail_digest(path, entry["size"]) == entry["tail"]:
+                    return ScanIndex.APPENDED, entry["size"]
+            except OSError:
+                pass
+        return ScanIndex.CHANGED, 0
+
+    def record(self, path: str, st: os.stat_result, db_hash: str) -> None:
+        """Stores a file as scanned up to `st.st_size`."""
+        path = os.path.abspath(path)
+        try:
+            tail = ScanIndex._tail_digest(path, st.st_size)
+        except OSError:
+            self.entries.pop(path, None)
+            return
+        self.entries[path] = self._inodes[(st.st_dev, st.st_ino)] = {
+            "dev": st.st_dev,
+            "ino": st.st_ino,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "db": db_hash,
+            "tail": tail,
+        }
+
+    def prune(self, root: str, seen: Iterable[str]) -> None:
+        """Removes the entries of files below `root` that were not seen, i.e. were deleted."""
+        prefix = os.path.join(os.path.abspath(root), "")
+        seen = {os.path.abspath(path) for path in seen}
+        for path in [path for path in self.entries if path.startswith(prefix) and path not in seen]:
+            del self.entries[path]
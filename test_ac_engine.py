@@ -0,0 +1,53 @@
+import random
+
+from engines.ac_engine import AhoCorasick, AhoCorasickEngine
+from engines.python_engine import PythonEngine
+
+
+def _events(engine, data):
+    found = []
+    engine.scan(data, lambda pattern_id, start, end, flags, context: found.append((pattern_id, start, end)))
+    return sorted(found)
+
+
+def test_automaton_finds_overlapping_strings():
+    """Strings that are suffixes or parts of other strings are all reported."""
+    automaton = AhoCorasick([b"he", b"she", b"hers", b"e"])
+    found = []
+    state = automaton.feed(b"ushers", 0, 0, lambda index, start, end: found.append((index, start, end)))
+
+    assert sorted(found) == [(0, 2, 4), (1, 1, 4), (2, 2, 6), (3, 3, 4)]
+    assert state != 0
+
+
+def test_literals_use_automaton_and_other_patterns_inner_engine():
+    """Only plain literals go into the automaton."""
+    engine = AhoCorasickEngine()
+    engine.compile_patterns([b"hello", rb"a\.b", b"x+", b"(test|nokia)"], ids=[10, 11, 12, 13])
+
+    assert engine.literal_ids == [10, 11]
+    assert engine.inner_patterns == [b"x+", b"(test|nokia)"]
+    assert _events(engine, b"hello a.b xx nokia") == \
+        [(10, 0, 5), (11, 6, 9), (12, 10, 12), (12, 11, 12), (13, 13, 18)]
+
+
+def test_same_matches_as_python_engine_in_block_and_stream_mode():
+    """Streaming keeps the automaton state, so matches spanning chunks are found once."""
+    patterns = [b"hello", b"he", b"ell", b"ERROR", b"TODO", rb"\d{3}", b"x+"]
+    engine = AhoCorasickEngine()
+    reference = PythonEngine()
+    for e in (engine, reference):
+        e.compile_patterns(patterns)
+
+    rng = random.Random(0)
+    for _ in range(200):
+        data = "".join(rng.choice(["hello", "he", "ll", "ERROR", "TODO", "1234", "x", " ", "\n"])
+                       for _ in range(rng.randint(0, 40))).encode()
+        expected = _events(reference, data)
+        assert _events(engine, data) == expected
+
+        cuts = sorted(rng.sample(range(len(data) + 1), min(len(data) + 1, 5)))
+        chunks = [data[i:j] for i, j in zip([0] + cuts, cuts + [len(data)])]
+        streamed = []
+        engine.scan_stream(chunks, lambda pattern_id, start, end, flags, context: streamed.append((pattern_id, start, end)))
+        assert sorted(streamed) == expected
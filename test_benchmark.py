@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmark import BenchmarkSuite, percentile
+
+TINY = ["--patterns", "4", "--corpus-mb", "0.05", "--density", "0.05", "--chunk-sizes", "0", "4096",
+        "--engines", "hyperscan", "--files", "4", "--workers", "2", "--repeats", "1"]
+
+
+def _result(**metrics):
+    result = {"pattern_count": 10, "corpus_mb": 4, "match_density": 0.01, "chunk_size": 65536,
+              "engine": "hyperscan", "mode": "serial", "matches": 100,
+              "throughput_mb_s": 100.0, "p50_ms": 1.0, "p99_ms": 5.0}
+    result.update(metrics)
+    return result
+
+
+def test_percentile():
+    """Percentiles use the nearest rank."""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_compare_reports_only_regressions_over_the_threshold():
+    """Lower throughput, higher latency and changed match counts count; improvements and new cases do not."""
+    baseline = [_result(), _result(mode="pool")]
+
+    assert BenchmarkSuite.compare([_result(throughput_mb_s=95.0, p50_ms=1.05)], baseline, 10) == []
+    assert BenchmarkSuite.compare([_result(throughput_mb_s=300.0, p99_ms=1.0)], baseline, 10) == []
+    assert BenchmarkSuite.compare([_result(engine="python", throughput_mb_s=1.0)], baseline, 10) == []
+
+    regressions = BenchmarkSuite.compare([_result(mode="pool", throughput_mb_s=80.0, p99_ms=6.0)], baseline, 10,
+                                         min_latency_ms=0)
+    assert len(regressions) == 2
+    assert "mode=pool" in regressions[0] and "throughput_mb_s 100.00 -> 80.00 (-20.0%)" in regressions[0]
+    assert "p99_ms 5.00 -> 6.00 (+20.0%)" in regressions[1]
+    assert BenchmarkSuite.compare([_result(mode="pool", throughput_mb_s=80.0, p99_ms=6.0)], baseline, 25,
+                                  min_latency_ms=0) == []
+
+    assert BenchmarkSuite.compare([_result(matches=99)], baseline, 10) == [
+        "pattern_count=10, corpus_mb=4, match_density=0.01, chunk_size=65536, engine=hyperscan, "
+        "mode=serial: matches 100 -> 99"]
+
+
+def test_compare_ignores_latency_noise_and_unmeasured_modes():
+    """Latency must grow by more than min_latency_ms as well; modes left out only have their matches compared."""
+    baseline = [_result(p50_ms=0.4, p99_ms=20.0), _result(mode="pool", p50_ms=0.4, p99_ms=20.0)]
+
+    assert BenchmarkSuite.compare([_result(p50_ms=0.8, p99_ms=24.0)], baseline, 10) == []
+    assert BenchmarkSuite.compare([_result(p50_ms=0.8, p99_ms=26.0)], baseline, 10) == [
+        "pattern_count=10, corpus_mb=4, match_density=0.01, chunk_size=65536, engine=hyperscan, "
+        "mode=serial: p99_ms 20.00 -> 26.00 (+30.0%)"]
+
+    slower = [_result(mode="pool", throughput_mb_s=10.0, matches=1)]
+    assert len(BenchmarkSuite.compare(slower, baseline, 10)) == 2
+    assert BenchmarkSuite.compare(slower, baseline, 10, modes=("serial",)) == [
+        "pattern_count=10, corpus_mb=4, match_density=0.01, chunk_size=65536, engine=hyperscan, "
+        "mode=pool: matches 100 -> 1"]
+
+
+def test_run_sweeps_every_case_reproducibly():
+    """Every combination is measured, the generated corpus gives the same matches in every mode and run."""
+    suite = BenchmarkSuite(pattern_counts=[4], corpus_sizes=[0.05], match_densities=[0.0, 0.05],
+                           chunk_sizes=[0, 4096], engines=["hyperscan", "python"], files=4,
+                           workers=2, repeats=2)
+    lines = []
+    results = suite.run(progress=lines.append)
+
+    # the python engine has no threads mode
+    assert len(results) == 2 * 2 * 3 + 2 * 2 * 2
+    assert any("skipping the threads mode" in line for line in lines)
+    for result in results:
+        assert result["files"] == 4
+        assert result["throughput_mb_s"] > 0
+        assert 0 < result["p50_ms"] <= result["p99_ms"]
+    assert {result["matches"] for result in results if result["match_density"] == 0.0} == {0}
+    matches = {result["matches"] for result in results if result["match_density"] == 0.05}
+    assert len(matches) == 1 and matches.pop() > 0
+
+    again = BenchmarkSuite(pattern_counts=[4], corpus_sizes=[0.05], match_densities=[0.05],
+                           chunk_sizes=[4096], engines=["hyperscan"], modes=["serial"], files=4, repeats=1)
+    assert again.run(progress=lambda line: None)[0]["matches"] == [
+        result for result in results if result["match_density"] == 0.05][0]["matches"]
+
+
+def test_cli_gates_on_the_baseline(tmp_path):
+    """bench exits with status 1 when a case regressed; against another environment only match counts count."""
+    output = tmp_path / "results.json"
+    proc = subprocess.run([sys.executable, "main.py", "bench", *TINY, "-o", str(output)],
+                          capture_output=True, text=True, check=False)
+    assert proc.returncode == 0, proc.stderr
+    saved = json.loads(output.read_text(encoding="utf-8"))
+    assert saved["environment"] == BenchmarkSuite.environment()
+    assert len(saved["results"]) == 2 * 3
+
+    faster = tmp_path / "faster.json"
+    for result in saved["results"]:
+        result["throughput_mb_s"] *= 1000
+    faster.write_text(json.dumps(saved), encoding="utf-8")
+    proc = subprocess.run([sys.executable, "main.py", "bench", *TINY, "--baseline", str(faster)],
+                          capture_output=True, text=True, check=False)
+    assert proc.returncode == 1, proc.stderr
+    # the threads and pool cases are only compared with more than one CPU
+    assert proc.stdout.count("Regression: ") == (6 if os.cpu_count() > 1 else 2)
+
+    proc = subprocess.run([sys.executable, "main.py", "bench", *TINY, "--baseline", str(output),
+                           "--max-regression", "100000"], capture_output=True, text=True, check=False)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "No regressions over 100000.0%" in proc.stdout
+
+    saved["environment"]["cpu_count"] = -1
+    faster.write_text(json.dumps(saved), encoding="utf-8")
+    proc = subprocess.run([sys.executable, "main.py", "bench", *TINY, "--baseline", str(faster)],
+                          capture_output=True, text=True, check=False)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "only the numbers of matches are compared" in proc.stdout
+
+    saved["results"][0]["matches"] += 1
+    faster.write_text(json.dumps(saved), encoding="utf-8")
+    proc = subprocess.run([sys.executable, "main.py", "bench", *TINY, "--baseline", str(faster)],
+                          capture_output=True, text=True, check=False)
+    assert proc.returncode == 1, proc.stdout + proc.stderr
+    assert proc.stdout.count("Regression: ") == 1
@@ -0,0 +1,55 @@
+from chunk_profile import ChunkProfile
+from engines.python_engine import PythonEngine
+from file_reader import FileReader
+
+
+def test_load_missing_profile_uses_default_chunk_size(tmp_path):
+    """Without a calibration the default FileReader.CHUNK_SIZE is used."""
+    profile = ChunkProfile.load(str(tmp_path / "missing.json"))
+
+    assert profile.engines == {}
+    assert profile.best_chunk_size(PythonEngine()) == FileReader.CHUNK_SIZE
+
+
+def test_chunk_size_for_small_files_is_file_size():
+    """Files smaller than the calibrated size are read in one chunk."""
+    profile = ChunkProfile()
+    profile.engines["PythonEngine"] = {"chunk_size": 65536}
+    engine = PythonEngine()
+
+    assert profile.chunk_size_for(engine, 1000) == 1000
+    assert profile.chunk_size_for(engine, 10 ** 9) == 65536
+    assert profile.chunk_size_for(engine, 0) == 1
+
+
+def test_calibrate_saves_best_size(tmp_path):
+    """calibrate measures every size and the saved profile can be loaded back."""
+    sample = tmp_path / "sample.txt"
+    sample.write_bytes(b"ERROR something happened\n" * 200)
+
+    engine = PythonEngine()
+    engine.compile_patterns([b"ERROR"])
+
+    path = str(tmp_path / "profile.json")
+    profile = ChunkProfile(path)
+    best = profile.calibrate(engine, str(sample), sizes=[512, 2048], repeats=1)
+    profile.save()
+
+    loaded = ChunkProfile.load(path)
+    assert best in (512, 2048)
+    assert loaded.best_chunk_size(engine) == best
+    assert set(loaded.engines["PythonEngine"]["throughput_mb_s"]) == {"512", "2048"}
+
+
+def test_calibrate_evicts_the_sample_before_every_run(tmp_path, monkeypatch):
+    """Every measured run starts with the sample dropped from the page cache."""
+    sample = tmp_path / "sample.txt"
+    sample.write_bytes(b"ERROR something happened\n" * 200)
+    engine = PythonEngine()
+    engine.compile_patterns([b"ERROR"])
+
+    dropped = []
+    monkeypatch.setattr(ChunkProfile, "_drop_page_cache", staticmethod(dropped.append))
+    ChunkProfile(str(tmp_path / "profile.json")).calibrate(engine, str(sample), sizes=[512, 2048], repeats=2)
+
+    assert dropped == [str(sample)] * 4
@@ -0,0 +1,69 @@
+from chunk_window import ChunkWindow
+
+
+def test_read_slices_retained_chunks(tmp_path):
+    """Matches inside the window, also across chunk borders, are sliced from memory."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abcdefghijkl")
+
+    window = ChunkWindow(str(p), window_size=100)
+    for chunk in (b"abcd", b"efgh", b"ijkl"):
+        window.append(chunk)
+
+    assert window.read(1, 3) == b"bc"
+    assert window.read(2, 10) == b"cdefghij"
+    # the file handle is only opened for matches outside the window
+    assert window._handle is None
+
+
+def test_read_falls_back_to_file_outside_window(tmp_path):
+    """Bytes evicted from the window are read from the file through one handle."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abcdefghijkl")
+
+    with ChunkWindow(str(p), window_size=4) as window:
+        for chunk in (b"abcd", b"efgh", b"ijkl"):
+            window.append(chunk)
+
+        assert window.read(0, 2) == b"ab"
+        handle = window._handle
+        assert window.read(4, 6) == b"ef"
+        assert window._handle is handle
+
+    assert handle.closed
+
+
+def test_track_yields_chunks_unchanged(tmp_path):
+    """track() passes chunks through and retains copies of reused buffers."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abcdef")
+
+    buffer = bytearray(b"abc")
+    window = ChunkWindow(str(p))
+    chunks = list(window.track([memoryview(buffer)]))
+    buffer[:] = b"xyz"
+
+    assert len(chunks) == 1
+    assert window.read(0, 3) == b"abc"
+
+
+def test_read_without_file_clips_to_window():
+    """Without a file to read again (decompressed data), matches are clipped to the retained chunks."""
+    window = ChunkWindow(None, window_size=4)
+    for chunk in (b"abcd", b"efgh", b"ijkl"):
+        window.append(chunk)
+
+    assert window.read(9, 11) == b"jk"
+    assert window.read(2, 10) == b"ij"
+
+
+def test_track_passes_on_the_retained_copy():
+    """A writable chunk is copied once, and the engine gets that copy instead of the reused buffer."""
+    buffer = bytearray(b"abcd")
+    window = ChunkWindow(None)
+
+    passed = next(window.track([memoryview(buffer)]))
+    buffer[:] = b"wxyz"
+
+    assert isinstance(passed, bytes) and passed == b"abcd"
+    assert window.read(0, 4) == b"abcd"
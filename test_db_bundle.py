@@ -0,0 +1,69 @@
+import subprocess
+import sys
+
+import hyperscan
+import pytest
+
+from engines.db_bundle import entry_names, is_bundle, pack_bundle, unpack_bundle
+from engines.hs_engine import HyperscanEngine
+
+
+def test_pack_unpack_roundtrip():
+    """Entries come back with their names, data and order."""
+    data = pack_bundle({"block": b"\x00\x01", "stream": b"abc"})
+
+    assert is_bundle(data)
+    assert list(unpack_bundle(data).items()) == [("block", b"\x00\x01"), ("stream", b"abc")]
+
+
+def test_entry_names_need_only_the_header():
+    """Entry names are read from the beginning of a bundle, without its data."""
+    data = pack_bundle({"shards": b"{}", "shard-0": b"x" * 1000})
+
+    assert entry_names(data[:43]) == ["shards", "shard-0"]
+    with pytest.raises(ValueError):
+        entry_names(data[:20])
+
+
+def test_unpack_rejects_truncated_bundle():
+    """A bundle cut short raises ValueError."""
+    data = pack_bundle({"stream": b"abcdef"})
+
+    with pytest.raises(ValueError):
+        unpack_bundle(data[:-2])
+
+
+def test_engine_saves_and_loads_all_modes(tmp_path):
+    """An engine loaded from a bundle has every database mode that was built."""
+    engine = HyperscanEngine(modes=("block", "stream", "vectored"))
+    engine.compile_patterns([b"test"])
+    path = tmp_path / "bundle.db"
+    engine.save_db(str(path))
+
+    loaded = HyperscanEngine()
+    loaded.load_db(str(path))
+
+    assert loaded.block_db is not None
+    assert loaded.db is not None
+    assert loaded.vectored_db is not None
+
+    found = []
+    loaded.scan(b"a test", lambda *args: found.append(args[:3]))
+    loaded.scan_stream([b"a te", b"st"], lambda *args: found.append(args[:3]))
+    assert found == [(0, 2, 6), (0, 2, 6)]
+
+
+def test_single_mode_build_is_a_bundle_with_a_plain_database_inside(tmp_path):
+    """build --modes stream writes a bundle; its stream entry is a database stock hyperscan.loadb reads."""
+    patterns = tmp_path / "patterns.txt"
+    patterns.write_text("test\nERR[0-9]{2}\n", encoding="utf-8")
+    output = tmp_path / "stream.db"
+    proc = subprocess.run([sys.executable, "main.py", "build", str(patterns), "-o", str(output), "--modes", "stream"],
+                          capture_output=True, text=True, check=False)
+    assert proc.returncode == 0, proc.stderr
+
+    data = output.read_bytes()
+    assert is_bundle(data)
+    assert set(entry_names(data)) == {"stream", "starts", "context", "ids"}
+    db = hyperscan.loadb(unpack_bundle(data)["stream"], hyperscan.HS_MODE_STREAM)
+    assert b"Mode: STREAM" in db.info()
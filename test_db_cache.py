@@ -0,0 +1,62 @@
+import os
+
+from engines.db_cache import DatabaseCache
+from engines.hs_engine import HyperscanEngine
+
+
+def test_key_depends_on_patterns_flags_and_mode():
+    """The same inputs give the same key, any change gives a different one."""
+    key = DatabaseCache.key([b"abc"], [0], [0], 1)
+
+    assert key == DatabaseCache.key([b"abc"], [0], [0], 1)
+    assert key != DatabaseCache.key([b"abd"], [0], [0], 1)
+    assert key != DatabaseCache.key([b"abc"], [1], [0], 1)
+    assert key != DatabaseCache.key([b"abc"], [0], [8], 1)
+    assert key != DatabaseCache.key([b"abc"], [0], [0], 2)
+    # pattern boundaries are part of the key
+    assert DatabaseCache.key([b"ab", b"c"], [0, 1], [0, 0], 1) != \
+        DatabaseCache.key([b"a", b"bc"], [0, 1], [0, 0], 1)
+
+
+def test_put_and_get(tmp_path):
+    """Stored entries can be read back, unknown keys give None."""
+    cache = DatabaseCache(str(tmp_path))
+    cache.put("k1", b"data")
+
+    assert cache.get("k1") == b"data"
+    assert cache.get("missing") is None
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    """When the cache is too big, the entries read longest ago are removed first."""
+    cache = DatabaseCache(str(tmp_path), max_bytes=10)
+    cache.put("old", b"12345")
+    cache.put("new", b"12345")
+    os.utime(tmp_path / "old.db", (1, 1))
+    os.utime(tmp_path / "new.db", (2, 2))
+    cache.get("old")  # refreshes "old", "new" becomes the least recently used
+
+    cache.put("third", b"12345")
+
+    assert cache.get("new") is None
+    assert cache.get("old") == b"12345"
+    assert cache.get("third") == b"12345"
+
+
+def test_engine_loads_repeated_compile_from_cache(tmp_path, monkeypatch):
+    """A second compile of the same patterns does not call the Hyperscan compiler."""
+    cache = DatabaseCache(str(tmp_path))
+    HyperscanEngine(cache=cache).compile_patterns([b"test"])
+    assert len(os.listdir(tmp_path)) == 1
+
+    def fail_database(*args, **kwargs):
+        raise AssertionError("compiled instead of using the cache")
+
+    monkeypatch.setattr("engines.hs_engine.hyperscan.Database", fail_database)
+
+    engine = HyperscanEngine(cache=cache)
+    engine.compile_patterns([b"test"])
+
+    found = []
+    engine.scan_stream([b"a test"], lambda *args: found.append(args[:3]))
+    assert found == [(0, 2, 6)]
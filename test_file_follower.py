@@ -0,0 +1,149 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from chunk_window import ChunkWindow
+from engines.hs_engine import HyperscanEngine
+from engines.python_engine import PythonEngine
+from file_follower import FileFollower, InotifyWatcher, _FollowedFile
+from file_scanner import FileScanner
+from match_sink import MatchSink, NullSink
+
+WATCHERS = [False] + ([True] if InotifyWatcher.available() else [])
+
+
+class _Following:
+    """Runs FileFollower.follow in a thread for the duration of a with block."""
+
+    def __init__(self, target, engine=None, use_inotify=False, from_start=False):
+        self.out = io.StringIO()
+        scanner = FileScanner(engine or HyperscanEngine(), sink=MatchSink(self.out))
+        scanner.compile_patterns(["hello", "ERR[0-9]+;"])
+        self.follower = FileFollower(scanner, use_inotify=use_inotify, from_start=from_start)
+        self.thread = threading.Thread(target=self.follower.follow, args=(str(target),))
+
+    def __enter__(self):
+        self.thread.start()
+        time.sleep(0.2)
+        return self
+
+    def __exit__(self, *exc):
+        self.follower.stop()
+        self.thread.join()
+
+    def wait_for(self, text, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while text not in self.out.getvalue():
+            if time.monotonic() > deadline:
+                raise AssertionError(f"{text!r} not reported, output: {self.out.getvalue()!r}")
+            time.sleep(0.005)
+
+
+def _append(path, data):
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize("use_inotify", WATCHERS)
+def test_appended_bytes_match_across_writes(tmp_path, use_inotify):
+    """Existing content is skipped; a match split over several writes is found with file offsets."""
+    log = tmp_path / "app.log"
+    log.write_bytes(b"old hello\n")
+
+    with _Following(log, use_inotify=use_inotify) as following:
+        _append(log, b"ERR1")
+        time.sleep(0.1)
+        _append(log, b"23; hello\n")
+        following.wait_for("from: 18 end: 23, match: 'hello'")
+
+    out = following.out.getvalue()
+    assert "from: 10 end: 17, match: 'ERR123;'" in out
+    assert "from: 4 end: 9" not in out
+
+
+@pytest.mark.parametrize("use_inotify", WATCHERS)
+def test_rotation_and_truncation(tmp_path, use_inotify):
+    """A rotated log is read to its end and the new file from its start; a truncated file restarts."""
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    log = logs / "app.log"
+    log.write_bytes(b"")
+
+    with _Following(logs, use_inotify=use_inotify) as following:
+        _append(log, b"first hello\n")
+        following.wait_for("app.log', from: 6 end: 11")
+
+        os.rename(log, logs / "app.log.1")
+        log.write_bytes(b"hello new\n")
+        _append(logs / "app.log.1", b"late hello\n")
+        following.wait_for("app.log', from: 0 end: 5")
+        following.wait_for("app.log.1', from: 17 end: 22")
+
+        log.write_bytes(b"")
+        time.sleep(0.2)
+        _append(log, b"x hello\n")
+        following.wait_for("app.log', from: 2 end: 7")
+
+    assert "app.log.1', from: 6 end: 11" not in following.out.getvalue()
+
+
+def test_threaded_stream_for_python_engine(tmp_path):
+    """Engines without persistent streams get one through RegexEngine.open_stream's helper thread."""
+    log = tmp_path / "app.log"
+    log.write_bytes(b"hello\n")
+
+    with _Following(log, engine=PythonEngine(), from_start=True) as following:
+        following.wait_for("from: 0 end: 5")
+        _append(log, b"ERR7;\n")
+        following.wait_for("from: 6 end: 11, match: 'ERR7;'")
+
+
+def test_threaded_stream_reads_the_window_while_no_chunk_is_appended(tmp_path, monkeypatch):
+    """The helper thread of open_stream never reads the chunk window while the follower appends to it."""
+    log = tmp_path / "app.log"
+    log.write_bytes(b"hello x " * 2000)
+    reading = []
+    overlaps = []
+    read, append = ChunkWindow.read, ChunkWindow.append
+
+    def slow_read(self, start, end):
+        reading.append(1)
+        time.sleep(0.0001)
+        try:
+            return read(self, start, end)
+        finally:
+            reading.pop()
+
+    def checked_append(self, chunk):
+        if reading:
+            overlaps.append(len(chunk))
+        return append(self, chunk)
+
+    monkeypatch.setattr(ChunkWindow, "read", slow_read)
+    monkeypatch.setattr(ChunkWindow, "append", checked_append)
+    scanner = FileScanner(PythonEngine(), sink=NullSink(), window_size=64)
+    scanner.compile_patterns(["hello"])
+    followed = _FollowedFile(scanner, str(log), 0)
+    followed.read(16)
+    followed.close()
+
+    assert overlaps == []
+    assert len(scanner.results) == 2000
+    assert {result["match"] for result in scanner.results} == {"hello"}
+
+def test_open_stream_keeps_state_between_scans():
+    """Chunks pushed into an open Hyperscan stream match as one stream."""
+    engine = HyperscanEngine()
+    engine.compile_patterns([b"hello$"])
+    matches = []
+
+    stream = engine.open_stream(lambda *args: matches.append(args[:3]))
+    stream.scan(b"a hel")
+    stream.scan(b"lo")
+    assert matches == []
+    stream.close()
+
+    assert matches == [(0, 2, 7)]
@@ -63,4 +63,115 @@ def test_chunks_default_chunk_size(tmp_path):
     finally:
         FileReader.CHUNK_SIZE = original
 
-    assert chunks == [b"abc", b"def"]
\ No newline at end of file
+    assert chunks == [b"abc", b"def"]
+
+
+def test_chunks_offset_and_length(tmp_path):
+    """offset and length restrict reading to a byte range of the file."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abcdefghijkl")
+
+    chunks = list(FileReader.chunks(str(p), chunk_size=3, offset=2, length=7))
+
+    assert chunks == [b"cde", b"fgh", b"i"]
+
+
+@pytest.mark.parametrize("mode", ["mmap", "readinto", "prefetch"])
+def test_chunks_zero_copy_modes_match_read_mode(tmp_path, mode):
+    """mmap, readinto and prefetch modes yield the same bytes as the default mode."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abcdefghijkl")
+
+    chunks = [bytes(c) for c in FileReader.chunks(str(p), chunk_size=5, mode=mode)]
+    full = [bytes(c) for c in FileReader.chunks(str(p), full_file=True, mode=mode)]
+
+    assert chunks == [b"abcde", b"fghij", b"kl"]
+    assert full == [b"abcdefghijkl"]
+
+
+def test_chunks_readinto_reuses_one_buffer(tmp_path):
+    """readinto mode yields views of a single preallocated buffer."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abcdef")
+
+    chunks = FileReader.chunks(str(p), chunk_size=3, mode="readinto")
+    first = next(chunks)
+    second = next(chunks)
+
+    assert isinstance(first, memoryview)
+    assert first.obj is second.obj
+    # a whole file is not read into a file-sized buffer that would be copied again
+    assert isinstance(next(FileReader.chunks(str(p), full_file=True, mode="readinto")), bytes)
+
+
+def test_chunks_mmap_streams_large_files(tmp_path):
+    """Streamed mmap chunks stay readable after their pages were dropped from the process."""
+    data = bytes(range(256)) * 4096
+    p = tmp_path / "file.bin"
+    p.write_bytes(data)
+
+    chunks = list(FileReader.chunks(str(p), chunk_size=10000, mode="mmap"))
+    assert all(isinstance(chunk, memoryview) and chunk.readonly for chunk in chunks)
+    assert b"".join(bytes(chunk) for chunk in chunks) == data
+
+
+def test_chunks_mmap_empty_file(tmp_path):
+    """An empty file cannot be mapped, mmap mode yields nothing for it."""
+    p = tmp_path / "empty.bin"
+    p.write_bytes(b"")
+
+    assert list(FileReader.chunks(str(p), mode="mmap")) == []
+
+
+def test_chunks_unknown_mode(tmp_path):
+    """An unknown read mode raises ValueError."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"abc")
+
+    with pytest.raises(ValueError):
+        list(FileReader.chunks(str(p), mode="direct"))
+
+
+def _compressed_files(tmp_path, data):
+    """The same content as gzip, bz2 and xz file, and as members of tar.gz and zip archives"""
+    import bz2
+    import gzip
+    import io
+    import lzma
+    import tarfile
+    import zipfile
+
+    for name, module in (("a.log.gz", gzip), ("a.log.bz2", bz2), ("a.log.xz", lzma)):
+        with module.open(tmp_path / name, "wb") as f:
+            f.write(data)
+    with tarfile.open(tmp_path / "logs.tar.gz", "w:gz") as archive:
+        for name in ("logs/one.log", "two.log"):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    with zipfile.ZipFile(tmp_path / "logs.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("logs/", b"")
+        archive.writestr("logs/one.log", data)
+
+
+def test_members_decompress_files_and_archives(tmp_path):
+    """Compressed files are detected by their magic bytes and yield their decompressed members."""
+    data = b"".join(b"line %d\n" % i for i in range(20000))
+    _compressed_files(tmp_path, data)
+    (tmp_path / "plain.txt").write_bytes(data)
+
+    expected = {
+        "a.log.gz": [None], "a.log.bz2": [None], "a.log.xz": [None],
+        "logs.tar.gz": ["logs/one.log", "two.log"], "logs.zip": ["logs/one.log"],
+    }
+    for name, members in expected.items():
+        found = []
+        for member, chunks in FileReader.members(str(tmp_path / name), chunk_size=4096):
+            assert b"".join(bytes(chunk) for chunk in chunks) == data
+            found.append(member)
+        assert found == members, name
+
+    assert FileReader.compression(str(tmp_path / "logs.tar.gz")) == "gzip"
+    assert FileReader.compression(str(tmp_path / "plain.txt")) is None
+    with pytest.raises(ValueError):
+        list(FileReader.members(str(tmp_path / "plain.txt")))
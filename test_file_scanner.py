@@ -1,5 +1,12 @@
+import pytest
+
 from file_scanner import FileScanner
 from file_reader import FileReader
+from match_sink import NullSink
+from engines.ac_engine import AhoCorasickEngine
+from engines.hs_engine import HyperscanEngine
+from engines.python_engine import PythonEngine
+from engines.sharded_engine import ShardedEngine
 
 
 class DummyEngine:
@@ -8,7 +15,7 @@ class DummyEngine:
         self.compiled_patterns = None
         self.scan_calls = []
 
-    def compile_patterns(self, patterns):
+    def compile_patterns(self, patterns, ids=None, flags=None):
         self.compiled_patterns = patterns
 
     def scan_stream(self, chunks_iter, on_match, context=None):
@@ -102,4 +109,164 @@ def test_scan_tree_calls_scan_file_for_each_file(tmp_path, monkeypatch):
 
     assert set(called) == {str(f1), str(f2)}
     assert len(results) == 2
-    assert {r["filename"] for r in results} == {str(f1), str(f2)}
\ No newline at end of file
+    assert {r["filename"] for r in results} == {str(f1), str(f2)}
+
+
+def test_scan_tree_batches_small_files_with_local_offsets(tmp_path):
+    """Small files are scanned in one batch, matches keep per-file offsets."""
+    (tmp_path / "a.txt").write_text("xx test", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("test", encoding="utf-8")
+    (tmp_path / "big.txt").write_text("." * 100 + "test", encoding="utf-8")
+
+    scanner = FileScanner(engine=HyperscanEngine(modes=("stream", "vectored")), batch_file_size=50)
+    scanner.compile_patterns(["test"])
+
+    results = scanner.scan_tree(str(tmp_path))
+
+    found = {(r["filename"], r["start"], r["end"], r["match"]) for r in results}
+    assert found == {
+        (str(tmp_path / "a.txt"), 3, 7, "test"),
+        (str(tmp_path / "b.txt"), 0, 4, "test"),
+        (str(tmp_path / "big.txt"), 100, 104, "test"),
+    }
+
+
+def test_scan_file_picks_block_mode_by_size(tmp_path):
+    """Files up to block_max_size go to engine.scan, larger ones to scan_stream."""
+    class ModeEngine(DummyEngine):
+        def __init__(self):
+            super().__init__()
+            self.block_calls = []
+
+        def scan(self, data, on_match, context=None):
+            self.block_calls.append((bytes(data), context))
+
+    small = tmp_path / "small.txt"
+    large = tmp_path / "large.txt"
+    small.write_text("abc", encoding="utf-8")
+    large.write_text("abcdefghij", encoding="utf-8")
+
+    engine = ModeEngine()
+    scanner = FileScanner(engine=engine, block_max_size=5)
+    scanner.scan_file(str(small))
+    scanner.scan_file(str(large))
+
+    assert engine.block_calls == [(b"abc", str(small))]
+    assert engine.scan_calls == [(b"abcdefghij", str(large))]
+
+
+def test_scan_tree_reads_files_ahead_in_prefetch_mode(tmp_path):
+    """With read_mode "prefetch", whole-file and streamed scans find the same matches."""
+    for i in range(6):
+        (tmp_path / f"f{i}.txt").write_bytes(b"..abc.." * (i * 50 + 1))
+    engine = HyperscanEngine(modes=("block", "stream"))
+    engine.compile_patterns([b"abc"])
+
+    def found(**options):
+        scanner = FileScanner(engine, **options)
+        return sorted((r["filename"], r["start"], r["end"], r["match"]) for r in scanner.scan_tree(tmp_path))
+
+    expected = found()
+    assert len(expected) == sum(i * 50 + 1 for i in range(6))
+    assert found(read_mode="prefetch", prefetch_depth=2, block_max_size=1000) == expected
+    assert found(read_mode="prefetch", prefetch_depth=1) == expected
+
+
+@pytest.mark.parametrize("engine_cls", [HyperscanEngine, PythonEngine, AhoCorasickEngine])
+@pytest.mark.parametrize("options", [{}, {"block_max_size": 1 << 20}, {"read_mode": "prefetch"}])
+def test_limits_stop_the_scan_of_a_file(tmp_path, monkeypatch, engine_cls, options):
+    """files_with_matches and max_matches stop the engine's scan; count reports totals per pattern."""
+    p = tmp_path / "file.txt"
+    p.write_bytes(b"abc 12 abc 34 abc\n" * 1000)
+    read = []
+    chunks = FileReader.chunks
+    monkeypatch.setattr(FileReader, "chunks", lambda *a, **k: (read.append(len(c)) or c for c in chunks(*a, **k)))
+
+    def scan(**limits):
+        scanner = FileScanner(engine_cls(), sink=NullSink(), **options, **limits)
+        scanner.compile_patterns(["abc", "[0-9][0-9]"])
+        return scanner.scan_file(str(p), chunk_size=64)
+
+    assert scan(files_with_matches=True) == [{"filename": str(p)}]
+    if "block_max_size" not in options:
+        assert sum(read) < 1000
+
+    results = scan(max_matches=2)
+    assert sorted((r["pattern_id"], r["match"]) for r in results) == [(0, "abc"), (0, "abc"), (1, "12"), (1, "34")]
+
+    assert scan(count=True) == [
+        {"pattern_id": 0, "count": 3000, "filename": str(p)},
+        {"pattern_id": 1, "count": 2000, "filename": str(p)},
+    ]
+    assert [r["count"] for r in scan(count=True, max_matches=5)] == [5, 5]
+
+
+@pytest.mark.parametrize("engine_cls", [HyperscanEngine, ShardedEngine])
+def test_max_matches_stops_the_scan_with_a_loaded_database(tmp_path, monkeypatch, engine_cls):
+    """A database loaded from a file has no pattern list, the pattern ids come from the bundle."""
+    p = tmp_path / "file.txt"
+    p.write_bytes(b"abc 12 abc 34 abc\n" * 1000)
+    built = engine_cls(modes=("stream",)) if engine_cls is HyperscanEngine else engine_cls(shard_size=1)
+    built.compile_patterns([b"abc", b"[0-9][0-9]"])
+    built.save_db(str(tmp_path / "patterns.db"))
+    read = []
+    chunks = FileReader.chunks
+    monkeypatch.setattr(FileReader, "chunks", lambda *a, **k: (read.append(len(c)) or c for c in chunks(*a, **k)))
+
+    scanner = FileScanner(engine_cls(), sink=NullSink(), max_matches=2)
+    scanner.load_patterns(str(tmp_path / "patterns.db"))
+    results = scanner.scan_file(str(p), chunk_size=64)
+
+    assert sorted((r["pattern_id"], r["match"]) for r in results) == [(0, "abc"), (0, "abc"), (1, "12"), (1, "34")]
+    assert sum(read) < 1000
+
+
+def test_scan_compressed_files_and_archive_members(tmp_path):
+    """Matches in compressed files have decompressed offsets, archive members their member path."""
+    import gzip
+    import io
+    import tarfile
+
+    data = b"x" * 100000 + b" error\n"
+    with gzip.open(tmp_path / "a.log.gz", "wb") as f:
+        f.write(data)
+    with tarfile.open(tmp_path / "logs.tar.gz", "w:gz") as archive:
+        info = tarfile.TarInfo("logs/app.log")
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+
+    scanner = FileScanner(HyperscanEngine(), sink=NullSink(), window_size=16)
+    scanner.compile_patterns(["error"])
+    found = [(r["filename"], r["start"], r["end"], r["match"])
+             for name in ("a.log.gz", "logs.tar.gz") for r in scanner.scan_file(str(tmp_path / name))]
+    assert found == [
+        (str(tmp_path / "a.log.gz"), 100001, 100006, "error"),
+        (str(tmp_path / "logs.tar.gz") + "!logs/app.log", 100001, 100006, "error"),
+    ]
+
+    assert FileScanner(HyperscanEngine(), sink=NullSink(), decompress=False).scan_file(
+        str(tmp_path / "a.log.gz")) == []
+
+
+@pytest.mark.parametrize("read_mode", ["read", "readinto", "prefetch"])
+def test_compression_is_detected_from_the_first_chunks(tmp_path, monkeypatch, read_mode):
+    """A plain file is opened once per scan; a gzip file is found even when its chunks are smaller than the head."""
+    import builtins
+    import gzip
+
+    plain = tmp_path / "plain.log"
+    plain.write_bytes(b"x" * 1000 + b" error\n")
+    with gzip.open(tmp_path / "a.log.gz", "wb") as f:
+        f.write(b"x" * 1000 + b" error\n")
+    opened = []
+    real_open = builtins.open
+    monkeypatch.setattr(builtins, "open", lambda path, *a, **k: opened.append(str(path)) or real_open(path, *a, **k))
+
+    scanner = FileScanner(HyperscanEngine(), sink=NullSink(), read_mode=read_mode)
+    scanner.compile_patterns(["error"])
+    for full_file in (False, True):
+        assert [r["start"] for r in scanner.scan_file(str(plain), chunk_size=64, full_file=full_file)] == [1001]
+        assert [r["start"] for r in scanner.scan_file(str(tmp_path / "a.log.gz"), chunk_size=64,
+                                                      full_file=full_file)] == [1001]
+
+    assert opened.count(str(plain)) == 2
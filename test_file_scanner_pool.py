@@ -0,0 +1,157 @@
+import file_scanner_pool
+from engines.ac_engine import AhoCorasickEngine
+from engines.hs_engine import HyperscanEngine
+from engines.python_engine import PythonEngine
+from file_scanner_pool import FileScannerPool
+
+
+def test_init_worker_loads_serialized_database(tmp_path, capsys):
+    """The worker initializer deserializes the database once; tasks only carry paths and return matches."""
+    engine = HyperscanEngine()
+    engine.compile_patterns([b"test"])
+
+    FileScannerPool._init_worker(HyperscanEngine, engine.dumpb(), [])
+    scanner = file_scanner_pool._worker_scanner
+    assert scanner.engine.db is not None
+
+    p = tmp_path / "file.txt"
+    p.write_text("a test line", encoding="utf-8")
+    results = FileScannerPool._run_task(("files", [str(p)]))
+
+    assert [r["match"] for r in results] == ["test"]
+    assert capsys.readouterr().out == ""
+
+
+def test_init_worker_compiles_patterns_without_serialization():
+    """Engines without dumpb() get the pattern list compiled in the initializer."""
+    FileScannerPool._init_worker(PythonEngine, None, [b"abc"])
+
+    assert file_scanner_pool._worker_scanner.engine.patterns == [b"abc"]
+
+
+def test_init_worker_keeps_the_engine_options():
+    """Workers build their engine with the options of the parent's engine, e.g. --no-combine."""
+    for engine in (PythonEngine(combine=False, prefilter=False),
+                   AhoCorasickEngine(PythonEngine(combine=False, prefilter=False))):
+        FileScannerPool._init_worker(type(engine), None, [b"abc", b"a+c"], None, None, None,
+                                     engine.constructor_options())
+        worker_engine = file_scanner_pool._worker_scanner.engine
+        python_engine = getattr(worker_engine, "inner", worker_engine)
+
+        assert type(worker_engine) is type(engine)
+        assert not python_engine.combine and not python_engine.use_prefilter
+        assert python_engine.prefilter is None
+
+def test_scan_tree_uses_one_pool_for_all_directories(tmp_path, capfd):
+    """Files from nested directories are all scanned by the same pool."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\n", encoding="utf-8")
+
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    (tree / "a.txt").write_text("test", encoding="utf-8")
+    (tree / "sub" / "b.txt").write_text("other test", encoding="utf-8")
+
+    FileScannerPool.scan_tree(str(regex_file), HyperscanEngine(), str(tree), processes=2)
+
+    out = capfd.readouterr().out
+    assert "a.txt" in out
+    assert "b.txt" in out
+
+
+def test_schedule_orders_largest_first_and_splits_large_files(tmp_path):
+    """Large files are cut into ranges, everything is ordered by size, descending."""
+    small = tmp_path / "small.txt"
+    medium = tmp_path / "medium.txt"
+    large = tmp_path / "large.txt"
+    small.write_bytes(b"a" * 10)
+    medium.write_bytes(b"a" * 50)
+    large.write_bytes(b"a" * 250)
+
+    tasks, ranges = FileScannerPool._schedule([str(small), str(large), str(medium)],
+                                              overlap=4, split_threshold=100, batch_size=10)
+
+    assert tasks == [
+        ("range", str(large), 0, 100, 4, 0),
+        ("range", str(large), 100, 200, 4, 0),
+        ("range", str(large), 200, 250, 4, 0),
+        ("files", [str(medium), str(small)]),
+    ]
+    assert ranges == {str(large): 3}
+
+
+def test_schedule_does_not_split_without_overlap(tmp_path):
+    """With unbounded patterns (no overlap) large files are scanned whole."""
+    large = tmp_path / "large.txt"
+    large.write_bytes(b"a" * 250)
+
+    tasks, ranges = FileScannerPool._schedule([str(large)], overlap=None,
+                                              split_threshold=100, batch_size=10)
+
+    assert tasks == [("files", [str(large)])]
+    assert ranges == {}
+
+
+def test_split_scan_reports_same_matches_as_whole_file(tmp_path, capfd):
+    """Matches straddling range borders are reported once with file offsets."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\\d{3}\n", encoding="utf-8")
+
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "big.txt").write_bytes(b"..test123.." * 40)
+
+    FileScannerPool.scan_tree(str(regex_file), HyperscanEngine(), str(tree),
+                              processes=2, split_threshold=16)
+    split_out = capfd.readouterr().out
+
+    FileScannerPool.scan_file(str(regex_file), HyperscanEngine(), str(tree / "big.txt"))
+    whole_out = capfd.readouterr().out
+
+    assert split_out.count("match: 'test123'") == 40
+    assert split_out == whole_out
+
+
+def test_split_scan_leaves_end_anchors_to_the_next_range(tmp_path, capfd):
+    """`$` at the end of a range is not a match unless the file ends there."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("abc$\n\\bmore\\b\n", encoding="utf-8")
+
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "big.txt").write_bytes(b"xxabc\nmore text here abc\nmoreover abc")
+
+    for split_threshold in range(1, 12):
+        FileScannerPool.scan_tree(str(regex_file), HyperscanEngine(), str(tree),
+                                  processes=2, split_threshold=split_threshold)
+        split_out = capfd.readouterr().out
+        FileScannerPool.scan_file(str(regex_file), HyperscanEngine(), str(tree / "big.txt"))
+        assert split_out == capfd.readouterr().out, split_threshold
+    assert split_out.count("match: 'abc'") == 1 and split_out.count("match: 'more'") == 1
+
+
+def test_built_database_splits_like_the_pattern_file(tmp_path, capfd):
+    """A database saved by build keeps the overlap, so --pool splits large files with it too."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\\d{3}\nend$\n", encoding="utf-8")
+    compiled = HyperscanEngine()
+    compiled.compile_patterns([b"test\\d{3}", b"end$"])
+    compiled.save_db(str(tmp_path / "hs.db"), mode="stream")
+
+    loaded = HyperscanEngine()
+    loaded.load_db(str(tmp_path / "hs.db"))
+    assert loaded.split_context() == compiled.split_context() == (7, 2)
+
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "big.txt").write_bytes(b"..test123..end\n" * 40)
+    overlap, lookahead = loaded.split_context()
+    tasks, _ = FileScannerPool._schedule([str(tree / "big.txt")], overlap, 64, 10, lookahead)
+    assert len(tasks) == 10
+
+    FileScannerPool.scan_tree(str(tmp_path / "hs.db"), HyperscanEngine(), str(tree),
+                              processes=2, split_threshold=64)
+    split_out = capfd.readouterr().out
+    FileScannerPool.scan_file(str(regex_file), HyperscanEngine(), str(tree / "big.txt"))
+    assert split_out == capfd.readouterr().out
+    assert split_out.count("match: 'test123'") == 40 and split_out.count("match: 'end'") == 1
@@ -0,0 +1,78 @@
+import io
+import subprocess
+import sys
+
+from engines.hs_engine import HyperscanEngine
+from file_scanner import FileScanner
+from file_scanner_threads import FileScannerThreads
+from match_sink import MatchSink
+
+
+def _tree(tmp_path):
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\n[0-9]+-[0-9]+\nend$\n", encoding="utf-8")
+
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    for i in range(40):
+        (tree / f"f{i}.txt").write_text(f"a test {i}-{i * 7} line\n" * (i + 1) + "the end", encoding="utf-8")
+    (tree / "sub" / "big.txt").write_bytes(b"test 12-34 " * 50000 + b"end")
+    return regex_file, tree
+
+
+def _key(result):
+    return result["filename"], result["start"], result["end"], result["pattern_id"], result["match"]
+
+
+def test_threads_find_the_same_matches_as_a_serial_scan(tmp_path):
+    """Every thread scans with its own scratch; the results equal a single-threaded scan."""
+    regex_file, tree = _tree(tmp_path)
+    options = dict(block_max_size=4096, batch_file_size=256)
+
+    serial = FileScanner(HyperscanEngine(modes=("stream", "block", "vectored")), **options)
+    serial.load_patterns(str(regex_file))
+    expected = sorted(map(_key, serial.scan_tree(tree)))
+
+    out = io.StringIO()
+    results = FileScannerThreads.scan_tree(str(regex_file), HyperscanEngine(modes=("stream", "block", "vectored")),
+                                           str(tree), threads=4, sink=MatchSink(out), **options)
+
+    assert sorted(map(_key, results)) == expected
+    lines = out.getvalue().splitlines()
+    assert len(lines) == len(expected)
+    assert all(line.startswith("Regex with ID: ") for line in lines)
+
+
+def test_clone_for_thread_shares_databases_with_own_scratch():
+    """Clones reuse the compiled databases and only clone the scratch space."""
+    engine = HyperscanEngine(modes=("stream", "block"))
+    engine.compile_patterns([b"test"])
+
+    first, second = engine.clone_for_thread(), engine.clone_for_thread()
+
+    assert first.db is engine.db and first.block_db is engine.block_db
+    assert first.scratches["stream"] is not second.scratches["stream"]
+    assert first.scratches["stream"] is not engine.db.scratch
+
+    matches = []
+    first.scan_stream([b"a te", b"st"], lambda *args: matches.append(args[:3]))
+    second.scan(b"test", lambda *args: matches.append(args[:3]))
+    assert matches == [(0, 2, 6), (0, 0, 4)]
+
+
+def test_cli_threads_with_python_engine_recommends_pool(tmp_path):
+    """--threads does not help PythonEngine; the CLI says so and scans in one thread."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\n", encoding="utf-8")
+    target_file = tmp_path / "input.txt"
+    target_file.write_text("this is a test line\n", encoding="utf-8")
+
+    proc = subprocess.run(
+        [sys.executable, "main.py", "run", str(regex_file), str(target_file),
+         "--engine", "python", "--threads", "2"],
+        capture_output=True, text=True, check=False,
+    )
+
+    assert proc.returncode == 0, proc.stderr
+    assert "use --pool" in proc.stdout
+    assert "match: 'test'" in proc.stdout
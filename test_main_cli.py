@@ -66,3 +66,15 @@ def test_cli_build_database(tmp_path):
 
     assert proc.returncode == 0, f"Build command failed: {proc.stderr}"
     assert db_file.exists()
+
+
+def test_cli_database_cache_stays_out_of_the_real_home(tmp_path, isolated_home):
+    """The default database cache of a CLI run lands in the test's home, not in the user's."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\n", encoding="utf-8")
+
+    proc = subprocess.run([sys.executable, "main.py", "build", str(regex_file), "-o", str(tmp_path / "db.hs")],
+                          capture_output=True, text=True, check=False)
+
+    assert proc.returncode == 0, proc.stderr
+    assert list((isolated_home / ".cache" / "nokia_project" / "hsdb").glob("*.db"))
@@ -0,0 +1,132 @@
+import io
+import json
+import subprocess
+import sys
+import threading
+
+from engines.hs_engine import HyperscanEngine
+from file_scanner import FileScanner
+from file_scanner_pool import FileScannerPool
+from file_scanner_threads import FileScannerThreads
+from match_sink import BinarySink, JsonLinesSink, MatchSink, ThreadedSink
+
+RESULTS = [
+    {"pattern_id": 0, "start": 0, "end": 5, "match": "hello", "filename": "/tmp/a.txt"},
+    {"pattern_id": 3, "start": 7, "end": 12, "match": "wörld", "filename": "/tmp/b.txt"},
+    {"pattern_id": 1, "start": 2**40, "end": 2**40 + 3, "match": "abc", "filename": "/tmp/a.txt"},
+]
+# results of FileScanner's count and files_with_matches modes
+SUMMARIES = [
+    {"pattern_id": 3, "count": 12, "filename": "/tmp/b.txt"},
+    {"filename": "/tmp/c.txt"},
+]
+
+
+def test_text_sink_buffers_until_flush():
+    """Records are collected in the buffer and written in one block."""
+    out = io.StringIO()
+    sink = MatchSink(out)
+    for result in RESULTS:
+        sink.write(result)
+    assert out.getvalue() == ""
+
+    sink.flush()
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "Regex with ID: 0, filename: '/tmp/a.txt', from: 0 end: 5, match: 'hello'"
+    assert len(lines) == 3
+
+    assert [MatchSink.format(result) for result in SUMMARIES] == [
+        "Regex with ID: 3, filename: '/tmp/b.txt', count: 12", "/tmp/c.txt"]
+
+
+def test_jsonl_and_binary_round_trip():
+    """JSONL lines and binary records decode to the written results, counts and file names."""
+    out = io.BytesIO()
+    sink = JsonLinesSink(out)
+    for result in RESULTS + SUMMARIES:
+        sink.write(result)
+    sink.flush()
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == RESULTS + SUMMARIES
+
+    out = io.BytesIO()
+    sink = BinarySink(out)
+    for result in RESULTS + SUMMARIES:
+        sink.write(result)
+    sink.flush()
+    out.seek(0)
+    assert list(BinarySink.read(out)) == RESULTS + SUMMARIES
+
+
+def test_scanners_streaming_to_a_sink_keep_no_results(tmp_path):
+    """With keep_results=False matches only go to the sink, in a single thread, in threads and in a pool."""
+    patterns = tmp_path / "patterns.txt"
+    patterns.write_text("test\n", encoding="utf-8")
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    for i in range(3):
+        (tree / f"{i}.txt").write_text("test " * 100, encoding="utf-8")
+
+    out = io.BytesIO()
+    scanner = FileScanner(HyperscanEngine(), sink=JsonLinesSink(out), keep_results=False)
+    scanner.load_patterns(str(patterns))
+    assert scanner.scan_file(str(tree / "0.txt")) == []
+    assert scanner.scan_tree(str(tree)) == []
+    assert scanner.results == []
+    scanner.sink.flush()
+    assert len(out.getvalue().splitlines()) == 400
+
+    out = io.BytesIO()
+    assert FileScannerThreads.scan_tree(str(patterns), HyperscanEngine(), str(tree), threads=2,
+                                        sink=JsonLinesSink(out), keep_results=False) == []
+    assert len(out.getvalue().splitlines()) == 300
+
+    out = io.BytesIO()
+    FileScannerPool.scan_tree(str(patterns), HyperscanEngine(), str(tree), processes=2,
+                              sink=JsonLinesSink(out), keep_results=False)
+    assert len(out.getvalue().splitlines()) == 300
+
+def test_threaded_writes_do_not_interleave():
+    """Records of several threads, directly or through a writer thread, stay whole."""
+    out = io.BytesIO()
+    sink = MatchSink(out, buffer_size=4096)
+    writer = ThreadedSink(sink)
+
+    def run(i):
+        for n in range(500):
+            target = writer if n % 2 else sink
+            target.write({"pattern_id": i, "start": n, "end": n + 5, "match": "x" * 50, "filename": f"f{i}"})
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    lines = out.getvalue().decode().splitlines()
+    assert len(lines) == 2000
+    assert all(line.endswith("match: '" + "x" * 50 + "'") for line in lines)
+
+
+def test_cli_writes_jsonl_output_file(tmp_path):
+    """run -o writes the matches to a file in the chosen format instead of standard output."""
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("test\n", encoding="utf-8")
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "a.txt").write_text("a test\n", encoding="utf-8")
+    (tree / "b.txt").write_text("test test\n", encoding="utf-8")
+    output = tmp_path / "matches.jsonl"
+
+    for mode in ([], ["--pool"], ["--threads", "2"]):
+        proc = subprocess.run(
+            [sys.executable, "main.py", "run", str(regex_file), str(tree),
+             "-o", str(output), "--format", "jsonl"] + mode,
+            capture_output=True, text=True, check=False,
+        )
+
+        assert proc.returncode == 0, proc.stderr
+        assert "match:" not in proc.stdout
+        results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+        assert sorted((r["filename"], r["start"]) for r in results) == [
+            (str(tree / "a.txt"), 2), (str(tree / "b.txt"), 0), (str(tree / "b.txt"), 5)]
@@ -0,0 +1,93 @@
+import pytest
+
+from engines import pattern_flags
+from engines.ac_engine import AhoCorasickEngine
+from engines.hs_engine import HyperscanEngine
+from engines.python_engine import PythonEngine
+from file_regex.file_regex import FileRegex
+from file_scanner import FileScanner
+from match_sink import NullSink
+
+PATTERNS = "error\nERR[0-9]+;, caseless\nhello, single-match\nab?c, id=40\n"
+TEXT = b"hello error Err12; ERR3; abc ac hello\nerror\n"
+
+
+def _found(results):
+    return sorted((r["pattern_id"], r["start"], r["end"], r["match"]) for r in results)
+
+
+def test_entries_parse_flags_and_ids(tmp_path, capsys):
+    """Options after the comma set flags and ids; lines without an id keep their position."""
+    path = tmp_path / "patterns.txt"
+    path.write_text("hello\nERR[0-9]+, caseless, id=17\nabc, single-match no-som\nx, typo\n", encoding="utf-8")
+
+    assert FileRegex(str(path)).entries() == [
+        ("hello", 0, 0),
+        ("ERR[0-9]+", 17, pattern_flags.CASELESS),
+        ("abc", 2, pattern_flags.SINGLEMATCH | pattern_flags.NO_SOM),
+        ("x", 3, 0),
+    ]
+    assert "unknown pattern option 'typo' in line 4" in capsys.readouterr().out
+
+    path.write_text("a, id=1\nb\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="Duplicate pattern id 1"):
+        FileRegex(str(path)).entries()
+
+
+def test_entries_keep_commas_of_quantifiers(tmp_path, capsys):
+    """A comma in {m,} or {m,n} belongs to the pattern, options after it are still read."""
+    path = tmp_path / "patterns.txt"
+    path.write_text("[a-z]{2,}\\.com\nx{2,5}, caseless id=9\na{1,},b\n", encoding="utf-8")
+
+    assert FileRegex(str(path)).entries() == [
+        ("[a-z]{2,}\\.com", 0, 0),
+        ("x{2,5}", 9, pattern_flags.CASELESS),
+        ("a{1,}", 2, 0),
+    ]
+    assert "unknown pattern option 'b' in line 3" in capsys.readouterr().out
+    assert FileRegex(str(path)).elements() == ["[a-z]{2,}\\.com", "x{2,5}", "a{1,}"]
+
+
+def test_entries_reject_single_match_with_som(tmp_path):
+    """single-match with som is refused with the line number instead of failing in the Hyperscan compiler."""
+    path = tmp_path / "patterns.txt"
+    path.write_text("a\nab?c, single-match som\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="'single-match' and 'som' cannot be combined .* in line 2"):
+        FileRegex(str(path)).entries()
+
+
+@pytest.mark.parametrize("engine_cls", [HyperscanEngine, PythonEngine, AhoCorasickEngine])
+def test_engines_honour_flags_and_ids(tmp_path, engine_cls):
+    """Caseless, single-match and explicit ids give the same matches with every engine."""
+    patterns = tmp_path / "patterns.txt"
+    patterns.write_text(PATTERNS, encoding="utf-8")
+    target = tmp_path / "a.txt"
+    target.write_bytes(TEXT)
+
+    scanner = FileScanner(engine_cls(), sink=NullSink())
+    scanner.load_patterns(str(patterns))
+
+    assert _found(scanner.scan_file(str(target))) == [
+        (0, 6, 11, "error"), (0, 38, 43, "error"),
+        (1, 12, 18, "Err12;"), (1, 19, 24, "ERR3;"),
+        (2, 0, 5, "hello"),
+        (40, 25, 28, "abc"), (40, 29, 31, "ac"),
+    ]
+
+
+def test_only_variable_width_patterns_use_som(tmp_path):
+    """Fixed-width patterns get their start from the width, also after dumpb/loadb; no-som matches are empty."""
+    engine = HyperscanEngine(modes=("stream", "block"))
+    engine.compile_patterns([b"error", b"ERR[0-9]{2};", b"ab?c", b"WARN[0-9]+"],
+                            flags=[0, 0, 0, pattern_flags.NO_SOM])
+    assert engine.starts == {0: 5, 1: 6, 3: None}
+
+    loaded = HyperscanEngine()
+    loaded.loadb(engine.dumpb(mode="stream"))
+    assert loaded.starts == engine.starts
+
+    for e in (engine, loaded):
+        matches = []
+        e.scan_stream([b"an err", b"or ERR12; abc WARN77"], lambda *args: matches.append(args[:3]))
+        assert sorted(matches) == [(0, 3, 8), (1, 9, 15), (2, 16, 19), (3, 25, 25), (3, 26, 26)]
@@ -0,0 +1,166 @@
+import subprocess
+import sys
+
+import pytest
+
+from engines import pattern_flags
+from engines.hs_engine import HyperscanEngine
+from engines.sharded_engine import ShardedEngine
+from file_regex.file_regex import FileRegex
+from pattern_store import PatternStore
+
+PATTERNS = [b"error", b"ERR[0-9]+;", b"hello", b"ab?c", b"warn", b"x{3}"]
+TEXT = b"hello error Err12; ERR3; abc ac xxxx warn hello\nerror\n"
+
+
+def _matches(engine, scan):
+    matches = []
+    scan(engine, lambda *args: matches.append(args[:3]))
+    return sorted(matches)
+
+
+def test_store_keeps_ids_stable(tmp_path):
+    """Ids are kept when patterns are added again, and removed ids are never reused."""
+    path = str(tmp_path / "patterns.db")
+    with PatternStore(path) as store:
+        assert store.add([("a", None, 0), ("b", None, 0), ("c", None, 0)]) == 3
+        assert store.add([("b", None, pattern_flags.CASELESS), ("d", None, 0)]) == 1
+        assert store.remove(["d", "c", "missing"]) == 2
+        assert store.add([("e", None, 0)]) == 1
+
+    assert PatternStore.is_store(path)
+    with PatternStore(path) as store:
+        assert store.entries() == [("a", 1, 0), ("b", 2, pattern_flags.CASELESS), ("e", 5, 0)]
+
+        with pytest.raises(ValueError, match="already has id 1"):
+            store.add([("f", None, 0), ("a", 7, 0)])
+        with pytest.raises(ValueError, match="id 2 is already used"):
+            store.add([("g", 2, 0)])
+        # a failed bulk add adds nothing
+        assert len(store) == 3
+
+        store.export(str(tmp_path / "patterns.txt"))
+    assert FileRegex(str(tmp_path / "patterns.txt")).entries() == [
+        ("a", 1, 0), ("b", 2, pattern_flags.CASELESS), ("e", 5, 0)]
+
+
+def test_sharded_engine_matches_like_one_database():
+    """Scans over several shards report the matches of a single database, with the original ids."""
+    single = HyperscanEngine(modes=("block", "stream", "vectored"))
+    single.compile_patterns(PATTERNS)
+    sharded = ShardedEngine(modes=("block", "stream", "vectored"), shard_size=2)
+    assert sharded.compile_patterns(PATTERNS) == 3
+
+    loaded = ShardedEngine(modes=("block", "stream", "vectored"))
+    loaded.loadb(sharded.dumpb())
+    assert len(loaded.shards) == 3
+
+    def scan_stream(engine, callback):
+        stream = engine.open_stream(callback)
+        for i in range(0, len(TEXT), 7):
+            stream.scan(TEXT[i:i + 7])
+        stream.close()
+
+    scans = [
+        lambda engine, callback: engine.scan(TEXT, callback),
+        lambda engine, callback: engine.scan_stream([TEXT[:10], TEXT[10:]], callback),
+        lambda engine, callback: engine.scan_batch([TEXT], callback, ["a"]),
+        scan_stream,
+    ]
+    for scan in scans:
+        expected = _matches(single, scan)
+        assert _matches(sharded, scan) == expected
+        assert _matches(loaded, scan) == expected
+        assert _matches(sharded.clone_for_thread(), scan) == expected
+
+
+def test_callback_stops_all_shards():
+    """A callback returning True stops the scan in every shard, in scan_batch only for its buffer."""
+    sharded = ShardedEngine(modes=("stream", "vectored"), shard_size=2)
+    sharded.compile_patterns(PATTERNS)
+
+    matches = []
+    sharded.scan_stream([TEXT], lambda *args: matches.append(args) or True)
+    assert len(matches) == 1
+
+    matches = []
+    sharded.scan_batch([TEXT, TEXT], lambda *args: matches.append(args[4]) or args[4] == "a", ["a", "b"])
+    assert matches.count("a") == 1 and matches.count("b") > 1
+
+
+def test_shards_compile_in_parallel_and_merge_matches():
+    """Equal shards compiled by worker processes report the matches of one database, ordered by end offset."""
+    single = HyperscanEngine(modes=("block", "stream"))
+    single.compile_patterns(PATTERNS)
+    sharded = ShardedEngine(modes=("block", "stream"), shard_count=3, processes=2)
+    assert sharded.compile_patterns(PATTERNS) == 3
+    assert [shard.ids for shard in sharded.shards] == [[0, 1], [2, 3], [4, 5]]
+
+    for scan in (lambda engine, callback: engine.scan(TEXT, callback),
+                 lambda engine, callback: engine.scan_stream([TEXT], callback)):
+        matches = []
+        scan(sharded, lambda *args: matches.append(args[:3]))
+        assert [end for _, _, end in matches] == sorted(end for _, _, end in matches)
+        assert sorted(matches) == _matches(single, scan)
+
+
+def test_rebuild_compiles_only_changed_shards():
+    """Shards with unchanged patterns are taken from the previous build."""
+    ids = list(range(len(PATTERNS)))
+    previous = ShardedEngine(shard_size=2)
+    previous.compile_patterns(PATTERNS, ids)
+
+    engine = ShardedEngine(shard_size=2)
+    # a new pattern in the last shard, one removed from the first
+    assert engine.compile_patterns(PATTERNS[1:] + [b"new"], ids[1:] + [7], previous=previous) == 2
+    assert engine.shards[1] is previous.shards[1]
+
+
+def test_cli_builds_a_store_incrementally(tmp_path):
+    """patterns add fills the store, build recompiles only changed shards and run scans the result."""
+    store = tmp_path / "patterns.db"
+    output = tmp_path / "hs.db"
+    first = tmp_path / "first.txt"
+    first.write_text("error\nERR[0-9]+;, caseless\n", encoding="utf-8")
+    second = tmp_path / "second.txt"
+    second.write_text("hello\n", encoding="utf-8")
+    target = tmp_path / "a.txt"
+    target.write_text("hello error Err12;\n", encoding="utf-8")
+
+    def main(*args):
+        proc = subprocess.run([sys.executable, "main.py", *args], capture_output=True, text=True, check=False)
+        assert proc.returncode == 0, proc.stderr
+        return proc.stdout
+
+    build = ("build", str(store), "-o", str(output), "--no-cache")
+    assert "Added 2 patterns" in main("patterns", str(store), "add", str(first))
+    assert "Compiled 1 of 1 shards" in main(*build)
+    assert "Compiled 0 of 1 shards" in main(*build)
+    assert "Added 1 patterns" in main("patterns", str(store), "add", str(second))
+    assert "Compiled 1 of 1 shards" in main(*build)
+
+    out = main("run", str(output), str(target))
+    assert "Regex with ID: 3, filename: '%s', from: 0 end: 5, match: 'hello'" % target in out
+    assert "Regex with ID: 2, filename: '%s', from: 12 end: 18, match: 'Err12;'" % target in out
+
+
+def test_cli_builds_a_pattern_file_in_shards(tmp_path):
+    """build --shards saves a sharded bundle that run scans with the original ids."""
+    patterns = tmp_path / "patterns.txt"
+    patterns.write_text("error\nERR[0-9]+;, caseless\nhello, id=9\n", encoding="utf-8")
+    output = tmp_path / "hs.db"
+    target = tmp_path / "a.txt"
+    target.write_text("hello error Err12;\n", encoding="utf-8")
+
+    proc = subprocess.run([sys.executable, "main.py", "build", str(patterns), "-o", str(output),
+                           "--shards", "2", "--no-cache"], capture_output=True, text=True, check=False)
+    assert "Compiled 2 of 2 shards of 3 patterns" in proc.stdout, proc.stderr
+    assert ShardedEngine.is_sharded_file(str(output))
+
+    proc = subprocess.run([sys.executable, "main.py", "run", str(output), str(target)],
+                          capture_output=True, text=True, check=False)
+    assert proc.stdout.splitlines() == [
+        "Regex with ID: 9, filename: '%s', from: 0 end: 5, match: 'hello'" % target,
+        "Regex with ID: 0, filename: '%s', from: 6 end: 11, match: 'error'" % target,
+        "Regex with ID: 1, filename: '%s', from: 12 end: 18, match: 'Err12;'" % target,
+    ]
@@ -0,0 +1,65 @@
+import threading
+
+from file_reader import FileReader
+from prefetch_reader import PrefetchReader
+
+
+def test_reads_range_in_chunks(tmp_path):
+    """Offset and length are honoured, chunks come in file order."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(bytes(range(100)))
+
+    chunks = [bytes(c) for c in FileReader.chunks(str(p), chunk_size=16, offset=10, length=50,
+                                                  mode="prefetch", prefetch_depth=2)]
+
+    assert b"".join(chunks) == bytes(range(10, 60))
+    assert [len(c) for c in chunks] == [16, 16, 16, 2]
+
+
+def test_reuses_a_bounded_pool_of_buffers(tmp_path):
+    """At most depth + 2 buffers are ever used, however long the file is."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"x" * 1000)
+
+    with open(p, "rb") as f:
+        buffers = {id(chunk.obj) for chunk in PrefetchReader(f, 10, depth=2)}
+
+    assert len(buffers) <= 4
+
+
+def test_yields_new_bytes_without_reused_buffers(tmp_path):
+    """With reuse_buffers=False every chunk is its own bytes object, read once by the thread."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(bytes(range(100)))
+
+    chunks = list(FileReader.chunks(str(p), chunk_size=16, offset=10, length=50, mode="prefetch",
+                                    prefetch_depth=2, reuse_buffers=False))
+
+    assert all(type(chunk) is bytes for chunk in chunks)
+    assert b"".join(chunks) == bytes(range(10, 60))
+    assert [len(c) for c in chunks] == [16, 16, 16, 2]
+
+def test_stops_reader_thread_when_consumer_stops_early(tmp_path):
+    """Closing the chunk generator joins the background thread."""
+    p = tmp_path / "file.bin"
+    p.write_bytes(b"y" * 10000)
+
+    chunks = FileReader.chunks(str(p), chunk_size=10, mode="prefetch", prefetch_depth=1)
+    assert bytes(next(chunks)) == b"y" * 10
+    chunks.close()
+
+    assert not [t for t in threading.enumerate() if t.name == "prefetch-reader"]
+
+
+def test_read_errors_reach_the_consumer():
+    """An exception in the reader thread is raised from the iteration."""
+    class Broken:
+        def readinto(self, buffer):
+            raise OSError("disk on fire")
+
+    try:
+        list(PrefetchReader(Broken(), 8))
+    except OSError as e:
+        assert "disk on fire" in str(e)
+    else:
+        raise AssertionError("error was not raised")
@@ -0,0 +1,43 @@
+import pytest
+
+from engines import prefilter
+from engines.prefilter import Prefilter, required_factors
+from engines.python_engine import PythonEngine
+
+
+def test_required_factors():
+    """Every match contains one of the factors; patterns without a useful set give None."""
+    assert required_factors(rb"\d{3}-\d{3}-\d{4}") == {b"-"}
+    assert required_factors(b"(test|nokia)") == {b"test", b"nokia"}
+    assert required_factors(b"x+") == {b"x"}
+    assert required_factors(b"[ab]cd") == {b"cd"}
+    assert required_factors(rb"\w+") is None
+    assert required_factors(b"(?i)error") is None
+    assert required_factors(b"a?") is None
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_prefilter_checks_from_each_start(use_numpy):
+    """A requirement is met only by factors at or after its own start position."""
+    if use_numpy and prefilter.np is None:
+        pytest.skip("NumPy is not installed")
+    f = Prefilter([frozenset([b"abc"]), frozenset([b"x", b"y"]), None], use_numpy=use_numpy)
+
+    assert f.possible(b"..abc..y", [0, 0, 0]) == [True, True, True]
+    assert f.possible(b"..abc..y", [3, 0, 0]) == [False, True, True]
+    assert f.possible(memoryview(b"......."), [0, 0, 0]) == [False, False, True]
+
+
+def test_engine_skips_chunks_without_required_strings():
+    """Chunks that cannot match are skipped, matches are still all found."""
+    engine = PythonEngine()
+    engine.compile_patterns([b"ERROR", rb"\d{3}-\d{4}"])
+    found = []
+
+    engine.scan_stream([b"nothing here\n" * 10, b"ERROR 555-1234\n", b"quiet\n" * 10],
+                       lambda pattern_id, start, end, flags, context: found.append((pattern_id, start, end)))
+
+    assert sorted(found) == [(0, 130, 135), (1, 136, 144)]
+    stats = engine.prefilter_stats
+    assert stats['skipped_chunks'] >= 1
+    assert stats['skipped_pattern_scans'] >= 2
@@ -0,0 +1,99 @@
+import random
+
+from engines.literal_set import expand_literals
+from engines.pattern_width import can_match_newline, context_width
+from engines.python_engine import PythonEngine
+
+
+PATTERNS = ["test", "ERROR", r"\d{3}-\d{4}", "(test|nokia)", "(te|test)", "colou?r",
+            "a{1,3}?b", "x|xy|xyz", "[ab][cd]", "(a|ab)(c|bcd)"]
+
+
+def _events(engine, data):
+    found = []
+    engine.scan(data, lambda pattern_id, start, end, flags, context: found.append((pattern_id, start, end)))
+    return sorted(found)
+
+
+def test_expand_literals_keeps_regex_priority():
+    """Strings come in the order `re` tries them, patterns that are not finite give None."""
+    assert expand_literals("ERROR") == ["ERROR"]
+    assert expand_literals("colou?r") == ["colour", "color"]
+    assert expand_literals("(te|test)") == ["te", "test"]
+    assert expand_literals("[Ee]r{1,2}?") == ["Er", "Err", "er", "err"]
+    assert expand_literals(r"\d+") is None
+    assert expand_literals("(?i)error") is None
+    assert expand_literals("a?") is None  # can match the empty string
+
+
+def test_combined_mode_reports_the_same_matches():
+    """Matching literal patterns together gives exactly the per-pattern matches."""
+    combined = PythonEngine()
+    separate = PythonEngine(combine=False)
+    for engine in (combined, separate):
+        engine.compile_patterns([p.encode() for p in PATTERNS])
+    assert combined.literal_matcher is not None
+
+    rng = random.Random(0)
+    for _ in range(200):
+        text = "".join(rng.choice("abcdxyztesnokiaERRO colur0123-") for _ in range(rng.randint(0, 200)))
+        assert _events(combined, text.encode()) == _events(separate, text.encode()), text
+
+
+def test_pattern_context_and_newlines():
+    """Anchors and lookarounds widen the context, only some patterns can cross lines."""
+    assert context_width(r"\bfoo$") == (1, 2)
+    assert context_width("(?<=xy)z(?=abc)") == (2, 3)
+    assert context_width("a(?=b+)")[1] is None
+    assert not can_match_newline(r"a.*b")
+    assert can_match_newline(r"(?s)a.*b")
+    assert can_match_newline(r"a\s+b")
+    assert can_match_newline("[^x]+")
+
+
+def test_stream_matches_block_scan_for_any_chunking():
+    """Matches spanning chunk boundaries are found once, with block-scan offsets."""
+    patterns = ["test", r"\d{3}-\d{4}", r"\bab\b", "ab$", "x+", "a.*b", r"(?s)a.*b", "(?<=ab)c", "é+"]
+    engine = PythonEngine()
+    engine.compile_patterns([p.encode() for p in patterns])
+
+    rng = random.Random(1)
+    for _ in range(200):
+        data = "".join(rng.choice(["a", "b", "c", "x", " ", "\n", "é", "test", "123-4567"])
+                       for _ in range(rng.randint(0, 80))).encode()
+        cuts = sorted(rng.sample(range(len(data) + 1), min(len(data) + 1, 6)))
+        chunks = [data[i:j] for i, j in zip([0] + cuts, cuts + [len(data)])]
+
+        streamed = []
+        engine.scan_stream(chunks, lambda pattern_id, start, end, flags, context: streamed.append((pattern_id, start, end)))
+        assert sorted(streamed) == _events(engine, data), chunks
+
+
+def test_stream_keeps_only_what_patterns_need(monkeypatch):
+    """Bounded patterns keep their width between chunks, line patterns the current line."""
+    engine = PythonEngine()
+    engine.compile_patterns([b"abc", b"x+"])
+    kept = []
+    original = PythonEngine._final_upto
+
+    def final_upto(self, searcher, text):
+        kept.append(len(text))
+        return original(self, searcher, text)
+
+    monkeypatch.setattr(PythonEngine, "_final_upto", final_upto)
+    engine.scan_stream([b"y" * 1000 + b"\n", b"y" * 1000], lambda *args: None)
+
+    # the second chunk is scanned with a few characters of the first one only
+    assert kept[-1] < 1010
+
+
+def test_offsets_are_byte_offsets():
+    """Non-ASCII and binary data do not shift offsets, memoryviews are scanned in place."""
+    engine = PythonEngine()
+    engine.compile_patterns([b"test", rb"\d+"])
+    data = "zażółć test".encode() + b"\xff\xfe 42"
+
+    found = _events(engine, memoryview(bytearray(data)))
+
+    assert found == [(0, 11, 15), (1, 18, 20), (1, 19, 20)]
+    assert data[11:15] == b"test"
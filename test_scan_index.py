@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from engines.hs_engine import HyperscanEngine
+from engines.python_engine import PythonEngine
+from file_scanner import FileScanner
+from scan_index import ScanIndex
+
+
+def _scanner(tmp_path, engine, patterns=("hello", "[0-9]+-[0-9]+")):
+    scanner = FileScanner(engine, index=ScanIndex.load(str(tmp_path / "index.json")))
+    scanner.compile_patterns(list(patterns))
+    return scanner
+
+
+def _found(results):
+    return [(r["pattern_id"], r["start"], r["end"], r["match"]) for r in results]
+
+
+@pytest.mark.parametrize("engine_cls", [HyperscanEngine, PythonEngine])
+def test_unchanged_files_are_skipped_and_appends_resume(tmp_path, engine_cls):
+    """A second scan skips unchanged files; an appended file reports only new matches, also across the old end."""
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    log = tree / "app.log"
+    log.write_bytes(b"hello world 12-")
+
+    scanner = _scanner(tmp_path, engine_cls())
+    assert _found(scanner.scan_tree(tree)) == [(0, 0, 5, "hello")]
+    assert scanner.scan_tree(tree) == []
+
+    with open(log, "ab") as f:
+        f.write(b"34 hello")
+    found = _found(scanner.scan_tree(tree))
+
+    assert (0, 0, 5, "hello") not in found
+    assert (1, 12, 17, "12-34") in found
+    assert (0, 18, 23, "hello") in found
+
+
+def test_truncated_or_rewritten_files_are_scanned_whole(tmp_path):
+    """A file that shrank, or grew with different old content, is scanned from the start."""
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    log = tree / "app.log"
+    log.write_bytes(b"hello hello")
+
+    scanner = _scanner(tmp_path, HyperscanEngine())
+    scanner.scan_tree(tree)
+
+    log.write_bytes(b"hello")
+    assert _found(scanner.scan_tree(tree)) == [(0, 0, 5, "hello")]
+
+    log.write_bytes(b"HELLO hello")
+    assert _found(scanner.scan_tree(tree)) == [(0, 6, 11, "hello")]
+
+
+def test_other_patterns_rescan_and_index_persists(tmp_path):
+    """Entries are only valid for the database they were scanned with, and survive save/load."""
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "a.txt").write_bytes(b"hello 1-2")
+
+    scanner = _scanner(tmp_path, HyperscanEngine())
+    scanner.scan_tree(tree)
+    scanner.index.save()
+
+    again = _scanner(tmp_path, HyperscanEngine())
+    assert again.scan_tree(tree) == []
+
+    other = _scanner(tmp_path, HyperscanEngine(), patterns=("hello",))
+    assert _found(other.scan_tree(tree)) == [(0, 0, 5, "hello")]
+
+
+def test_renamed_file_keeps_its_entry(tmp_path):
+    """A rotated log is recognised by its inode, deleted files leave the index."""
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "app.log").write_bytes(b"hello")
+
+    scanner = _scanner(tmp_path, HyperscanEngine())
+    scanner.scan_tree(tree)
+
+    os.rename(tree / "app.log", tree / "app.log.1")
+    assert scanner.scan_tree(tree) == []
+    assert list(scanner.index.entries) == [str(tree / "app.log.1")]
+
+
+@pytest.mark.parametrize("engine_cls", [HyperscanEngine, PythonEngine])
+def test_appends_with_unbounded_patterns_rescan_a_bounded_tail(tmp_path, monkeypatch, engine_cls, capsys):
+    """Unbounded patterns resume at the last newline if none can match one, else at most MAX_CARRY bytes back."""
+    overlaps = []
+    scan_range = FileScanner.scan_range
+
+    def spy(self, filename, start, end, overlap, *args, **kwargs):
+        overlaps.append(overlap)
+        return scan_range(self, filename, start, end, overlap, *args, **kwargs)
+
+    monkeypatch.setattr(FileScanner, "scan_range", spy)
+    log = tmp_path / "app.log"
+    log.write_bytes(b"x" * 5000 + b"\nab 12-34")
+
+    scanner = _scanner(tmp_path, engine_cls(), patterns=["[0-9]+-[0-9]+"])
+    assert (0, 5004, 5009, "12-34") in _found(scanner.scan_appended(str(log), 5007, 5009))
+    assert overlaps == [6]
+
+    monkeypatch.setattr(PythonEngine, "MAX_CARRY", 16)
+    scanner = _scanner(tmp_path, HyperscanEngine(), patterns=["a[^y]+4"])
+    assert _found(scanner.scan_appended(str(log), 5007, 5009)) == [(0, 5001, 5009, "ab 12-34")]
+    assert overlaps[1:] == [16]
+    assert "only the last 16 bytes" in capsys.readouterr().out
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+
+from tree_walker import TreeWalker
+
+
+def _tree(tmp_path):
+    files = {
+        "a.log": b"error\n",
+        "b.txt": b"error here\n",
+        "image.bin": b"\x89PNG\0\0error",
+        ".hidden.log": b"error\n",
+        ".git/objects/ab": b"error\n",
+        "src/main.py": b"error = 1\n",
+        "src/big.log": b"error\n" * 1000,
+        "node_modules/lib/x.log": b"error\n",
+        "logs/2024/app.log": b"error\n",
+    }
+    for name, data in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return tmp_path
+
+
+def _walk(root, **options):
+    return sorted(os.path.relpath(path, root) for path in TreeWalker(**options).walk(root))
+
+
+def test_without_filters_lists_what_os_walk_lists(tmp_path):
+    """All files are listed, breadth first and in the same order every time."""
+    root = _tree(tmp_path)
+    expected = sorted(os.path.relpath(os.path.join(dirpath, name), root)
+                      for dirpath, _, names in os.walk(root) for name in names)
+
+    assert _walk(root) == expected
+    paths = list(TreeWalker(threads=4).walk(root))
+    assert paths == list(TreeWalker(threads=4).walk(root))
+    assert [path.count(os.sep) for path in paths] == sorted(path.count(os.sep) for path in paths)
+
+
+def test_filters(tmp_path):
+    """Globs, extensions, sizes and hidden/VCS/binary skipping select the files."""
+    root = _tree(tmp_path)
+
+    assert _walk(root, skip_hidden=True, exclude=["node_modules"], skip_binary=True) == [
+        "a.log", "b.txt", os.path.join("logs", "2024", "app.log"),
+        os.path.join("src", "big.log"), os.path.join("src", "main.py")]
+    assert ".hidden.log" in _walk(root, skip_vcs=True)
+    assert not any(path.startswith(".git") for path in _walk(root, skip_vcs=True))
+    assert _walk(root, include=["logs/*/*.log", "*.txt"]) == ["b.txt", os.path.join("logs", "2024", "app.log")]
+    assert _walk(root, extensions=["py", ".TXT"]) == ["b.txt", os.path.join("src", "main.py")]
+    assert "image.bin" not in _walk(root, exclude_extensions=["bin"])
+    assert _walk(root, min_size=100) == [os.path.join("src", "big.log")]
+    assert _walk(root, max_size=6, extensions=["log"], skip_vcs=True) == [
+        ".hidden.log", "a.log", os.path.join("logs", "2024", "app.log"),
+        os.path.join("node_modules", "lib", "x.log")]
+
+
+def test_binary_sniff_runs_after_the_cheap_filters(tmp_path, monkeypatch):
+    """Only files that pass the name and size filters are opened for the binary sniff."""
+    root = _tree(tmp_path)
+    sniffed = []
+    monkeypatch.setattr(TreeWalker, "is_binary", staticmethod(lambda path: sniffed.append(path) or False))
+
+    _walk(root, extensions=["txt"], skip_binary=True)
+    assert sniffed == [str(root / "b.txt")]
+
+
+def test_symlink_loops_are_listed_once(tmp_path):
+    """Following symbolic links does not descend into the same directory twice."""
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "a.txt").write_text("a", encoding="utf-8")
+    os.symlink(tmp_path, tmp_path / "dir" / "loop")
+
+    paths = _walk(tmp_path, follow_symlinks=True)
+    assert paths == [os.path.join("dir", "a.txt")]
+
+
+def test_cli_filters_the_tree(tmp_path):
+    """run with filter options scans only the selected files."""
+    root = _tree(tmp_path / "tree")
+    regex_file = tmp_path / "regexes.txt"
+    regex_file.write_text("error\n", encoding="utf-8")
+
+    for mode in ([], ["--pool"], ["--threads", "2"]):
+        proc = subprocess.run(
+            [sys.executable, "main.py", "run", str(regex_file), str(root), "--files-with-matches",
+             "--skip-vcs", "--skip-binary", "--exclude", "node_modules", "--ext", "log", "bin"] + mode,
+            capture_output=True, text=True, check=False,
+        )
+        assert proc.returncode == 0, proc.stderr
+        assert sorted(proc.stdout.splitlines()) == sorted(str(root / name) for name in (
+            ".hidden.log", "a.log", "logs/2024/app.log", "src/big.log"))
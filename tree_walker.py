@@ -0,0 +1,153 @@
+import fnmatch
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+def _globs(patterns: Optional[Iterable[str]]):
+    """(regex matching any of the glob patterns, whether one of them holds a "/"), or None without patterns"""
+    patterns = list(patterns or [])
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns)), \
+        any("/" in pattern for pattern in patterns)
+
+
+def _extensions(extensions: Optional[Iterable[str]]):
+    if not extensions:
+        return None
+    return tuple("." + extension.lstrip(".").lower() for extension in extensions)
+
+
+class TreeWalker:
+    """
+    Lists the files of a directory tree to scan, filtered before any of
+    them is opened for scanning.
+
+    Directories are listed with os.scandir by a pool of threads, every
+    subdirectory as its own task, so listing a large tree (or one on a
+    network file system) is not one directory at a time. Files are still
+    returned in a fixed order: directory by directory, breadth first, as
+    they were queued. Name filters (hidden and VCS directories, globs,
+    extensions) are checked first, then the size from the directory
+    entry's stat, and the binary sniff, which reads the first SNIFF_BYTES
+    bytes of a file, last.
+
+    Glob patterns are matched against the file name, patterns containing
+    a "/" against the path relative to the root. Exclude globs also prune
+    directories (e.g. `node_modules`).
+    """
+    VCS_DIRS = frozenset({".git", ".hg", ".svn", ".bzr", "_darcs", "CVS"})
+    SNIFF_BYTES = 8192
+
+    def __init__(self, include: Iterable[str] = None, exclude: Iterable[str] = None,
+                 extensions: Iterable[str] = None, exclude_extensions: Iterable[str] = None,
+                 min_size: int = None, max_size: int = None, skip_hidden: bool = False,
+                 skip_vcs: bool = False, skip_binary: bool = False, follow_symlinks: bool = False,
+                 threads: int = None):
+        """
+        Args:
+            include: glob patterns, only files matching one of them are listed
+            exclude: glob patterns of files and directories that are skipped
+            extensions: only files with one of these extensions (e.g. "log")
+            exclude_extensions: files with these extensions are skipped
+            min_size: files smaller than this many bytes are skipped
+            max_size: files larger than this many bytes are skipped
+            skip_hidden: skip files and directories whose name starts with "."
+            skip_vcs: skip version control directories (VCS_DIRS)
+            skip_binary: skip files with a NUL byte in their first SNIFF_BYTES bytes
+            follow_symlinks: descend into symbolic links to directories
+            threads: threads listing directories (default: ThreadPoolExecutor's)
+        """
+        self.include = _globs(include)
+        self.exclude = _globs(exclude)
+        self.extensions = _extensions(extensions)
+        self.exclude_extensions = _extensions(exclude_extensions)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.skip_hidden = skip_hidden
+        self.skip_vcs = skip_vcs
+        self.skip_binary = skip_binary
+        self.follow_symlinks = follow_symlinks
+        self.threads = threads
+
+    def walk(self, root) -> Iterator[str]:
+        """Paths of the files under `root` that pass the filters"""
+        root = os.fspath(root)
+        visited = {os.path.realpath(root)}
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="walker") as pool:
+            pending = deque([pool.submit(self._list, root, root)])
+            while pending:
+                files, directories = pending.popleft().result()
+                for directory in directories:
+                    if self.follow_symlinks:
+                        # a symbolic link back up the tree would be listed forever
+                        real = os.path.realpath(directory)
+                        if real in visited:
+                            continue
+                        visited.add(real)
+                    pending.append(pool.submit(self._list, directory, root))
+                yield from files
+
+    def _list(self, directory: str, root: str) -> Tuple[List[str], List[str]]:
+        """Files to scan and subdirectories to descend into of one directory"""
+        files, directories = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            if self._keep_directory(entry, root):
+                                directories.append(entry.path)
+                        elif entry.is_file() and self._keep_file(entry, root):
+                            files.append(entry.path)
+                    except OSError as e:
+                        print(f"[scan_tree] Error with file {entry.path}: {e}")
+        except OSError as e:
+            print(f"[scan_tree] Error with directory {directory}: {e}")
+        return files, directories
+
+    @staticmethod
+    def _matches(globs, entry: os.DirEntry, root: str) -> bool:
+        regex, by_path = globs
+        if regex.match(entry.name):
+            return True
+        if by_path:
+            return regex.match(os.path.relpath(entry.path, root).replace(os.sep, "/")) is not None
+        return False
+
+    def _keep_directory(self, entry: os.DirEntry, root: str) -> bool:
+        name = entry.name
+        if self.skip_hidden and name.startswith("."):
+            return False
+        if self.skip_vcs and name in TreeWalker.VCS_DIRS:
+            return False
+        return self.exclude is None or not self._matches(self.exclude, entry, root)
+
+    def _keep_file(self, entry: os.DirEntry, root: str) -> bool:
+        name = entry.name
+        if self.skip_hidden and name.startswith("."):
+            return False
+        if self.extensions is not None and not name.lower().endswith(self.extensions):
+            return False
+        if self.exclude_extensions is not None and name.lower().endswith(self.exclude_extensions):
+            return False
+        if self.include is not None and not self._matches(self.include, entry, root):
+            return False
+        if self.exclude is not None and self._matches(self.exclude, entry, root):
+            return False
+        if self.min_size is not None or self.max_size is not None:
+            size = entry.stat().st_size
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        return not (self.skip_binary and self.is_binary(entry.path))
+
+    @staticmethod
+    def is_binary(path: str) -> bool:
+        """Whether the first SNIFF_BYTES bytes of a file contain a NUL byte"""
+        with open(path, "rb") as f:
+            return b"\0" in f.read(TreeWalker.SNIFF_BYTES)